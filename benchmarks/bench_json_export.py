@@ -0,0 +1,93 @@
+"""
+Benchmark de exportación JSON: array indentado (json.dump) frente a NDJSON (orjson)
+Uso: python -m benchmarks.bench_json_export [--size 200000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+from controllers.data_controller import DataController
+
+CUISINES = ['Italiana', 'Mexicana', 'China', 'Japonesa', 'Comida Rápida', 'Pizza', 'Café', 'General', 'Bar']
+
+def iter_synthetic_restaurants(size: int, seed: int = 42) -> Iterator[Dict[str, Any]]:
+    """Genera uno a uno restaurantes sintéticos con la forma de Restaurant.to_dict()"""
+    rng = random.Random(seed)
+    base_time = datetime(2024, 1, 1)
+    
+    for i in range(size):
+        postal_code = f"{28000 + rng.randint(1, 50):05d}"
+        yield {
+            'name': f"Restaurante {i}",
+            'address': f"Calle {rng.randint(1, 500)}, {postal_code} Madrid, España",
+            'postal_code': postal_code,
+            'phone': f"+34 91 {rng.randint(100, 999)} {rng.randint(1000, 9999)}" if rng.random() < 0.8 else None,
+            'rating': round(rng.uniform(1, 5), 1) if rng.random() < 0.9 else None,
+            'review_count': rng.randint(0, 5000),
+            'cuisine_type': rng.choice(CUISINES),
+            'business_hours': {f"day_{d}": f"Día {d}: 12:00–16:00, 20:00–23:30" for d in range(7)},
+            'website': f"https://restaurante{i}.example.com" if rng.random() < 0.5 else None,
+            'latitude': 40.4 + rng.uniform(-0.1, 0.1),
+            'longitude': -3.7 + rng.uniform(-0.1, 0.1),
+            'place_id': f"ChIJ{i:012d}",
+            'postal_codes': [postal_code],
+            'scraped_at': base_time + timedelta(seconds=i),
+        }
+
+def synthetic_restaurants(size: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Genera restaurantes sintéticos con la forma de Restaurant.to_dict()"""
+    return list(iter_synthetic_restaurants(size, seed))
+
+def _timed(label: str, func, path: Path) -> Dict[str, Any]:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    return {'modo': label, 'segundos': elapsed, 'mb': path.stat().st_size / 1e6}
+
+def run(size: int) -> List[Dict[str, Any]]:
+    """Ejecuta cada modo de exportación sobre el mismo dataset en un directorio temporal"""
+    restaurants = synthetic_restaurants(size)
+    controller = DataController()
+    results = []
+    cwd = os.getcwd()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            json_dir = Path("data/json")
+            results.append(_timed("json indent=2 (actual)", lambda: controller._export_to_json(restaurants),
+                                  json_dir / "restaurantes_completo.json"))
+            
+            for compression, suffix in [(None, ''), ('gzip', '.gz'), ('zstd', '.zst')]:
+                controller.settings.JSON_COMPRESSION = compression
+                try:
+                    results.append(_timed(f"ndjson {compression or 'sin compresión'}",
+                                          lambda: controller._export_to_ndjson(restaurants),
+                                          json_dir / f"restaurantes_completo.ndjson{suffix}"))
+                except ImportError as e:
+                    print(f"Omitido ndjson {compression}: {e}")
+        finally:
+            os.chdir(cwd)
+    
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=200000, help="Número de restaurantes sintéticos")
+    args = parser.parse_args()
+    
+    results = run(args.size)
+    baseline = results[0]['segundos']
+    
+    print(f"\n📊 Exportación JSON de {args.size} restaurantes")
+    print(f"{'Modo':<28}{'Segundos':>10}{'MB':>10}{'Speedup':>10}")
+    for result in results:
+        print(f"{result['modo']:<28}{result['segundos']:>10.2f}{result['mb']:>10.1f}{baseline / result['segundos']:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
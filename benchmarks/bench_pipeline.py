@@ -0,0 +1,313 @@
+"""
+Benchmark de extremo a extremo del pipeline de scraping
+Etapas: búsqueda contra el Google Maps falso (benchmarks.fake_maps_server), construcción de Restaurant,
+to_dict, lote columnar, guardado en MongoDB y las exportaciones CSV, JSON y Parquet de DataController
+Por etapa mide tiempo, throughput y memoria pico (tracemalloc, en una segunda pasada para no falsear
+los tiempos) y la búsqueda además cuenta las llamadas a la API por restaurante
+Uso: python -m benchmarks.bench_pipeline [--size 1k|100k|1m] [--save-baseline] [--tolerance 0.25]
+     [--output resultados.json] [--no-memory]
+Sale con código 1 si alguna métrica empeora más que la tolerancia respecto a la línea base guardada
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import googlemaps
+import pymongo
+from benchmarks.bench_json_export import iter_synthetic_restaurants
+from benchmarks.fake_maps_server import FakeMapsServer, SyntheticCity
+from config.settings import Settings
+from controllers.data_controller import DataController, pa
+from controllers.rate_limiter import RateLimiter
+from controllers.scraper_controller import GoogleMapsClient
+from models.batch import RestaurantBatch
+from models.database import DatabaseManager
+from models.restaurant import Restaurant
+
+# Restaurantes del dataset sintético; la búsqueda va por HTTP (cliente y servidor en este proceso) y se
+# mide con una ciudad y unos códigos postales más pequeños
+PRESETS = {
+    '1k': {'restaurants': 1000, 'city': 300, 'postal_codes': 2},
+    '100k': {'restaurants': 100000, 'city': 600, 'postal_codes': 3},
+    '1m': {'restaurants': 1000000, 'city': 1000, 'postal_codes': 4},
+}
+BASELINE_DIR = Path(__file__).parent / "baselines"
+BENCHMARK_DATABASE = 'restaurantes_benchmark'
+# Sin cuota real: el rate limiter no debe ser el cuello de botella que se mide
+UNLIMITED_RATES = {'geocode': 10000, 'places_nearby': 10000, 'place': 10000}
+CLIENT_QPS = 10000
+API_KEY = "AIzaBenchmarkKey"
+# Retraso del next_page_token del servidor falso (el real es ~2 s y haría la búsqueda pura espera)
+PAGE_TOKEN_DELAY = 0.05
+# Métricas comparadas con la línea base (más es peor)
+COMPARED_METRICS = ('seconds', 'peak_mb', 'api_calls_per_restaurant')
+# Diferencias absolutas por debajo de las cuales no se considera regresión (ruido en etapas muy cortas)
+NOISE_FLOOR = {'seconds': 0.05, 'peak_mb': 1.0, 'api_calls_per_restaurant': 0.0}
+
+@contextlib.contextmanager
+def _override_settings(**values):
+    """Cambia temporalmente atributos de Settings (get_settings() crea instancias que los leen)"""
+    previous = {name: getattr(Settings, name) for name in values}
+    for name, value in values.items():
+        setattr(Settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(Settings, name, value)
+
+def _measure(func: Callable[[], Any], memory: bool) -> Dict[str, Any]:
+    """Ejecuta func cronometrada y, si se pide, otra vez bajo tracemalloc para la memoria pico"""
+    start = time.perf_counter()
+    result = func()
+    metrics = {'seconds': time.perf_counter() - start}
+    
+    if memory:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        metrics['peak_mb'] = peak / 1e6
+    
+    return {'result': result, **metrics}
+
+def _stage(measured: Dict[str, Any], restaurants: int, **extra) -> Dict[str, Any]:
+    stage = {key: value for key, value in measured.items() if key != 'result'}
+    stage['restaurants'] = restaurants
+    stage['restaurants_per_s'] = restaurants / stage['seconds'] if stage['seconds'] else None
+    stage.update(extra)
+    return stage
+
+def _consume(iterable):
+    deque(iterable, maxlen=0)
+
+def bench_search(postal_codes: int, city_size: int = 1000, latency: float = 0.0,
+                 memory: bool = True) -> Dict[str, Any]:
+    """
+    search_restaurants_by_postal_code de varios códigos postales en paralelo (MAX_WORKERS), por HTTP
+    contra el servidor falso y sin caches, con el DETAILS_MODE configurado
+    """
+    city = SyntheticCity(city_size)
+    codes = [f"{28001 + i:05d}" for i in range(postal_codes)]
+    
+    with FakeMapsServer(city, latency=latency, page_token_delay=PAGE_TOKEN_DELAY) as server, \
+            _override_settings(GOOGLE_MAPS_BASE_URL=server.base_url, PAGE_TOKEN_POLL_INTERVAL=PAGE_TOKEN_DELAY,
+                               GEOCODE_CACHE_PATH='', PLACE_DETAILS_CACHE_PATH=''):
+        def search():
+            # Cliente nuevo en cada pasada: sin lugares vistos ni geocoding en memoria
+            server.stats.clear()
+            with GoogleMapsClient(API_KEY, rate_limiter=RateLimiter(UNLIMITED_RATES, burst=50)) as scraper:
+                # googlemaps limita por su cuenta a 60 peticiones/s: se mediría ese límite y no el pipeline
+                scraper.client = googlemaps.Client(key=API_KEY, retry_over_query_limit=False,
+                                                   base_url=server.base_url, queries_per_second=CLIENT_QPS,
+                                                   queries_per_minute=CLIENT_QPS * 60)
+                with ThreadPoolExecutor(max_workers=Settings.MAX_WORKERS) as executor:
+                    found = sum(len(r) for r in executor.map(scraper.search_restaurants_by_postal_code, codes))
+            return found, dict(server.stats)
+        
+        measured = _measure(search, memory)
+    
+    found, stats = measured['result']
+    calls = {endpoint: stats.get(f"{endpoint}.requests", 0) for endpoint in FakeMapsServer.ENDPOINTS.values()}
+    return _stage(measured, found, postal_codes=postal_codes, api_calls=calls,
+                  api_calls_per_restaurant=sum(calls.values()) / found if found else None,
+                  token_not_ready=stats.get('places_nearby.token_not_ready', 0))
+
+def _mongodb_manager(uri: str) -> Optional[DatabaseManager]:
+    """DatabaseManager sobre una base de datos desechable, o None si MongoDB no responde"""
+    client = pymongo.MongoClient(uri, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except pymongo.errors.PyMongoError:
+        return None
+    finally:
+        client.close()
+    
+    manager = DatabaseManager()
+    manager.settings.MONGODB_URI = uri
+    manager.settings.MONGODB_DATABASE = BENCHMARK_DATABASE
+    return manager
+
+def bench_mongodb(batch: RestaurantBatch, uri: str, memory: bool) -> Dict[str, Any]:
+    """
+    save_to_mongodb del lote en una base de datos vacía; sin MongoDB se mide solo la parte del
+    cliente (documentos y upserts) en la etapa 'mongodb_upserts'
+    """
+    manager = _mongodb_manager(uri)
+    if manager is None:
+        offline = DatabaseManager()
+        build_upserts = lambda: _consume(offline._build_upsert(offline._prepare_document(r)) for r in batch.iter_dicts())
+        return 'mongodb_upserts', _stage(_measure(build_upserts, memory), len(batch))
+    
+    def save():
+        # Base de datos vacía en cada pasada: todo son inserciones, como en una primera ejecución
+        manager.connect_mongodb()
+        manager.mongo_client.drop_database(BENCHMARK_DATABASE)
+        manager._ensure_indexes(manager._collection())
+        return manager.save_to_mongodb(batch.iter_dicts())
+    
+    try:
+        return 'save_to_mongodb', _stage(_measure(save, memory), len(batch))
+    finally:
+        manager.mongo_client.drop_database(BENCHMARK_DATABASE)
+        manager.close_connections()
+
+def bench_dataset(size: int, mongodb_uri: str, memory: bool = True) -> Dict[str, Dict[str, Any]]:
+    """Etapas que no dependen de la API sobre `size` restaurantes sintéticos"""
+    stages = {}
+    
+    measured = _measure(lambda: [Restaurant(**record) for record in iter_synthetic_restaurants(size)], memory)
+    restaurants = measured['result']
+    stages['restaurant_model'] = _stage(measured, size)
+    
+    stages['to_dict'] = _stage(_measure(lambda: _consume(r.to_dict() for r in restaurants), memory), size)
+    
+    measured = _measure(lambda: RestaurantBatch.from_restaurants(restaurants), memory)
+    batch = measured['result']
+    stages['batch'] = _stage(measured, size)
+    del restaurants, measured
+    
+    name, stage = bench_mongodb(batch, mongodb_uri, memory)
+    stages[name] = stage
+    
+    postal_codes = batch.categorical('postal_code')[1]
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        controller = DataController(output_dir=tmp)
+        stages['export_csv'] = _stage(_measure(lambda: controller._export_to_csv(batch, postal_codes), memory), size)
+        
+        # El mismo formato que process_and_save_data según JSON_EXPORT_FORMAT
+        if controller.settings.JSON_EXPORT_FORMAT == 'ndjson':
+            export_json = lambda: controller._export_to_ndjson(batch.iter_dicts())
+        else:
+            export_json = lambda: controller._export_to_json(list(batch.iter_dicts()))
+        stages['export_json'] = _stage(_measure(export_json, memory), size,
+                                       format=controller.settings.JSON_EXPORT_FORMAT)
+        
+        if pa is not None:
+            stages['export_parquet'] = _stage(_measure(lambda: controller._export_to_parquet(batch), memory), size)
+    
+    return stages
+
+def run_suite(restaurants: int, postal_codes: int, city_size: int = 1000, latency: float = 0.0,
+              mongodb_uri: str = 'mongodb://localhost:27017', memory: bool = True) -> Dict[str, Any]:
+    """Ejecuta todas las etapas y devuelve el resultado con el entorno en el que se midió"""
+    started = time.perf_counter()
+    stages = {'search': bench_search(postal_codes, city_size, latency, memory)}
+    stages.update(bench_dataset(restaurants, mongodb_uri, memory))
+    
+    return {
+        'restaurants': restaurants,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'details_mode': Settings.DETAILS_MODE,
+            'max_workers': Settings.MAX_WORKERS,
+        },
+        'stages': stages,
+        'total_seconds': time.perf_counter() - started,
+    }
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any],
+                        tolerance: float = 0.25) -> List[Dict[str, Any]]:
+    """
+    Métricas que empeoran más que la tolerancia relativa respecto a la línea base
+    Solo se comparan etapas y métricas presentes en ambas (p.ej. MongoDB puede no estar disponible)
+    """
+    regressions = []
+    for name, stage in results['stages'].items():
+        reference = baseline.get('stages', {}).get(name)
+        if reference is None:
+            continue
+        for metric in COMPARED_METRICS:
+            current, previous = stage.get(metric), reference.get(metric)
+            if current is None or not previous:
+                continue
+            if current > previous * (1 + tolerance) and current - previous > NOISE_FLOOR[metric]:
+                regressions.append({'stage': name, 'metric': metric, 'baseline': previous, 'current': current,
+                                    'change': current / previous - 1})
+    return regressions
+
+def baseline_path(preset: str) -> Path:
+    return BASELINE_DIR / f"pipeline_{preset}.json"
+
+def _print_results(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]):
+    print(f"\n📊 Pipeline con {results['restaurants']} restaurantes sintéticos "
+          f"(búsqueda: {results['stages']['search']['postal_codes']} códigos postales)")
+    print(f"{'Etapa':<18}{'Segundos':>10}{'Rest./s':>12}{'MB pico':>10}{'Base (s)':>10}")
+    for name, stage in results['stages'].items():
+        reference = (baseline or {}).get('stages', {}).get(name, {})
+        peak = f"{stage['peak_mb']:.1f}" if 'peak_mb' in stage else '-'
+        previous = f"{reference['seconds']:.2f}" if 'seconds' in reference else '-'
+        print(f"{name:<18}{stage['seconds']:>10.2f}{stage['restaurants_per_s'] or 0:>12.0f}{peak:>10}{previous:>10}")
+    
+    search = results['stages']['search']
+    print(f"\nLlamadas a la API por restaurante: {search['api_calls_per_restaurant'] or 0:.2f} {search['api_calls']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', choices=PRESETS, default='1k', help="Tamaño del dataset sintético")
+    parser.add_argument('--postal-codes', type=int, help="Códigos postales de la búsqueda (por defecto según --size)")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Latencia media del servidor falso")
+    parser.add_argument('--mongodb-uri', default=os.getenv('MONGODB_TEST_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--no-memory', action='store_true', help="No medir la memoria pico (la mitad de tiempo)")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Empeoramiento relativo permitido")
+    parser.add_argument('--save-baseline', action='store_true', help="Guarda el resultado como nueva línea base")
+    parser.add_argument('--output', help="Fichero JSON donde guardar el resultado")
+    args = parser.parse_args()
+    
+    preset = PRESETS[args.size]
+    results = run_suite(preset['restaurants'], args.postal_codes or preset['postal_codes'], preset['city'],
+                        latency=args.latency_ms / 1000, mongodb_uri=args.mongodb_uri, memory=not args.no_memory)
+    
+    path = baseline_path(args.size)
+    baseline = json.loads(path.read_text(encoding='utf-8')) if path.exists() else None
+    _print_results(results, baseline)
+    
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding='utf-8')
+    
+    if args.save_baseline:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2) + "\n", encoding='utf-8')
+        print(f"\n💾 Línea base guardada en {path}")
+        if 'save_to_mongodb' not in results['stages']:
+            print("⚠️ Sin MongoDB la línea base no incluye save_to_mongodb (arráncalo con "
+                  "`docker compose up -d mongodb` y vuelve a guardarla)")
+        return
+    
+    if baseline is None:
+        print(f"\nSin línea base en {path} (crea una con --save-baseline)")
+        return
+    
+    if baseline.get('environment') != results['environment']:
+        print("\n⚠️ La línea base se midió en otro entorno: los tiempos no son comparables del todo")
+    unmeasured = [name for name in results['stages'] if name not in baseline.get('stages', {})]
+    if unmeasured:
+        print(f"\n⚠️ Sin línea base para {', '.join(unmeasured)}: no se comparan")
+    
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regresiones (tolerancia {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"   {regression['stage']}.{regression['metric']}: {regression['baseline']:.3f} -> "
+                  f"{regression['current']:.3f} (+{regression['change']:.0%})")
+        sys.exit(1)
+    
+    print(f"\n✅ Sin regresiones respecto a la línea base (tolerancia {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark de memoria del modelo Restaurant: dataclass con __dict__ frente a la versión compacta
+Uso: python -m benchmarks.bench_restaurant_memory [--size 100000]
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from benchmarks.bench_json_export import synthetic_restaurants
+from models.restaurant import Restaurant
+
+@dataclass
+class LegacyRestaurant:
+    """Restaurant tal y como era antes: dataclass con __dict__ y horarios en un dict por día"""
+    name: str
+    address: str
+    postal_code: str
+    phone: Optional[str] = None
+    rating: Optional[float] = None
+    review_count: Optional[int] = None
+    cuisine_type: Optional[str] = None
+    business_hours: Optional[Dict[str, str]] = None
+    website: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    place_id: Optional[str] = None
+    postal_codes: Optional[List[str]] = None
+    scraped_at: datetime = None
+
+def api_like_lines(size: int) -> List[str]:
+    """Restaurantes sintéticos serializados, para que cada objeto se construya con strings propios como desde la API"""
+    return [json.dumps(record, default=datetime.isoformat, ensure_ascii=False)
+            for record in synthetic_restaurants(size)]
+
+def _parse(line: str) -> Dict[str, Any]:
+    record = json.loads(line)
+    record['scraped_at'] = datetime.fromisoformat(record['scraped_at'])
+    return record
+
+def _measure(label: str, build, lines: List[str]) -> Dict[str, Any]:
+    """Memoria que siguen ocupando los objetos construidos (los diccionarios intermedios se liberan)"""
+    gc.collect()
+    tracemalloc.start()
+    objects = build(lines)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return {'modo': label, 'mb': current / 1e6, 'bytes_por_restaurante': current / len(lines)}
+
+def run(size: int) -> List[Dict[str, Any]]:
+    """Mide la memoria retenida por `size` restaurantes en cada representación"""
+    lines = api_like_lines(size)
+    legacy = lambda ls: (LegacyRestaurant(**_parse(line)) for line in ls)
+    compact = lambda ls: (Restaurant(**_parse(line)) for line in ls)
+    
+    return [
+        _measure("dataclass (anterior)", lambda ls: list(legacy(ls)), lines),
+        # El pipeline anterior mantenía además la lista de to_dict() durante todo el guardado
+        _measure("dataclass + to_dict (anterior)", lambda ls: [(r, r.__dict__.copy()) for r in legacy(ls)], lines),
+        _measure("Restaurant compacto", lambda ls: list(compact(ls)), lines),
+        _measure("Restaurant compacto + as_row", lambda ls: [(r, r.as_row()) for r in compact(ls)], lines),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=100000, help="Número de restaurantes sintéticos")
+    args = parser.parse_args()
+    
+    results = run(args.size)
+    baseline = results[0]['mb']
+    
+    print(f"\n📊 Memoria retenida por {args.size} restaurantes (solo los objetos del modelo)")
+    print(f"{'Modo':<34}{'MB':>10}{'Bytes/rest.':>14}{'Relativo':>10}")
+    for result in results:
+        print(f"{result['modo']:<34}{result['mb']:>10.1f}{result['bytes_por_restaurante']:>14.0f}"
+              f"{result['mb'] / baseline:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Servidor HTTP local que imita Geocoding, Nearby Search y Place Details de Google Maps
+Permite medir concurrencia, paginación, rate limiting y backoff de GoogleMapsClient sin red ni cuota
+Uso: python -m benchmarks.fake_maps_server [--port 8765] [--restaurants 20000] [--latency-ms 80]
+     [--error-rate 0.01] [--qps 50] [--page-token-delay 2]
+y después: GOOGLE_MAPS_BASE_URL=http://127.0.0.1:8765 GOOGLE_MAPS_API_KEY=AIzaFake python main.py ...
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import secrets
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+
+METERS_PER_DEGREE = 111320.0
+PAGE_SIZE = 20
+MAX_RESULTS = 60  # límite real de Nearby Search (3 páginas)
+TYPES = ['italian_restaurant', 'mexican_restaurant', 'chinese_restaurant', 'japanese_restaurant',
+         'fast_food_restaurant', 'pizza_restaurant', 'cafe', 'bar', 'restaurant']
+DAYS = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+class SyntheticCity:
+    """
+    Ciudad sintética y reproducible: un centro denso (distribución normal) rodeado de restaurantes
+    repartidos de forma uniforme, para que haya búsquedas saturadas y búsquedas dispersas
+    """
+    
+    def __init__(self, size: int = 20000, center: Tuple[float, float] = (40.4168, -3.7038),
+                 radius: float = 8000, core_share: float = 0.6, core_radius: float = 1000, seed: int = 42):
+        self.center = center
+        self.radius = radius
+        rng = np.random.default_rng(seed)
+        
+        core = int(size * core_share)
+        offsets = np.concatenate([
+            rng.normal(0, core_radius, size=(core, 2)),
+            self._uniform_disk(rng, size - core, radius),
+        ])
+        self.lat = center[0] + offsets[:, 1] / METERS_PER_DEGREE
+        self.lng = center[1] + offsets[:, 0] / (METERS_PER_DEGREE * math.cos(math.radians(center[0])))
+        self.places = [self._place(i, random.Random(seed * 1000003 + i)) for i in range(size)]
+        self._index = {place['place_id']: place for place in self.places}
+    
+    @staticmethod
+    def _uniform_disk(rng, size: int, radius: float) -> np.ndarray:
+        r = radius * np.sqrt(rng.random(size))
+        theta = rng.random(size) * 2 * math.pi
+        return np.column_stack([r * np.cos(theta), r * np.sin(theta)])
+    
+    def _place(self, i: int, rng: random.Random) -> Dict[str, Any]:
+        street = f"Calle {rng.randint(1, 500)}"
+        return {
+            'place_id': f"FAKE{i:08d}",
+            'name': f"Restaurante {i}",
+            'vicinity': f"{street}, Madrid",
+            'formatted_address': f"{street}, 280{rng.randint(1, 50):02d} Madrid, España",
+            'geometry': {'location': {'lat': float(self.lat[i]), 'lng': float(self.lng[i])}},
+            'rating': round(rng.uniform(1, 5), 1) if rng.random() < 0.9 else None,
+            'user_ratings_total': rng.randint(0, 5000),
+            'types': [rng.choice(TYPES), 'restaurant', 'food', 'point_of_interest', 'establishment'],
+            'formatted_phone_number': f"+34 91 {rng.randint(100, 999)} {rng.randint(1000, 9999)}"
+                                      if rng.random() < 0.8 else None,
+            'website': f"https://restaurante{i}.example.com" if rng.random() < 0.5 else None,
+            'opening_hours': {'open_now': True, 'weekday_text': [f"{day}: 12:00–16:00, 20:00–23:30" for day in DAYS]},
+        }
+    
+    def locate(self, address: str) -> Dict[str, float]:
+        """Coordenadas deterministas de un código postal dentro de la ciudad"""
+        digest = hashlib.sha256(address.strip().upper().encode('utf-8')).digest()
+        r = 0.8 * self.radius * math.sqrt(int.from_bytes(digest[:4], 'big') / 2 ** 32)
+        theta = 2 * math.pi * int.from_bytes(digest[4:8], 'big') / 2 ** 32
+        return {
+            'lat': self.center[0] + r * math.sin(theta) / METERS_PER_DEGREE,
+            'lng': self.center[1] + r * math.cos(theta) / (METERS_PER_DEGREE * math.cos(math.radians(self.center[0]))),
+        }
+    
+    def nearby(self, lat: float, lng: float, radius: float) -> List[Dict[str, Any]]:
+        """Lugares dentro del radio, del más cercano al más lejano, con el límite de 60 de la API"""
+        dy = (self.lat - lat) * METERS_PER_DEGREE
+        dx = (self.lng - lng) * METERS_PER_DEGREE * math.cos(math.radians(lat))
+        distance = np.hypot(dx, dy)
+        inside = np.flatnonzero(distance <= radius)
+        closest = inside[np.argsort(distance[inside], kind='stable')][:MAX_RESULTS]
+        return [self.places[i] for i in closest]
+    
+    def count_within(self, lat: float, lng: float, radius: float) -> int:
+        """Número total de lugares dentro del radio (sin el límite de la API), para verificar cobertura"""
+        dy = (self.lat - lat) * METERS_PER_DEGREE
+        dx = (self.lng - lng) * METERS_PER_DEGREE * math.cos(math.radians(lat))
+        return int(np.count_nonzero(np.hypot(dx, dy) <= radius))
+    
+    def get(self, place_id: str) -> Optional[Dict[str, Any]]:
+        return self._index.get(place_id)
+
+# Campos de Nearby Search (sin teléfono, web ni horarios completos)
+NEARBY_FIELDS = ('place_id', 'name', 'vicinity', 'geometry', 'rating', 'user_ratings_total', 'types')
+# Nombre del campo pedido -> clave en la respuesta
+DETAILS_ALIASES = {'type': 'types'}
+
+class FakeMapsServer:
+    """
+    Servidor de pruebas con la semántica que importa al cliente:
+    - next_page_token: INVALID_REQUEST hasta page_token_delay segundos después de emitirse, y caduca
+    - OVER_QUERY_LIMIT al superar qps peticiones por segundo en un endpoint
+    - latencia configurable y errores HTTP 503 inyectados con probabilidad error_rate
+    """
+    
+    ENDPOINTS = {
+        '/maps/api/geocode/json': 'geocode',
+        '/maps/api/place/nearbysearch/json': 'places_nearby',
+        '/maps/api/place/details/json': 'place',
+    }
+    
+    def __init__(self, city: Optional[SyntheticCity] = None, host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.0, error_rate: float = 0.0, qps: Optional[float] = None,
+                 page_token_delay: float = 2.0, page_token_ttl: float = 120.0, seed: int = 0):
+        self.city = city or SyntheticCity()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.qps = qps
+        self.page_token_delay = page_token_delay
+        self.page_token_ttl = page_token_ttl
+        
+        self.stats: Counter = Counter()
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._tokens: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+        self._windows: Dict[str, deque] = {endpoint: deque() for endpoint in self.ENDPOINTS.values()}
+        
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self) -> 'FakeMapsServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+    
+    def serve_forever(self):
+        """Atiende peticiones en el hilo actual (hasta Ctrl+C)"""
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+    
+    def __enter__(self) -> 'FakeMapsServer':
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+    
+    def _handler_class(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = server.handle(self.path)
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def handle(self, path: str) -> Tuple[int, Dict[str, Any]]:
+        """Responde una petición GET: devuelve (código HTTP, cuerpo JSON)"""
+        url = urlparse(path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        
+        if url.path == '/stats':
+            with self._lock:
+                return 200, dict(self.stats)
+        
+        endpoint = self.ENDPOINTS.get(url.path)
+        if endpoint is None:
+            return 404, {'status': 'NOT_FOUND'}
+        
+        with self._lock:
+            self.stats[f"{endpoint}.requests"] += 1
+            inject_error = self._rng.random() < self.error_rate
+            over_limit = self._over_limit(endpoint)
+            latency = self.latency * self._rng.uniform(0.5, 1.5)
+        
+        if latency:
+            time.sleep(latency)
+        if inject_error:
+            self._count(f"{endpoint}.http_503")
+            return 503, {'status': 'UNKNOWN_ERROR'}
+        if over_limit:
+            self._count(f"{endpoint}.over_query_limit")
+            return 200, {'status': 'OVER_QUERY_LIMIT', 'error_message': "Límite de peticiones superado"}
+        
+        return 200, getattr(self, f"_{endpoint}")(params)
+    
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+    
+    def _over_limit(self, endpoint: str) -> bool:
+        # Ventana deslizante de un segundo por endpoint (se llama con el lock tomado)
+        if not self.qps:
+            return False
+        now = time.monotonic()
+        window = self._windows[endpoint]
+        while window and window[0] <= now - 1:
+            window.popleft()
+        if len(window) >= self.qps:
+            return True
+        window.append(now)
+        return False
+    
+    def _geocode(self, params: Dict[str, str]) -> Dict[str, Any]:
+        address = params.get('address')
+        if not address:
+            return {'status': 'INVALID_REQUEST', 'results': []}
+        location = self.city.locate(address)
+        return {'status': 'OK', 'results': [{'formatted_address': address, 'geometry': {'location': location}}]}
+    
+    def _places_nearby(self, params: Dict[str, str]) -> Dict[str, Any]:
+        if 'pagetoken' in params:
+            return self._next_page(params['pagetoken'])
+        
+        if 'location' not in params:
+            return {'status': 'INVALID_REQUEST', 'results': []}
+        lat, lng = (float(value) for value in params['location'].split(','))
+        radius = float(params.get('radius', 1500))
+        results = [{key: place[key] for key in NEARBY_FIELDS if place.get(key) is not None}
+                   for place in self.city.nearby(lat, lng, radius)]
+        return self._page(results)
+    
+    def _page(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if not results:
+            return {'status': 'ZERO_RESULTS', 'results': []}
+        
+        body = {'status': 'OK', 'results': results[:PAGE_SIZE]}
+        if len(results) > PAGE_SIZE:
+            token = secrets.token_urlsafe(24)
+            with self._lock:
+                self._tokens[token] = (time.monotonic(), results[PAGE_SIZE:])
+            body['next_page_token'] = token
+        return body
+    
+    def _next_page(self, token: str) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            issued = self._tokens.get(token)
+            if issued is None or now - issued[0] > self.page_token_ttl:
+                self._tokens.pop(token, None)
+                self.stats['places_nearby.expired_token'] += 1
+                return {'status': 'INVALID_REQUEST', 'results': []}
+            if now - issued[0] < self.page_token_delay:
+                # Igual que la API real: el token aún no está activo
+                self.stats['places_nearby.token_not_ready'] += 1
+                return {'status': 'INVALID_REQUEST', 'results': []}
+            del self._tokens[token]
+        return self._page(issued[1])
+    
+    def _place(self, params: Dict[str, str]) -> Dict[str, Any]:
+        place = self.city.get(params.get('place_id') or params.get('placeid', ''))
+        if place is None:
+            return {'status': 'NOT_FOUND'}
+        
+        fields = params['fields'].split(',') if params.get('fields') else list(place)
+        result = {}
+        for field in fields:
+            key = DETAILS_ALIASES.get(field, field)
+            if place.get(key) is not None:
+                result[key] = place[key]
+        return {'status': 'OK', 'result': result}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--restaurants', type=int, default=20000, help="Restaurantes de la ciudad sintética")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency-ms', type=float, default=0, help="Latencia media por petición (±50%%)")
+    parser.add_argument('--error-rate', type=float, default=0, help="Probabilidad de responder HTTP 503")
+    parser.add_argument('--qps', type=float, default=None, help="Peticiones por segundo y endpoint antes de OVER_QUERY_LIMIT")
+    parser.add_argument('--page-token-delay', type=float, default=2.0, help="Segundos hasta que un next_page_token es válido")
+    args = parser.parse_args()
+    
+    server = FakeMapsServer(SyntheticCity(args.restaurants, seed=args.seed), host=args.host, port=args.port,
+                            latency=args.latency_ms / 1000, error_rate=args.error_rate, qps=args.qps,
+                            page_token_delay=args.page_token_delay, seed=args.seed)
+    print(f"🗺️  Google Maps falso en {server.base_url} ({args.restaurants} restaurantes) - estadísticas en /stats")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
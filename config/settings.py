@@ -7,15 +7,73 @@ class Settings:
     """Configuraciones de la aplicación"""
     
     GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+    # Vacío = API real; p.ej. http://127.0.0.1:8765 para el servidor falso de benchmarks/fake_maps_server.py
+    GOOGLE_MAPS_BASE_URL = os.getenv('GOOGLE_MAPS_BASE_URL') or None
     MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/restaurantes_db')
+    MONGODB_DATABASE = os.getenv('MONGODB_DATABASE', 'restaurantes_db')
+    MONGODB_COLLECTION = os.getenv('MONGODB_COLLECTION', 'restaurants')
+    MONGODB_BATCH_SIZE = int(os.getenv('MONGODB_BATCH_SIZE', '1000'))  # documentos por bulk_write
     
-    # Rate limiting
-    REQUEST_DELAY_MIN = 0.1
-    REQUEST_DELAY_MAX = 0.5
+    # Cola de trabajos distribuida (modo worker): un documento por código postal
+    MONGODB_JOBS_COLLECTION = os.getenv('MONGODB_JOBS_COLLECTION', 'scraping_jobs')
+    JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '300'))  # sin heartbeat, otro worker lo retoma
+    JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', '60'))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+    
+    # Rate limiting - token bucket por endpoint (peticiones por segundo)
+    GEOCODE_QPS = float(os.getenv('GEOCODE_QPS', '10'))
+    NEARBY_SEARCH_QPS = float(os.getenv('NEARBY_SEARCH_QPS', '10'))
+    PLACE_DETAILS_QPS = float(os.getenv('PLACE_DETAILS_QPS', '20'))
+    RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '5'))
+    RATE_LIMIT_MAX_RETRIES = 5  # reintentos ante OVER_QUERY_LIMIT
+    # Directorio para compartir el rate limit entre procesos (vacío = solo este proceso)
+    RATE_LIMIT_SHARED_DIR = os.getenv('RATE_LIMIT_SHARED_DIR')
+    
+    # Cache de geocoding (SQLite) - GEOCODE_CACHE_PATH vacío la desactiva
+    GEOCODE_CACHE_PATH = os.getenv('GEOCODE_CACHE_PATH', 'data/cache/geocode.sqlite3')
+    GEOCODE_CACHE_TTL_DAYS = 180
+    GEOCODE_CACHE_MAX_ENTRIES = 100000
+    GEOCODE_REGION = os.getenv('GEOCODE_REGION')  # p.ej. 'es' para sesgar resultados
+    
+    # Cache de Place Details por place_id - PLACE_DETAILS_CACHE_PATH vacío la desactiva
+    PLACE_DETAILS_CACHE_PATH = os.getenv('PLACE_DETAILS_CACHE_PATH', 'data/cache/place_details.sqlite3')
+    PLACE_DETAILS_CACHE_MEMORY_SIZE = 10000  # entradas en el LRU en memoria
+    PLACE_DETAILS_CACHE_TTL_HOURS = {
+        'basic': 30 * 24,      # nombre, dirección, tipo, coordenadas
+        'contact': 7 * 24,     # teléfono, web, horarios
+        'atmosphere': 24,      # rating y número de reseñas
+    }
+    
+    # Exportación incremental a CSV/NDJSON según llegan los resultados de cada código postal
+    STREAMING_EXPORT = os.getenv('STREAMING_EXPORT', 'false').lower() == 'true'
+    
+    # Exportación Parquet particionada por código postal (requiere pyarrow)
+    EXPORT_PARQUET = os.getenv('EXPORT_PARQUET', 'false').lower() == 'true'
+    PARQUET_COMPRESSION = os.getenv('PARQUET_COMPRESSION', 'zstd')
+    
+    # Exportación JSON: 'json' (array indentado) o 'ndjson' (una línea por restaurante, orjson)
+    JSON_EXPORT_FORMAT = os.getenv('JSON_EXPORT_FORMAT', 'json')
+    JSON_COMPRESSION = os.getenv('JSON_COMPRESSION') or None  # None, 'gzip' o 'zstd' (solo ndjson)
+    JSON_CHUNK_SIZE = 10000  # restaurantes serializados por escritura
     
     # Configuraciones de scraping
     SEARCH_RADIUS = 5000  # metros
-    MAX_RESULTS_PER_POSTAL_CODE = 60
+    MAX_RESULTS_PER_POSTAL_CODE = 60  # límite de Nearby Search: una búsqueda que lo alcanza está truncada
+    # Teselado adaptativo: las búsquedas saturadas se dividen en cuatro hasta este radio mínimo
+    ADAPTIVE_TILING = os.getenv('ADAPTIVE_TILING', 'true').lower() == 'true'
+    MIN_TILE_RADIUS = int(os.getenv('MIN_TILE_RADIUS', '250'))  # metros
+    # Sondeo del next_page_token hasta que se activa (INVALID_REQUEST mientras tanto)
+    PAGE_TOKEN_POLL_INTERVAL = float(os.getenv('PAGE_TOKEN_POLL_INTERVAL', '0.5'))  # segundos, crece x1.5
+    PAGE_TOKEN_TIMEOUT = float(os.getenv('PAGE_TOKEN_TIMEOUT', '10'))  # segundos
+    
+    # Place Details: 'full' (todos los campos), 'contact' (datos de Nearby + solo teléfono, web y horarios)
+    # o 'nearby' (sin Place Details; teléfono, web y horarios vacíos)
+    DETAILS_MODE = os.getenv('DETAILS_MODE', 'full')
+    
+    # Concurrencia - códigos postales procesados en paralelo
+    MAX_WORKERS = int(os.getenv('MAX_WORKERS', '4'))
+    # Peticiones de Place Details simultáneas (compartidas por todos los códigos postales)
+    MAX_DETAILS_WORKERS = int(os.getenv('MAX_DETAILS_WORKERS', '8'))
 
 def get_settings():
     return Settings()
\ No newline at end of file
@@ -0,0 +1,142 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from controllers.data_controller import DataController, IncrementalExporter
+from controllers.scraper_controller import GoogleMapsClient
+from models.batch import RestaurantBatch
+from models.restaurant import Restaurant
+from models.statistics import RestaurantStats
+
+# Destinos disponibles en modo batch (todos admiten escritura por código postal)
+SINKS = ('mongodb', 'csv', 'ndjson', 'parquet')
+
+def read_postal_codes(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Lee códigos postales de un fichero o stdin línea a línea, sin cargarlos todos
+    Ignora líneas vacías, comentarios (#) y códigos repetidos
+    """
+    seen = set()
+    for line in lines:
+        postal_code = line.strip()
+        if not postal_code or postal_code.startswith('#') or postal_code in seen:
+            continue
+        seen.add(postal_code)
+        yield postal_code
+
+class BatchController:
+    """
+    Procesa miles de códigos postales sin interacción
+    Los códigos se consumen en streaming con un número acotado de búsquedas en curso, y cada
+    resultado se escribe en los destinos en cuanto termina, sin acumular toda la ejecución en memoria
+    Un lugar ya escrito desde otro código no vuelve a escribirse: en MongoDB se le añade el código nuevo
+    """
+    
+    def __init__(self, scraper: GoogleMapsClient, data_controller: DataController, view,
+                 sinks: Iterable[str] = SINKS, max_workers: int = 4):
+        sinks = set(sinks)
+        unknown = sinks - set(SINKS)
+        if unknown:
+            raise ValueError(f"Destinos no soportados: {sorted(unknown)}")
+        
+        self.scraper = scraper
+        self.data_controller = data_controller
+        self.view = view
+        self.sinks = sinks
+        self.max_workers = max(1, max_workers)
+        
+        self.stats = RestaurantStats()
+        self.postal_codes: List[str] = []
+        self.failed: List[str] = []
+        self.mongodb_summary = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+        self._started = None
+        self._exporter: Optional[IncrementalExporter] = None
+    
+    def run(self, postal_codes: Iterable[str]) -> Dict[str, Any]:
+        """Ejecuta el batch completo y devuelve el resumen final"""
+        self._started = time.monotonic()
+        output_dir = self.data_controller.output_dir
+        
+        file_formats = self.sinks & set(IncrementalExporter.FORMATS)
+        if file_formats:
+            self._exporter = IncrementalExporter(csv_dir=str(Path(output_dir, "csv")),
+                                                 json_dir=str(Path(output_dir, "json")),
+                                                 formats=file_formats)
+        
+        try:
+            self._scrape(iter(postal_codes))
+        finally:
+            if self._exporter:
+                self._exporter.close()
+        
+        report_path = self.data_controller.write_statistics_report(self.stats, self.postal_codes)
+        summary = {
+            **self._throughput(),
+            'failed': len(self.failed),
+            'failed_postal_codes': self.failed,
+            'report': str(report_path),
+        }
+        if 'mongodb' in self.sinks:
+            summary['mongodb'] = self.mongodb_summary
+        
+        self.view.show_statistics(summary)
+        return summary
+    
+    def _scrape(self, postal_codes: Iterator[str]):
+        # Ventana de búsquedas en curso: el resto de códigos sigue sin leer
+        window = self.max_workers * 2
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            def submit(codes: Iterable[str]) -> Dict[Any, str]:
+                futures = {}
+                for code in codes:
+                    # Se anotan los lugares que el código encuentra ya vistos desde otro código
+                    self.scraper.seen_places.track(code)
+                    # Con raise_errors un error de la API cuenta como fallo (exit code 1) y no como 0 resultados
+                    futures[executor.submit(self.scraper.search_restaurants_by_postal_code, code,
+                                            raise_errors=True)] = code
+                return futures
+            
+            pending = submit(islice(postal_codes, window))
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    postal_code = pending.pop(future)
+                    self.postal_codes.append(postal_code)
+                    try:
+                        self._write(postal_code, future.result())
+                        self.scraper.seen_places.untrack(postal_code)
+                    except Exception as e:
+                        # Sus lugares quedan libres para que otro código que los encuentre los escriba
+                        self.scraper.seen_places.untrack(postal_code, release=True)
+                        self.failed.append(postal_code)
+                        self.view.show_error(f"Error procesando {postal_code}: {e}", postal_code=postal_code)
+                pending.update(submit(islice(postal_codes, len(done))))
+    
+    def _write(self, postal_code: str, restaurants: List[Restaurant]):
+        """Escribe los resultados de un código postal en los destinos seleccionados"""
+        if self._exporter:
+            self._exporter.write(postal_code, restaurants)
+        
+        batch = RestaurantBatch.from_restaurants(restaurants)
+        summary = self.data_controller.save_postal_code(postal_code, batch,
+                                                        self.scraper.seen_places.revisited(postal_code),
+                                                        mongodb='mongodb' in self.sinks,
+                                                        parquet='parquet' in self.sinks)
+        for key in self.mongodb_summary:
+            self.mongodb_summary[key] += summary.get(key, 0)
+        
+        self.stats.add_batch(batch)
+        self.view.show_postal_code_progress(len(self.postal_codes), None, postal_code, len(batch),
+                                            failed=len(self.failed), **self._throughput())
+    
+    def _throughput(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return {
+            'postal_codes': len(self.postal_codes),
+            'restaurants_total': self.stats.total,
+            'elapsed_s': round(elapsed, 3),
+            'postal_codes_per_s': round(len(self.postal_codes) / elapsed, 3),
+            'restaurants_per_s': round(self.stats.total / elapsed, 3),
+        }
@@ -0,0 +1,114 @@
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+# Metros por grado de latitud (aproximación esférica, suficiente para radios de pocos km)
+METERS_PER_DEGREE = 111320.0
+
+@dataclass(frozen=True)
+class Tile:
+    """
+    Círculo de búsqueda, con el centro en metros respecto al centro del código postal
+    half es la mitad del lado del cuadrado del que es responsable la tesela (None en la raíz: el
+    cuadrado que contiene el círculo buscado)
+    """
+    x: float
+    y: float
+    radius: float
+    depth: int = 0
+    half: Optional[float] = None
+    
+    @property
+    def half_side(self) -> float:
+        return self.radius if self.half is None else self.half
+    
+    @property
+    def child_radius(self) -> float:
+        """Radio de las hijas: el círculo circunscrito a un cuadrante del cuadrado de la tesela"""
+        return self.half_side / math.sqrt(2)
+    
+    def split(self) -> List['Tile']:
+        """
+        Divide el cuadrado de la tesela en cuatro cuadrantes (quadtree)
+        Cada hija busca el círculo circunscrito a su cuadrante, así que las cuatro cubren por completo
+        el cuadrado de la madre y el radio se reduce a la mitad en cada nivel
+        """
+        half = self.half_side / 2
+        radius = self.child_radius
+        return [Tile(self.x + dx, self.y + dy, radius, self.depth + 1, half)
+                for dx in (-half, half) for dy in (-half, half)]
+
+class AdaptiveCoverage:
+    """
+    Cobertura adaptativa del área de un código postal con búsquedas Nearby
+    Nearby Search devuelve como máximo 60 resultados: una tesela que llega al límite probablemente
+    está truncada y se divide en cuatro más pequeñas; las que vuelven por debajo del límite se dan
+    por completas. Las teselas que quedan fuera del área buscada no se consultan
+    """
+    
+    def __init__(self, center: Dict[str, float], radius: float, saturation: int = 60,
+                 min_radius: float = 250, tiles: Optional[List[Tile]] = None, found: int = 0):
+        self.center = center
+        self.radius = radius
+        self.saturation = saturation
+        self.min_radius = min_radius
+        self.tiles = list(tiles) if tiles is not None else [Tile(0.0, 0.0, radius)]
+        # Resultados devueltos hasta ahora por la tesela en curso (todas sus páginas)
+        self.found = found
+        self.searches = 0
+        self.saturated = 0
+    
+    @property
+    def current(self) -> Optional[Tile]:
+        """Tesela en curso (None cuando la cobertura está completa)"""
+        return self.tiles[0] if self.tiles else None
+    
+    def location(self, tile: Tile) -> Dict[str, float]:
+        """Coordenadas del centro de una tesela"""
+        lat = self.center['lat'] + tile.y / METERS_PER_DEGREE
+        cos_lat = max(math.cos(math.radians(self.center['lat'])), 1e-6)
+        lng = self.center['lng'] + tile.x / (METERS_PER_DEGREE * cos_lat)
+        return {'lat': lat, 'lng': lng}
+    
+    def record_page(self, results: int):
+        """Suma los resultados de una página de la tesela en curso"""
+        self.found += results
+    
+    def finish_tile(self) -> List[Tile]:
+        """
+        Cierra la tesela en curso tras su última página
+        Si ha llegado al límite de resultados se encolan sus hijas; devuelve las teselas añadidas
+        """
+        tile = self.tiles.pop(0)
+        self.searches += 1
+        children = []
+        
+        if self.found >= self.saturation:
+            self.saturated += 1
+            if tile.child_radius >= self.min_radius:
+                children = [child for child in tile.split() if self._intersects_area(child)]
+                self.tiles.extend(children)
+        
+        self.found = 0
+        return children
+    
+    def _intersects_area(self, tile: Tile) -> bool:
+        # Distancia del centro del área al punto más cercano del cuadrado de la tesela
+        dx = max(abs(tile.x) - tile.half_side, 0.0)
+        dy = max(abs(tile.y) - tile.half_side, 0.0)
+        return math.hypot(dx, dy) < self.radius
+    
+    def to_state(self) -> Dict[str, Any]:
+        """Estado serializable (para el diario de la ejecución)"""
+        return {
+            'center': self.center,
+            'radius': self.radius,
+            'tiles': [[tile.x, tile.y, tile.radius, tile.depth, tile.half] for tile in self.tiles],
+            'found': self.found,
+        }
+    
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], saturation: int = 60, min_radius: float = 250) -> 'AdaptiveCoverage':
+        """Reconstruye una cobertura a medias a partir de to_state()"""
+        return cls(state['center'], state['radius'], saturation, min_radius,
+                   tiles=[Tile(*tile) for tile in state['tiles']], found=state['found'])
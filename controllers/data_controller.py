@@ -1,127 +1,397 @@
 import pandas as pd
+import csv
+import gzip
 import json
-import numpy as np
-from typing import List, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Optional, Union
 from pathlib import Path
-from models.restaurant import Restaurant
+from models.batch import RestaurantBatch
+from models.restaurant import Restaurant, compact_hours
 from models.database import DatabaseManager
+from models.statistics import RestaurantStats
+from config.settings import get_settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional, solo lo usa la exportación Parquet
+    pa = ds = pq = None
+
+try:
+    import orjson
+except ImportError:  # sin orjson se usa el módulo json estándar (más lento)
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard es opcional, solo para JSON_COMPRESSION=zstd
+    zstandard = None
+
+# Directorio de salida por defecto (csv/, json/ y parquet/ cuelgan de él)
+OUTPUT_DIR = "data"
+
+def _json_ready(restaurant: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia del restaurante con scraped_at como string ISO"""
+    json_restaurant = restaurant.copy()
+    if restaurant.get('scraped_at'):
+        json_restaurant['scraped_at'] = restaurant['scraped_at'].isoformat()
+    return json_restaurant
+
+def _ndjson_line(restaurant: Dict[str, Any]) -> bytes:
+    """Serializa un restaurante como una línea NDJSON (orjson convierte datetime y numpy de forma nativa)"""
+    if orjson is not None:
+        return orjson.dumps(restaurant, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY)
+    return (json.dumps(_json_ready(restaurant), ensure_ascii=False) + '\n').encode('utf-8')
+
+def _open_compressed(path: Path, compression: Optional[str]):
+    """Abre un fichero binario de salida con compresión opcional (gzip o zstd)"""
+    if compression == 'gzip':
+        return gzip.open(path.with_name(path.name + '.gz'), 'wb', compresslevel=6)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("La compresión zstd requiere el paquete zstandard")
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path.with_name(path.name + '.zst'), 'wb'))
+    if compression:
+        raise ValueError(f"Compresión no soportada: {compression}")
+    return open(path, 'wb')
+
+class IncrementalExporter:
+    """
+    Exporta a CSV y NDJSON a medida que llegan los resultados de cada código postal
+    Cada escritura se vuelca a disco, así que un fallo a mitad de ejecución conserva lo ya exportado
+    """
+    
+    FIELDS = list(Restaurant.FIELDS)
+    FORMATS = ('csv', 'ndjson')
+    
+    def __init__(self, csv_dir: str = "data/csv", json_dir: str = "data/json",
+                 formats: Iterable[str] = FORMATS):
+        formats = set(formats)
+        unknown = formats - set(self.FORMATS)
+        if unknown:
+            raise ValueError(f"Formatos de exportación incremental no soportados: {sorted(unknown)}")
+        
+        self.csv_dir = Path(csv_dir)
+        self.json_dir = Path(json_dir)
+        
+        self.count = 0
+        self._lock = threading.Lock()
+        self._started_postal_codes = set()
+        self._csv_file = self._csv_writer = self._ndjson_file = None
+        
+        if 'csv' in formats:
+            self.csv_dir.mkdir(parents=True, exist_ok=True)
+            self._csv_file = open(self.csv_dir / "restaurantes_completo.csv", 'w', newline='', encoding='utf-8')
+            self._csv_writer = csv.DictWriter(self._csv_file, fieldnames=self.FIELDS)
+            self._csv_writer.writeheader()
+        if 'ndjson' in formats:
+            self.json_dir.mkdir(parents=True, exist_ok=True)
+            self._ndjson_file = open(self.json_dir / "restaurantes_completo.ndjson", 'wb')
+    
+    def write(self, postal_code: str, restaurants: List[Restaurant]):
+        """Añade los restaurantes de un código postal a todos los ficheros"""
+        rows = [r.to_dict() for r in restaurants]
+        
+        with self._lock:
+            if self._csv_file:
+                self._csv_writer.writerows(rows)
+                
+                # CSV por código postal: se reinicia la primera vez que aparece en esta ejecución
+                mode = 'a' if postal_code in self._started_postal_codes else 'w'
+                with open(self.csv_dir / f"restaurantes_{postal_code}.csv", mode, newline='', encoding='utf-8') as f:
+                    writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+                    if mode == 'w':
+                        writer.writeheader()
+                    writer.writerows(rows)
+                self._started_postal_codes.add(postal_code)
+                self._csv_file.flush()
+            
+            if self._ndjson_file:
+                self._ndjson_file.write(b''.join(_ndjson_line(row) for row in rows))
+                self._ndjson_file.flush()
+            
+            self.count += len(rows)
+    
+    def close(self):
+        """Cierra los ficheros de exportación"""
+        with self._lock:
+            for f in (self._csv_file, self._ndjson_file):
+                if f:
+                    f.close()
+    
+    def __enter__(self) -> 'IncrementalExporter':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
 
 class DataController:
     """Controla el procesamiento y almacenamiento de datos"""
     
-    def __init__(self):
+    def __init__(self, output_dir: str = OUTPUT_DIR):
         self.db_manager = DatabaseManager()
+        self.settings = get_settings()
+        self.output_dir = Path(output_dir)
     
-    def process_and_save_data(self, restaurants: List[Restaurant], postal_codes: List[str]):
-        """Procesa y guarda todos los datos en diferentes formatos"""
+    def process_and_save_data(self, restaurants: Union[List[Restaurant], RestaurantBatch], postal_codes: List[str],
+                              export_files: bool = True, stats: Optional[RestaurantStats] = None):
+        """
+        Procesa y guarda todos los datos en diferentes formatos
+        Con export_files=False se omiten CSV/JSON (ya exportados por IncrementalExporter); Parquet,
+        que IncrementalExporter no escribe, se exporta igualmente si EXPORT_PARQUET está activo
+        stats permite reutilizar el agregado incremental calculado durante el scraping
+        """
         
-        # Convertir a diccionarios
-        restaurant_dicts = [r.to_dict() for r in restaurants]
+        # Todo el procesamiento parte del lote columnar
+        if isinstance(restaurants, RestaurantBatch):
+            batch = restaurants
+        else:
+            batch = RestaurantBatch.from_restaurants(restaurants)
         
-        # Guardar en bases de datos
-        self._save_to_databases(restaurant_dicts)
+        # Guardar en bases de datos (los documentos se generan por bloques)
+        self._save_to_databases(batch.iter_dicts())
         
-        # Exportar a CSV
-        self._export_to_csv(restaurant_dicts, postal_codes)
+        if export_files:
+            # Exportar a CSV
+            self._export_to_csv(batch, postal_codes)
+            
+            # Exportar a JSON (array indentado o NDJSON rápido), formatos orientados a documentos
+            if self.settings.JSON_EXPORT_FORMAT == 'ndjson':
+                self._export_to_ndjson(batch.iter_dicts())
+            else:
+                self._export_to_json(list(batch.iter_dicts()))
         
-        # Exportar a JSON
-        self._export_to_json(restaurant_dicts)
+        # Exportar a Parquet (opcional)
+        if self.settings.EXPORT_PARQUET:
+            self._export_to_parquet(batch)
         
         # Generar reporte de estadísticas
-        self._generate_statistics_report(restaurant_dicts, postal_codes)
+        self._generate_statistics_report(batch, postal_codes, stats)
+    
+    def save_postal_code(self, postal_code: str, batch: RestaurantBatch, revisited: Iterable[str] = (),
+                         mongodb: bool = True, parquet: Optional[bool] = None) -> Dict[str, int]:
+        """
+        Guarda los resultados de un código postal en cuanto termina (modo streaming y modo batch)
+        revisited son los place_id que el código encontró ya vistos desde otro código (y por tanto fuera
+        del lote): en MongoDB solo se les añade este código postal ($addToSet)
+        Parquet se exporta según EXPORT_PARQUET salvo que se indique; CSV/NDJSON son cosa de IncrementalExporter
+        Los errores se propagan para que quien llama decida; devuelve el resumen de MongoDB
+        """
+        summary: Dict[str, int] = {}
+        
+        if mongodb:
+            if len(batch):
+                summary = self.db_manager.save_to_mongodb(batch.iter_dicts())
+            revisited = list(revisited)
+            if revisited:
+                self.db_manager.add_postal_code(revisited, postal_code)
+        if len(batch) and (self.settings.EXPORT_PARQUET if parquet is None else parquet):
+            self._export_to_parquet(batch, verbose=False)
+        return summary
     
-    def _save_to_databases(self, restaurants: List[Dict[str, Any]]):
+    def _save_to_databases(self, restaurants: Iterable[Union[Restaurant, Dict[str, Any]]]):
         """Guarda SOLO en MongoDB (según requisitos)"""
         try:
             # MongoDB - Único requerimiento según documento
-            mongo_ids = self.db_manager.save_to_mongodb(restaurants)
-            print(f"✅ Guardados {len(mongo_ids)} restaurantes en MongoDB")
-            
+            summary = self.db_manager.save_to_mongodb(restaurants)
+            print(f"✅ MongoDB: {summary['inserted']} nuevos, {summary['updated']} actualizados, "
+                  f"{summary['unchanged']} sin cambios")
+        
         except Exception as e:
             print(f"❌ Error guardando en MongoDB: {e}")
     
-    def _export_to_csv(self, restaurants: List[Dict[str, Any]], postal_codes: List[str]):
-        """Exporta datos a CSV"""
-        df = pd.DataFrame(restaurants)
+    def _export_to_csv(self, restaurants: Union[List[Dict[str, Any]], RestaurantBatch], postal_codes: List[str]):
+        """
+        Exporta datos a CSV
+        Las particiones por código postal salen de un único groupby y se escriben en paralelo
+        """
+        if isinstance(restaurants, RestaurantBatch):
+            df = restaurants.to_frame()
+        else:
+            df = pd.DataFrame(restaurants)
         
         # CSV general
-        csv_path = Path("data/csv/restaurantes_completo.csv")
+        csv_path = Path(self.output_dir, "csv", "restaurantes_completo.csv")
         csv_path.parent.mkdir(parents=True, exist_ok=True)
         df.to_csv(csv_path, index=False, encoding='utf-8')
         
-        # CSV por código postal
-        for postal_code in postal_codes:
-            df_postal = df[df['postal_code'] == postal_code]
-            csv_postal_path = Path(f"data/csv/restaurantes_{postal_code}.csv")
-            df_postal.to_csv(csv_postal_path, index=False, encoding='utf-8')
+        # CSV por código postal - una sola pasada sobre el DataFrame
+        partitions = {}
+        if 'postal_code' in df.columns:
+            partitions = {postal_code: group for postal_code, group in df.groupby('postal_code', sort=False)}
+        empty = df.iloc[0:0]
+        
+        def write_partition(postal_code: str):
+            csv_postal_path = Path(self.output_dir, "csv", f"restaurantes_{postal_code}.csv")
+            partitions.get(postal_code, empty).to_csv(csv_postal_path, index=False, encoding='utf-8')
+        
+        with ThreadPoolExecutor(max_workers=self.settings.MAX_WORKERS) as executor:
+            # list() propaga cualquier error de escritura
+            list(executor.map(write_partition, dict.fromkeys(postal_codes)))
         
         print(f"Exportados {len(restaurants)} restaurantes a CSV")
     
     def _export_to_json(self, restaurants: List[Dict[str, Any]]):
         """Exporta datos a JSON"""
-        json_path = Path("data/json/restaurantes_completo.json")
+        json_path = Path(self.output_dir, "json", "restaurantes_completo.json")
         json_path.parent.mkdir(parents=True, exist_ok=True)
         
         # Convertir datetime a string para JSON
-        json_ready_restaurants = []
-        for restaurant in restaurants:
-            json_restaurant = restaurant.copy()
-            if restaurant.get('scraped_at'):
-                json_restaurant['scraped_at'] = restaurant['scraped_at'].isoformat()
-            json_ready_restaurants.append(json_restaurant)
+        json_ready_restaurants = [_json_ready(restaurant) for restaurant in restaurants]
         
         with open(json_path, 'w', encoding='utf-8') as f:
             json.dump(json_ready_restaurants, f, indent=2, ensure_ascii=False)
         
         print(f"Exportados {len(restaurants)} restaurantes a JSON")
     
-    def _convert_to_json_serializable(self, obj):
-        """Convierte objetos numpy/pandas a tipos serializables en JSON"""
-        if isinstance(obj, (np.integer, np.int64)):
-            return int(obj)
-        elif isinstance(obj, (np.floating, np.float64)):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif pd.isna(obj):
-            return None
-        return obj
-    
-    def _generate_statistics_report(self, restaurants: List[Dict[str, Any]], postal_codes: List[str]):
-        """Genera reporte de estadísticas básicas"""
-        df = pd.DataFrame(restaurants)
-        
-        # Obtener estadísticas básicas
-        restaurants_per_postal = df.groupby('postal_code').size().to_dict()
-        cuisine_counts = df['cuisine_type'].value_counts().to_dict() if 'cuisine_type' in df.columns else {}
-        
-        # Estadísticas de rating (solo valores no nulos)
-        ratings = df['rating'].dropna() if 'rating' in df.columns else pd.Series([])
-        
-        stats = {
-            "resumen_general": {
-                "total_restaurantes": len(restaurants),
-                "codigos_postales_analizados": postal_codes,
-                "restaurantes_por_codigo_postal": {k: self._convert_to_json_serializable(v) for k, v in restaurants_per_postal.items()},
-                "rating_promedio": self._convert_to_json_serializable(ratings.mean()) if len(ratings) > 0 else 0,
-                "restaurantes_con_telefono": self._convert_to_json_serializable(df['phone'].notna().sum()),
-                "restaurantes_con_website": self._convert_to_json_serializable(df['website'].notna().sum()),
-            },
-            "tipos_cocina": {k: self._convert_to_json_serializable(v) for k, v in cuisine_counts.items()},
-            "estadisticas_rating": {
-                "promedio": self._convert_to_json_serializable(ratings.mean()) if len(ratings) > 0 else 0,
-                "mediana": self._convert_to_json_serializable(ratings.median()) if len(ratings) > 0 else 0,
-                "maximo": self._convert_to_json_serializable(ratings.max()) if len(ratings) > 0 else 0,
-                "minimo": self._convert_to_json_serializable(ratings.min()) if len(ratings) > 0 else 0,
-                "total_con_rating": self._convert_to_json_serializable(len(ratings))
-            }
-        }
+    def _export_to_ndjson(self, restaurants: Iterable[Dict[str, Any]]):
+        """
+        Exporta datos a JSON delimitado por líneas (un restaurante por línea)
+        Serializa por bloques, sin construir el array completo, y con compresión opcional
+        """
+        compression = self.settings.JSON_COMPRESSION
+        chunk_size = self.settings.JSON_CHUNK_SIZE
+        
+        json_path = Path(self.output_dir, "json", "restaurantes_completo.ndjson")
+        json_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        count = 0
+        rows = iter(restaurants)
+        with _open_compressed(json_path, compression) as f:
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                f.write(b''.join(_ndjson_line(restaurant) for restaurant in chunk))
+                count += len(chunk)
+        
+        print(f"Exportados {count} restaurantes a NDJSON")
+    
+    @property
+    def parquet_path(self) -> Path:
+        """Raíz del dataset Parquet"""
+        return Path(self.output_dir, "parquet", "restaurantes")
+    
+    def _parquet_schema(self) -> 'pa.Schema':
+        """Esquema tipado del dataset Parquet"""
+        return pa.schema([
+            ('name', pa.string()),
+            ('address', pa.string()),
+            ('postal_code', pa.string()),
+            ('phone', pa.string()),
+            ('rating', pa.float64()),
+            ('review_count', pa.int64()),
+            ('cuisine_type', pa.dictionary(pa.int32(), pa.string())),
+            ('business_hours', pa.list_(pa.string())),  # un elemento por día, en orden
+            ('website', pa.string()),
+            ('latitude', pa.float64()),
+            ('longitude', pa.float64()),
+            ('place_id', pa.string()),
+            ('postal_codes', pa.list_(pa.string())),
+            ('scraped_at', pa.timestamp('us')),
+        ])
+    
+    def _export_to_parquet(self, restaurants: Union[List[Union[Restaurant, Dict[str, Any]]], RestaurantBatch],
+                           verbose: bool = True):
+        """
+        Exporta datos a un dataset Parquet particionado por código postal
+        (<output_dir>/parquet/restaurantes/postal_code=XXXXX/*.parquet)
+        """
+        if pa is None:
+            print("❌ Exportación Parquet no disponible: instala pyarrow")
+            return
+        
+        if isinstance(restaurants, RestaurantBatch):
+            # Directamente desde los buffers columnares del lote
+            table = restaurants.to_arrow(self._parquet_schema())
+        elif restaurants and isinstance(restaurants[0], Restaurant):
+            # Sin diccionarios intermedios: columnas a partir de las filas (los horarios ya son una tupla por día)
+            columns = zip(*(r.as_row() for r in restaurants))
+            table = pa.Table.from_pydict(dict(zip(Restaurant.FIELDS, columns)), schema=self._parquet_schema())
+        else:
+            rows = []
+            for restaurant in restaurants:
+                row = restaurant.copy()
+                # Los horarios pasan de {'day_0': ..., 'day_1': ...} a una lista ordenada
+                row['business_hours'] = compact_hours(row.get('business_hours'))
+                rows.append(row)
+            table = pa.Table.from_pylist(rows, schema=self._parquet_schema())
+        
+        parquet_path = self.parquet_path
+        parquet_path.mkdir(parents=True, exist_ok=True)
+        pq.write_to_dataset(
+            table,
+            root_path=str(parquet_path),
+            partitioning=self._parquet_partitioning(),
+            compression=self.settings.PARQUET_COMPRESSION,
+            existing_data_behavior='delete_matching'
+        )
+        
+        if verbose:
+            print(f"Exportados {len(restaurants)} restaurantes a Parquet")
+    
+    def _parquet_partitioning(self) -> 'ds.Partitioning':
+        # postal_code siempre como string: '08001' no debe leerse como el entero 8001
+        return ds.partitioning(pa.schema([('postal_code', pa.string())]), flavor='hive')
+    
+    def load_parquet(self, postal_codes: Optional[List[str]] = None,
+                     columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Lee el dataset Parquet de forma selectiva
+        Solo se abren las particiones de los códigos postales pedidos y las columnas indicadas
+        """
+        if pa is None:
+            raise ImportError("La lectura Parquet requiere pyarrow")
+        
+        dataset = ds.dataset(str(self.parquet_path), format='parquet', partitioning=self._parquet_partitioning())
+        filter_expression = ds.field('postal_code').isin(postal_codes) if postal_codes else None
+        return dataset.to_table(columns=columns, filter=filter_expression).to_pandas()
+    
+    def _generate_statistics_report(self, restaurants: Union[List[Union[Restaurant, Dict[str, Any]]], RestaurantBatch],
+                                    postal_codes: List[str], stats: Optional[RestaurantStats] = None):
+        """
+        Genera reporte de estadísticas básicas
+        Usa el agregado incremental recibido o lo calcula en una pasada, sin DataFrame
+        """
+        if stats is None and isinstance(restaurants, RestaurantBatch):
+            stats = RestaurantStats().add_batch(restaurants)
+        elif stats is None:
+            stats = RestaurantStats().add_many(restaurants)
+        
+        self.write_statistics_report(stats, postal_codes)
+        print("Reporte de estadísticas generado")
+    
+    def write_statistics_report(self, stats: RestaurantStats, postal_codes: List[str]) -> Path:
+        """Escribe reporte_estadisticas.json a partir de un agregado y devuelve su ruta"""
+        report = stats.to_report(postal_codes)
         
         # Guardar reporte
-        report_path = Path("data/json/reporte_estadisticas.json")
+        report_path = Path(self.output_dir, "json", "reporte_estadisticas.json")
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        
+        return report_path
+    
+    def generate_database_report(self, postal_codes: Optional[List[str]] = None, **filters) -> Optional[Dict[str, Any]]:
+        """
+        Genera el reporte de estadísticas sobre todo el histórico guardado en MongoDB
+        Se calcula en el servidor con pipelines de agregación (acepta los filtros de build_query)
+        """
+        report = self.db_manager.get_statistics_report(postal_codes, **filters)
+        if report is None:
+            print("❌ No se pudo generar el reporte histórico desde MongoDB")
+            return None
+        
+        report_path = Path(self.output_dir, "json", "reporte_estadisticas_historico.json")
         report_path.parent.mkdir(parents=True, exist_ok=True)
         
         with open(report_path, 'w', encoding='utf-8') as f:
-            json.dump(stats, f, indent=2, ensure_ascii=False)
+            json.dump(report, f, indent=2, ensure_ascii=False)
         
-        print("Reporte de estadísticas generado")
\ No newline at end of file
+        print("Reporte histórico de estadísticas generado")
+        return report
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows - sin bloqueo de ficheros POSIX
+    fcntl = None
+
+class TokenBucket:
+    """
+    Token bucket seguro entre hilos
+    Genera `rate` tokens por segundo y admite ráfagas de hasta `capacity`
+    """
+    
+    def __init__(self, rate: float, capacity: float = 1, min_rate: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("El rate del token bucket debe ser mayor que 0")
+        
+        self.base_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = float(min_rate) if min_rate else self.base_rate / 16
+        self.capacity = float(max(1, capacity))
+        self._lock = threading.Lock()
+        self._state = {'tokens': self.capacity, 'updated': self._now()}
+    
+    def _now(self) -> float:
+        return time.monotonic()
+    
+    @contextmanager
+    def _locked_state(self):
+        """Da acceso exclusivo al estado del bucket"""
+        with self._lock:
+            yield self._state
+    
+    def _refill(self, state: Dict[str, float], now: float):
+        elapsed = max(0.0, now - state['updated'])
+        state['tokens'] = min(self.capacity, state['tokens'] + elapsed * self.rate)
+        state['updated'] = now
+    
+    def reserve(self) -> float:
+        """
+        Reserva un token y devuelve los segundos a esperar antes de usarlo
+        Los tokens pueden quedar en negativo: cada reserva hace cola detrás de la anterior
+        """
+        with self._locked_state() as state:
+            now = self._now()
+            self._refill(state, now)
+            state['tokens'] -= 1
+            
+            if state['tokens'] >= 0:
+                return 0.0
+            return -state['tokens'] / self.rate
+    
+    def acquire(self) -> float:
+        """Bloquea el hilo hasta disponer de un token"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+    
+    async def acquire_async(self) -> float:
+        """Versión asyncio de acquire (no bloquea el event loop)"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+    
+    def slow_down(self, pause: float) -> bool:
+        """
+        Reduce el rate a la mitad y pausa el bucket `pause` segundos
+        Los avisos que llegan durante la pausa en curso (varios hilos con OVER_QUERY_LIMIT en la misma
+        ráfaga) son el mismo evento: no vuelven a reducir el rate ni suman sus pausas
+        Devuelve si el aviso abrió una pausa nueva
+        """
+        with self._locked_state() as state:
+            now = self._now()
+            self._refill(state, now)
+            backoff_until = state.get('backoff_until', 0.0)
+            new_event = now >= backoff_until
+            if new_event:
+                self.rate = max(self.min_rate, self.rate / 2)
+            state['backoff_until'] = max(backoff_until, now + pause)
+            # La pausa se expresa como deuda de tokens para que la respeten todas las reservas
+            state['tokens'] = min(state['tokens'], -pause * self.rate)
+            return new_event
+    
+    def backoff_remaining(self) -> float:
+        """Segundos que quedan de la pausa en curso (0 si no hay ninguna)"""
+        with self._locked_state() as state:
+            return max(0.0, state.get('backoff_until', 0.0) - self._now())
+    
+    def speed_up(self):
+        """Recupera el rate de forma gradual tras una petición correcta"""
+        with self._lock:
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 10)
+
+class FileTokenBucket(TokenBucket):
+    """
+    Token bucket compartido entre procesos mediante un fichero local
+    El estado se guarda en JSON y se protege con flock (solo POSIX)
+    """
+    
+    def __init__(self, path: str, rate: float, capacity: float = 1, min_rate: Optional[float] = None):
+        if fcntl is None:
+            raise RuntimeError("El rate limit compartido entre procesos requiere fcntl (POSIX)")
+        
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.touch(exist_ok=True)
+        super().__init__(rate, capacity, min_rate)
+    
+    def _now(self) -> float:
+        # Reloj de pared: monotonic no es comparable entre procesos
+        return time.time()
+    
+    @contextmanager
+    def _locked_state(self):
+        with self._lock, open(self.path, 'r+', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                content = f.read()
+                state = json.loads(content) if content else {'tokens': self.capacity, 'updated': self._now()}
+                yield state
+                
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+class RateLimiter:
+    """Rate limiter por endpoint de Google Maps con backoff adaptativo"""
+    
+    def __init__(self, rates: Dict[str, float], burst: float = 1, shared_dir: Optional[str] = None,
+                 backoff_base: float = 1.0, backoff_max: float = 32.0):
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.buckets: Dict[str, TokenBucket] = {}
+        self._failures: Dict[str, int] = {}
+        self._failures_lock = threading.Lock()
+        
+        for endpoint, rate in rates.items():
+            if shared_dir:
+                bucket_path = Path(shared_dir) / f"{endpoint}.bucket"
+                self.buckets[endpoint] = FileTokenBucket(str(bucket_path), rate, burst)
+            else:
+                self.buckets[endpoint] = TokenBucket(rate, burst)
+            self._failures[endpoint] = 0
+    
+    @classmethod
+    def from_settings(cls, settings) -> 'RateLimiter':
+        """Crea el rate limiter a partir de Settings"""
+        rates = {
+            'geocode': settings.GEOCODE_QPS,
+            'places_nearby': settings.NEARBY_SEARCH_QPS,
+            'place': settings.PLACE_DETAILS_QPS,
+        }
+        return cls(rates, burst=settings.RATE_LIMIT_BURST, shared_dir=settings.RATE_LIMIT_SHARED_DIR)
+    
+    def _bucket(self, endpoint: str) -> TokenBucket:
+        if endpoint not in self.buckets:
+            raise ValueError(f"Endpoint sin rate limit configurado: {endpoint}")
+        return self.buckets[endpoint]
+    
+    def acquire(self, endpoint: str) -> float:
+        """Espera un token del endpoint; devuelve los segundos esperados"""
+        return self._bucket(endpoint).acquire()
+    
+    async def acquire_async(self, endpoint: str) -> float:
+        """Versión asyncio de acquire"""
+        return await self._bucket(endpoint).acquire_async()
+    
+    def report_over_query_limit(self, endpoint: str) -> float:
+        """Aplica backoff exponencial con jitter tras un OVER_QUERY_LIMIT; devuelve la pausa"""
+        bucket = self._bucket(endpoint)
+        with self._failures_lock:
+            # Un aviso durante la pausa en curso es de la misma ráfaga: ni cuenta como fallo consecutivo
+            # ni alarga la pausa
+            remaining = bucket.backoff_remaining()
+            if remaining > 0:
+                return remaining
+            
+            self._failures[endpoint] += 1
+            failures = self._failures[endpoint]
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+            backoff *= random.uniform(0.5, 1.0)
+            bucket.slow_down(backoff)
+        return backoff
+    
+    def report_success(self, endpoint: str):
+        """Registra una petición correcta y recupera el rate poco a poco"""
+        bucket = self._bucket(endpoint)
+        with self._failures_lock:
+            self._failures[endpoint] = 0
+        if bucket.rate < bucket.base_rate:
+            bucket.speed_up()
\ No newline at end of file
@@ -1,91 +1,381 @@
 import googlemaps
 import time
-import random
-from typing import List, Optional, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Iterable, List, Optional, Dict, Any, Tuple
 from models.restaurant import Restaurant
+from models.cache import GeocodeCache, PlaceDetailsCache
+from models.journal import RunJournal
 from config.settings import get_settings
+from controllers.coverage import AdaptiveCoverage
+from controllers.rate_limiter import RateLimiter
 import logging
 
+class SeenPlaces:
+    """Registro de place_id ya procesados en la ejecución, compartido entre hilos"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postal_codes: Dict[str, List[str]] = {}
+        # Reclamaciones de los códigos postales en seguimiento: place_id -> si era la primera vez
+        self._tracked: Dict[str, Dict[str, bool]] = {}
+        # Códigos postales de lugares liberados, que hereda el siguiente en reclamarlos
+        self._released: Dict[str, List[str]] = {}
+    
+    def claim(self, place_id: str, postal_code: str) -> Tuple[bool, List[str]]:
+        """
+        Registra que un lugar aparece en un código postal
+        Devuelve si es la primera vez que se ve y la lista (compartida) de sus códigos postales
+        """
+        with self._lock:
+            postal_codes = self._postal_codes.get(place_id)
+            if postal_codes is not None:
+                if postal_code not in postal_codes:
+                    postal_codes.append(postal_code)
+                    self._record(postal_code, place_id, False)
+                return False, postal_codes
+            
+            postal_codes = self._released.pop(place_id, [])
+            if postal_code not in postal_codes:
+                postal_codes.append(postal_code)
+            self._postal_codes[place_id] = postal_codes
+            self._record(postal_code, place_id, True)
+            return True, postal_codes
+    
+    def _record(self, postal_code: str, place_id: str, is_new: bool):
+        claims = self._tracked.get(postal_code)
+        if claims is not None:
+            claims.setdefault(place_id, is_new)
+    
+    def track(self, postal_code: str):
+        """Empieza a anotar las reclamaciones de un código postal (p.ej. un trabajo de la cola)"""
+        with self._lock:
+            self._tracked[postal_code] = {}
+    
+    def revisited(self, postal_code: str) -> List[str]:
+        """Lugares en seguimiento que el código postal encontró ya vistos desde otro código"""
+        with self._lock:
+            return [place_id for place_id, is_new in self._tracked.get(postal_code, {}).items() if not is_new]
+    
+    def untrack(self, postal_code: str, release: bool = False):
+        """
+        Deja de anotar las reclamaciones del código postal
+        Con release las deshace: olvida los lugares que reclamó primero y lo quita de los demás,
+        para que un reintento vuelva a devolverlos todos
+        """
+        with self._lock:
+            claims = self._tracked.pop(postal_code, {})
+            if not release:
+                return
+            for place_id, is_new in claims.items():
+                postal_codes = self._postal_codes.get(place_id)
+                if postal_codes is not None and postal_code in postal_codes:
+                    postal_codes.remove(postal_code)
+                if is_new:
+                    self._release(place_id)
+    
+    def restore(self, place_id: str, postal_codes: List[str]):
+        """Registra un lugar obtenido en una ejecución anterior (reanudación desde el diario)"""
+        with self._lock:
+            self._released.pop(place_id, None)
+            self._postal_codes[place_id] = postal_codes
+    
+    def release(self, place_id: str):
+        """
+        Olvida un lugar cuyos detalles no se pudieron obtener, para reintentarlo
+        Los códigos postales anotados mientras tanto los hereda el siguiente que lo reclame
+        """
+        with self._lock:
+            self._release(place_id)
+    
+    def _release(self, place_id: str):
+        postal_codes = self._postal_codes.pop(place_id, None)
+        if postal_codes:
+            self._released[place_id] = postal_codes
+    
+    def __contains__(self, place_id: str) -> bool:
+        with self._lock:
+            return place_id in self._postal_codes
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._postal_codes)
+
 class GoogleMapsClient:
     """Cliente para interactuar con Google Maps API"""
     
-    def __init__(self, api_key: str):
-        self.client = googlemaps.Client(key=api_key)
+    DETAILS_FIELDS = ['name', 'formatted_address', 'formatted_phone_number',
+                      'rating', 'user_ratings_total', 'type', 'opening_hours',
+                      'website', 'geometry']
+    # Campos que Nearby Search no devuelve: los únicos que se piden en el modo 'contact'
+    CONTACT_FIELDS = ['formatted_phone_number', 'website', 'opening_hours']
+    # 'full': Place Details completo; 'contact': Nearby + solo contacto; 'nearby': sin Place Details
+    DETAILS_MODES = ('full', 'contact', 'nearby')
+    
+    def __init__(self, api_key: str, rate_limiter: Optional[RateLimiter] = None,
+                 geocode_cache: Optional[GeocodeCache] = None,
+                 details_cache: Optional[PlaceDetailsCache] = None,
+                 journal: Optional[RunJournal] = None):
         self.settings = get_settings()
+        # Servidor alternativo (p.ej. benchmarks.fake_maps_server para pruebas de carga sin cuota)
+        client_options = {'base_url': self.settings.GOOGLE_MAPS_BASE_URL} if self.settings.GOOGLE_MAPS_BASE_URL else {}
+        # Los OVER_QUERY_LIMIT los gestiona nuestro rate limiter, no el reintento interno
+        self.client = googlemaps.Client(key=api_key, retry_over_query_limit=False, **client_options)
+        if self.settings.DETAILS_MODE not in self.DETAILS_MODES:
+            raise ValueError(f"DETAILS_MODE no soportado: {self.settings.DETAILS_MODE}")
+        # Rate limit global compartido por todos los hilos que usan este cliente
+        self.rate_limiter = rate_limiter or RateLimiter.from_settings(self.settings)
+        self.geocode_cache = geocode_cache or GeocodeCache.from_settings(self.settings)
+        self.details_cache = details_cache or PlaceDetailsCache.from_settings(self.settings)
+        # place_id vistos en toda la ejecución, para no repetir Place Details entre códigos postales
+        self.seen_places = SeenPlaces()
+        # Diario de la ejecución para poder reanudarla tras una caída
+        self.journal = journal
+        if journal is not None:
+            for place_id, postal_codes in journal.seen_places():
+                self.seen_places.restore(place_id, postal_codes)
+        # Pool acotado para las peticiones de Place Details en vuelo
+        self._details_executor = ThreadPoolExecutor(max_workers=self.settings.MAX_DETAILS_WORKERS)
+        # Sondeo de next_page_token (uno en curso por código postal)
+        self._pages_executor = ThreadPoolExecutor(max_workers=self.settings.MAX_WORKERS)
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
     
-    def search_restaurants_by_postal_code(self, postal_code: str) -> List[Restaurant]:
+    def close(self):
+        """Termina los pools de Place Details y de paginación y cierra las caches y el diario"""
+        self._details_executor.shutdown()
+        self._pages_executor.shutdown()
+        for resource in (self.geocode_cache, self.details_cache, self.journal):
+            if resource is not None:
+                resource.close()
+    
+    def __enter__(self) -> 'GoogleMapsClient':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def search_restaurants_by_postal_code(self, postal_code: str, raise_errors: bool = False) -> List[Restaurant]:
         """
         Busca restaurantes por código postal
-        Implementa rate limiting y manejo de errores
+        Implementa rate limiting y manejo de errores (con raise_errors los errores se propagan en lugar
+        de devolver los resultados parciales, p.ej. para que la cola distribuida reintente el trabajo)
+        El área se cubre con teselas adaptativas: las que llegan al límite de resultados se subdividen
+        Con diario, cada página queda guardada y un código postal terminado no repite ninguna llamada
         """
         restaurants = []
         
         try:
-            # Búsqueda inicial
-            query = f"restaurants in {postal_code}"
+            page_token = None
+            coverage = None
+            if self.journal is not None:
+                state = self.journal.start(postal_code)
+                finished = state['pages'] and not state['next_page_token'] and not state['coverage']
+                if state['status'] == 'done' or finished:
+                    self.journal.complete(postal_code)
+                    return self.journal.restaurants(postal_code)
+                page_token = state['next_page_token']
+                if state['coverage']:
+                    coverage = AdaptiveCoverage.from_state(state['coverage'], **self._coverage_limits())
             
-            # Rate limiting
-            self._apply_rate_limit()
+            if coverage is None:
+                location = self._get_location_from_postal_code(postal_code)
+                coverage = AdaptiveCoverage(location, self.settings.SEARCH_RADIUS, **self._coverage_limits())
             
-            # Búsqueda con Places API
-            places_result = self.client.places_nearby(
-                location=self._get_location_from_postal_code(postal_code),
-                radius=5000,  # 5km
-                type='restaurant'
-            )
+            while coverage.current is not None:
+                restaurants.extend(self._search_tile(coverage, postal_code, page_token))
+                page_token = None
             
-            for place in places_result.get('results', []):
-                restaurant = self._extract_restaurant_data(place, postal_code)
-                if restaurant:
-                    restaurants.append(restaurant)
+            if coverage.saturated:
+                self.logger.info(f"{postal_code}: {coverage.searches} búsquedas Nearby "
+                                 f"({coverage.saturated} teselas saturadas subdivididas)")
             
-            # Manejar paginación si hay más resultados
-            while 'next_page_token' in places_result:
-                self._apply_rate_limit(delay=2)  # Delay extra para next_page_token
-                
-                places_result = self.client.places_nearby(
-                    page_token=places_result['next_page_token']
-                )
-                
-                for place in places_result.get('results', []):
-                    restaurant = self._extract_restaurant_data(place, postal_code)
-                    if restaurant:
-                        restaurants.append(restaurant)
+            if self.journal is not None:
+                # Incluye las páginas guardadas en ejecuciones anteriores
+                self.journal.complete(postal_code)
+                return self.journal.restaurants(postal_code)
         
         except googlemaps.exceptions.ApiError as e:
             self.logger.error(f"Error de API: {e}")
+            self._journal_failure(postal_code, e)
+            if raise_errors:
+                raise
         except Exception as e:
             self.logger.error(f"Error inesperado: {e}")
+            self._journal_failure(postal_code, e)
+            if raise_errors:
+                raise
         
         return restaurants
     
+    def _coverage_limits(self) -> Dict[str, float]:
+        """Límite de resultados de una búsqueda y radio mínimo de tesela según la configuración"""
+        if not self.settings.ADAPTIVE_TILING:
+            return {'saturation': self.settings.MAX_RESULTS_PER_POSTAL_CODE, 'min_radius': float('inf')}
+        return {'saturation': self.settings.MAX_RESULTS_PER_POSTAL_CODE, 'min_radius': self.settings.MIN_TILE_RADIUS}
+    
+    def _search_tile(self, coverage: AdaptiveCoverage, postal_code: str,
+                     page_token: Optional[str] = None) -> List[Restaurant]:
+        """Busca todas las páginas de la tesela en curso (retomando page_token si viene del diario)"""
+        restaurants = []
+        places_result = self._resume_page(page_token) if page_token else None
+        
+        if places_result is None:
+            coverage.found = 0
+            tile = coverage.current
+            # Búsqueda con Places API
+            places_result = self._call_api(
+                'places_nearby',
+                location=coverage.location(tile),
+                radius=round(tile.radius),
+                type='restaurant'
+            )
+        
+        while True:
+            coverage.record_page(len(places_result.get('results', [])))
+            page_token = places_result.get('next_page_token')
+            if page_token is None:
+                coverage.finish_tile()
+            
+            # La página siguiente se sondea mientras se obtienen los detalles de esta
+            next_page = self._pages_executor.submit(self._fetch_next_page, page_token) if page_token else None
+            restaurants.extend(self._process_page(places_result, postal_code, coverage))
+            
+            if next_page is None:
+                return restaurants
+            places_result = next_page.result()
+    
+    def _fetch_next_page(self, page_token: str) -> Dict[str, Any]:
+        """
+        Pide la página siguiente en cuanto su next_page_token es válido
+        El token tarda unos segundos en activarse y hasta entonces la API responde INVALID_REQUEST,
+        así que se sondea con un backoff corto en lugar de esperar un tiempo fijo
+        """
+        delay = self.settings.PAGE_TOKEN_POLL_INTERVAL
+        deadline = time.monotonic() + self.settings.PAGE_TOKEN_TIMEOUT
+        
+        while True:
+            time.sleep(delay)
+            try:
+                return self._call_api('places_nearby', page_token=page_token)
+            except googlemaps.exceptions.ApiError as e:
+                if e.status != 'INVALID_REQUEST' or time.monotonic() + delay > deadline:
+                    raise
+            delay = min(delay * 1.5, 2.0)
+    
+    def _resume_page(self, page_token: str) -> Optional[Dict[str, Any]]:
+        """
+        Retoma la paginación con el token guardado en el diario
+        Los tokens caducan a los pocos minutos: si ya no es válido se repite la búsqueda
+        (los lugares ya obtenidos no vuelven a pedir Place Details)
+        """
+        try:
+            return self._call_api('places_nearby', page_token=page_token)
+        except googlemaps.exceptions.ApiError as e:
+            if e.status != 'INVALID_REQUEST':
+                raise
+            self.logger.warning("⚠️ next_page_token del diario caducado, se repite la búsqueda")
+            return None
+    
+    def _process_page(self, places_result: Dict[str, Any], postal_code: str,
+                      coverage: Optional[AdaptiveCoverage] = None) -> List[Restaurant]:
+        """Extrae los restaurantes de una página y la guarda en el diario"""
+        restaurants = self._extract_page_restaurants(places_result, postal_code)
+        if self.journal is not None:
+            page_place_ids = [place['place_id'] for place in places_result.get('results', [])]
+            pending = coverage.to_state() if coverage is not None and coverage.current is not None else None
+            self.journal.save_page(postal_code, places_result.get('next_page_token'), restaurants, page_place_ids,
+                                   coverage=pending)
+        return restaurants
+    
+    def _journal_failure(self, postal_code: str, error: Exception):
+        if self.journal is not None:
+            self.journal.fail(postal_code, str(error))
+    
     def _get_location_from_postal_code(self, postal_code: str) -> Dict[str, float]:
-        """Obtiene coordenadas del código postal"""
+        """Obtiene coordenadas del código postal (consultando antes la cache)"""
+        region = self.settings.GEOCODE_REGION
+        
+        if self.geocode_cache is not None:
+            cached = self.geocode_cache.get(postal_code, region)
+            if cached:
+                return cached
+        
         try:
-            geocode_result = self.client.geocode(postal_code)
+            params = {'address': postal_code}
+            if region:
+                params['region'] = region
+            
+            geocode_result = self._call_api('geocode', **params)
             if geocode_result:
                 location = geocode_result[0]['geometry']['location']
-                return {'lat': location['lat'], 'lng': location['lng']}
+                result = {'lat': location['lat'], 'lng': location['lng']}
+                
+                # Solo se cachean ubicaciones reales, nunca el fallback de error
+                if self.geocode_cache is not None:
+                    self.geocode_cache.set(postal_code, result, region)
+                return result
         except Exception as e:
             self.logger.error(f"Error obteniendo ubicación: {e}")
         
         return {'lat': 0, 'lng': 0}
     
-    def _extract_restaurant_data(self, place: Dict[str, Any], postal_code: str) -> Optional[Restaurant]:
+    def warm_geocode_cache(self, postal_codes: Iterable[str]) -> int:
+        """
+        Precarga la cache de geocoding para una lista de códigos postales
+        Devuelve cuántos códigos postales nuevos se han cacheado
+        """
+        if self.geocode_cache is None:
+            self.logger.warning("⚠️ Cache de geocoding desactivada, nada que precargar")
+            return 0
+        
+        region = self.settings.GEOCODE_REGION
+        pending = [code for code in postal_codes if self.geocode_cache.get(code, region) is None]
+        
+        with ThreadPoolExecutor(max_workers=self.settings.MAX_WORKERS) as executor:
+            locations = list(executor.map(self._get_location_from_postal_code, pending))
+        
+        cached = sum(1 for location in locations if location != {'lat': 0, 'lng': 0})
+        self.logger.info(f"✅ Cache de geocoding precargada con {cached} códigos postales")
+        return cached
+    
+    def _extract_page_restaurants(self, places_result: Dict[str, Any], postal_code: str) -> List[Restaurant]:
+        """
+        Obtiene los detalles de una página de resultados en paralelo
+        Conserva el orden original y descarta solo los lugares que fallan
+        Los lugares ya obtenidos en otro código postal solo anotan este código
+        """
+        new_places = []
+        for place in places_result.get('results', []):
+            is_new, postal_codes = self.seen_places.claim(place['place_id'], postal_code)
+            if is_new:
+                new_places.append((place, postal_codes))
+        
+        restaurants = self._details_executor.map(
+            lambda item: self._extract_restaurant_data(item[0], postal_code, item[1]), new_places
+        )
+        
+        result = []
+        for (place, _), restaurant in zip(new_places, restaurants):
+            if restaurant:
+                result.append(restaurant)
+            else:
+                self.seen_places.release(place['place_id'])
+        return result
+    
+    def _extract_restaurant_data(self, place: Dict[str, Any], postal_code: str,
+                                 postal_codes: Optional[List[str]] = None) -> Optional[Restaurant]:
         """Extrae datos del restaurante desde la respuesta de la API"""
         try:
-            # Obtener detalles adicionales del lugar
-            place_details = self.client.place(
-                place_id=place['place_id'],
-                fields=['name', 'formatted_address', 'formatted_phone_number', 
-                       'rating', 'user_ratings_total', 'type', 'opening_hours',  
-                       'website', 'geometry']
-            )['result']
+            if self.settings.DETAILS_MODE != 'full':
+                restaurant = self._restaurant_from_nearby(place, postal_code, postal_codes)
+                if self.settings.DETAILS_MODE == 'contact':
+                    restaurant = self._hydrate(restaurant)
+                return restaurant
             
-            # Rate limiting para details
-            self._apply_rate_limit()
+            # Obtener detalles adicionales del lugar
+            place_details = self._get_place_details(place['place_id'], self.DETAILS_FIELDS)
             
             restaurant = Restaurant(
                 name=place_details.get('name', 'N/A'),
@@ -98,20 +388,100 @@ class GoogleMapsClient:
                 business_hours=self._extract_business_hours(place_details.get('opening_hours')),
                 website=place_details.get('website'),
                 latitude=place_details.get('geometry', {}).get('location', {}).get('lat'),
-                longitude=place_details.get('geometry', {}).get('location', {}).get('lng')
+                longitude=place_details.get('geometry', {}).get('location', {}).get('lng'),
+                place_id=place['place_id'],
+                postal_codes=postal_codes
             )
             
             return restaurant
-            
+        
         except Exception as e:
             self.logger.error(f"Error extrayendo datos del restaurante: {e}")
             return None
     
-    def _apply_rate_limit(self, delay: Optional[float] = None):
-        """Aplica rate limiting entre requests"""
-        if delay is None:
-            delay = random.uniform(0.1, 0.5)  # Delay aleatorio
-        time.sleep(delay)
+    def _restaurant_from_nearby(self, place: Dict[str, Any], postal_code: str,
+                                postal_codes: Optional[List[str]] = None) -> Restaurant:
+        """
+        Construye el restaurante solo con el resultado de Nearby Search
+        Nearby no devuelve teléfono, web ni horarios, y la dirección es la abreviada (vicinity)
+        """
+        location = place.get('geometry', {}).get('location', {})
+        return Restaurant(
+            name=place.get('name', 'N/A'),
+            address=place.get('vicinity') or place.get('formatted_address', 'N/A'),
+            postal_code=postal_code,
+            rating=place.get('rating'),
+            review_count=place.get('user_ratings_total'),
+            cuisine_type=self._extract_cuisine_type(place.get('types', [])),
+            latitude=location.get('lat'),
+            longitude=location.get('lng'),
+            place_id=place['place_id'],
+            postal_codes=postal_codes
+        )
+    
+    def _hydrate(self, restaurant: Restaurant) -> Restaurant:
+        """Completa un restaurante construido desde Nearby con los campos de contacto de Place Details"""
+        place_details = self._get_place_details(restaurant.place_id, self.CONTACT_FIELDS)
+        return replace(
+            restaurant,
+            phone=place_details.get('formatted_phone_number'),
+            website=place_details.get('website'),
+            business_hours=self._extract_business_hours(place_details.get('opening_hours'))
+        )
+    
+    def hydrate_contact_details(self, restaurants: Iterable[Restaurant]) -> List[Restaurant]:
+        """
+        Completa bajo demanda teléfono, web y horarios de restaurantes obtenidos en modo 'nearby'
+        (p.ej. solo los que se van a usar); los que fallan se devuelven sin cambios
+        """
+        def hydrate(restaurant: Restaurant) -> Restaurant:
+            try:
+                return self._hydrate(restaurant)
+            except Exception as e:
+                self.logger.error(f"Error obteniendo contacto de {restaurant.place_id}: {e}")
+                return restaurant
+        
+        return list(self._details_executor.map(hydrate, restaurants))
+    
+    def _get_place_details(self, place_id: str, fields: List[str]) -> Dict[str, Any]:
+        """
+        Obtiene Place Details consultando antes la cache
+        Solo se piden a la API los grupos de campos ausentes o caducados
+        """
+        if self.details_cache is None:
+            return self._call_api('place', place_id=place_id, fields=fields)['result']
+        
+        cached, missing = self.details_cache.lookup(place_id, fields)
+        if not missing:
+            return cached
+        
+        fetched = self._call_api('place', place_id=place_id, fields=missing)['result']
+        self.details_cache.store(place_id, missing, fetched)
+        return {**cached, **fetched}
+    
+    def _call_api(self, endpoint: str, **kwargs) -> Any:
+        """
+        Llama a un endpoint de Google Maps respetando su rate limit
+        Ante OVER_QUERY_LIMIT aplica backoff adaptativo y reintenta
+        """
+        method = getattr(self.client, endpoint)
+        max_retries = self.settings.RATE_LIMIT_MAX_RETRIES
+        
+        for attempt in range(max_retries + 1):
+            self.rate_limiter.acquire(endpoint)
+            
+            try:
+                result = method(**kwargs)
+            except googlemaps.exceptions.ApiError as e:
+                if e.status != 'OVER_QUERY_LIMIT' or attempt == max_retries:
+                    raise
+                
+                backoff = self.rate_limiter.report_over_query_limit(endpoint)
+                self.logger.warning(f"⚠️ OVER_QUERY_LIMIT en {endpoint}, reintentando en {backoff:.1f}s")
+                continue
+            
+            self.rate_limiter.report_success(endpoint)
+            return result
     
     def _extract_cuisine_type(self, place_types: List[str]) -> Optional[str]:
         """Extrae tipo de cocina de los tipos del lugar"""
@@ -0,0 +1,142 @@
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from controllers.scraper_controller import GoogleMapsClient
+from models.batch import RestaurantBatch
+from models.database import DatabaseManager
+from models.job_queue import JobQueue
+from models.restaurant import Restaurant
+
+def default_worker_id() -> str:
+    """Identificador único del worker en el cluster: host y pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class QueueWorker:
+    """
+    Worker de la cola distribuida: toma códigos postales de la cola, los busca y guarda los
+    restaurantes en MongoDB
+    Mientras busca mantiene vivo el lease con heartbeats; si lo pierde (p.ej. tras una pausa larga
+    y otro worker lo ha retomado) descarta sus resultados. El upsert por place_id hace que repetir
+    un trabajo no duplique restaurantes
+    """
+    
+    def __init__(self, queue: JobQueue, scraper: GoogleMapsClient, db_manager: DatabaseManager, view,
+                 worker_id: Optional[str] = None, heartbeat_interval: float = 60, poll_interval: float = 5):
+        self.queue = queue
+        self.scraper = scraper
+        self.db_manager = db_manager
+        self.view = view
+        self.worker_id = worker_id or default_worker_id()
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        
+        self.completed = 0
+        self.failed: List[str] = []
+        self.lost: List[str] = []
+        self.restaurants_total = 0
+        self.mongodb_summary = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+    
+    def run(self, wait: bool = False, max_jobs: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Procesa trabajos hasta vaciar la cola (o indefinidamente con wait=True) y devuelve el resumen
+        """
+        started = time.monotonic()
+        processed = 0
+        
+        while max_jobs is None or processed < max_jobs:
+            postal_code = self.queue.lease(self.worker_id)
+            if postal_code is None:
+                if not wait:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            
+            self.process(postal_code)
+            processed += 1
+        
+        summary = {
+            'worker': self.worker_id,
+            'completed': self.completed,
+            'failed': len(self.failed),
+            'failed_postal_codes': self.failed,
+            'lost_leases': self.lost,
+            'restaurants_total': self.restaurants_total,
+            'mongodb': self.mongodb_summary,
+            'elapsed_s': round(time.monotonic() - started, 3),
+            'queue': self.queue.progress(),
+        }
+        self.view.show_statistics(summary)
+        return summary
+    
+    def process(self, postal_code: str) -> bool:
+        """Procesa un trabajo ya tomado; devuelve si se completó"""
+        # El registro de lugares vistos es del worker: un lugar ya guardado desde otro código no repite
+        # Place Details, solo se le añade este código en MongoDB ($addToSet). Si el trabajo no se
+        # completa se deshacen sus reclamaciones, para que el reintento devuelva todos sus lugares
+        seen_places = self.scraper.seen_places
+        seen_places.track(postal_code)
+        release = True
+        
+        # El heartbeat arranca lo último: cualquier fallo anterior no deja el lease renovándose
+        stop = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(postal_code, stop, lost), daemon=True)
+        heartbeat.start()
+        
+        try:
+            restaurants = self.scraper.search_restaurants_by_postal_code(postal_code, raise_errors=True)
+            if lost.is_set():
+                raise _LeaseLost()
+            self._save(restaurants)
+            self._merge_postal_code(postal_code, seen_places.revisited(postal_code))
+            release = False
+        except _LeaseLost:
+            self.lost.append(postal_code)
+            self.view.show_error(f"Lease perdido para {postal_code}, resultados descartados",
+                                 postal_code=postal_code, worker=self.worker_id)
+            return False
+        except Exception as e:
+            self.failed.append(postal_code)
+            self.queue.fail(postal_code, self.worker_id, str(e))
+            self.view.show_error(f"Error procesando {postal_code}: {e}", postal_code=postal_code,
+                                 worker=self.worker_id)
+            return False
+        finally:
+            seen_places.untrack(postal_code, release=release)
+            stop.set()
+            heartbeat.join()
+        
+        if not self.queue.complete(postal_code, self.worker_id, len(restaurants)):
+            # El lease caducó justo al terminar: otro worker lo repetirá (los upserts son idempotentes)
+            self.lost.append(postal_code)
+            return False
+        
+        self.completed += 1
+        self.restaurants_total += len(restaurants)
+        self.view.show_postal_code_progress(self.completed, None, postal_code, len(restaurants),
+                                            worker=self.worker_id, restaurants_total=self.restaurants_total)
+        return True
+    
+    def _heartbeat(self, postal_code: str, stop: threading.Event, lost: threading.Event):
+        while not stop.wait(self.heartbeat_interval):
+            if not self.queue.heartbeat(postal_code, self.worker_id):
+                lost.set()
+                return
+    
+    def _save(self, restaurants: List[Restaurant]):
+        if not restaurants:
+            return
+        batch = RestaurantBatch.from_restaurants(restaurants)
+        summary = self.db_manager.save_to_mongodb(batch.iter_dicts())
+        for key in self.mongodb_summary:
+            self.mongodb_summary[key] += summary.get(key, 0)
+    
+    def _merge_postal_code(self, postal_code: str, place_ids: List[str]):
+        """Anota el código postal en los restaurantes que ya se guardaron desde otro código"""
+        if place_ids:
+            self.db_manager.add_postal_code(place_ids, postal_code)
+
+class _LeaseLost(Exception):
+    """El lease del trabajo caducó y pasó a otro worker"""
@@ -4,24 +4,227 @@ Arquitectura MVC implementada
 """
 
 from controllers.scraper_controller import GoogleMapsClient
-from controllers.data_controller import DataController
+from controllers.batch_controller import SINKS, BatchController, read_postal_codes
+from controllers.data_controller import OUTPUT_DIR, DataController, IncrementalExporter
+from controllers.worker_controller import QueueWorker
 from views.console_view import ConsoleView
+from views.json_progress_view import JsonProgressView
 from config.settings import get_settings
+from models.batch import RestaurantBatch
+from models.database import DatabaseManager
+from models.journal import RunJournal
+from models.restaurant import Restaurant
+from models.statistics import RestaurantStats
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional
+import argparse
+import json
+import os
 import sys
 
-def main():
+def scrape_postal_codes(scraper: GoogleMapsClient, postal_codes: List[str],
+                        view: ConsoleView, max_workers: int = 1,
+                        on_result: Optional[Callable[[str, List[Restaurant]], None]] = None,
+                        collect: bool = True) -> List[Restaurant]:
+    """
+    Busca restaurantes de varios códigos postales en paralelo
+    Los resultados se combinan en el orden de entrada, no en el de finalización
+    on_result se llama con cada código postal en cuanto termina (p.ej. exportación incremental)
+    Con collect=False no se retienen los resultados (on_result los consume) y se devuelve una lista vacía
+    """
+    results = [[] for _ in postal_codes]
+    total = len(postal_codes)
+    
+    view.show_progress(f"Buscando restaurantes en {total} códigos postales ({max_workers} workers)...")
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(scraper.search_restaurants_by_postal_code, postal_code): index
+            for index, postal_code in enumerate(postal_codes)
+        }
+        
+        for completed, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            postal_code = postal_codes[index]
+            
+            try:
+                restaurants = future.result()
+                if collect:
+                    results[index] = restaurants
+                if on_result:
+                    on_result(postal_code, restaurants)
+                view.show_postal_code_progress(completed, total, postal_code, len(restaurants))
+            except Exception as e:
+                view.show_error(f"Error procesando {postal_code}: {e}")
+    
+    all_restaurants = []
+    for restaurants in results:
+        all_restaurants.extend(restaurants)
+    
+    return all_restaurants
+
+def _parse_sinks(value: str) -> List[str]:
+    sinks = [sink.strip() for sink in value.split(',') if sink.strip()]
+    unknown = sorted(set(sinks) - set(SINKS))
+    if unknown:
+        raise argparse.ArgumentTypeError(f"destinos no soportados: {', '.join(unknown)}")
+    return sinks
+
+def _open_journal(path: Optional[str]) -> Optional[RunJournal]:
+    """Abre (o crea) el diario de la ejecución; si ya existe, la ejecución se reanuda donde se quedó"""
+    return RunJournal(path) if path else None
+
+def run_batch(args: argparse.Namespace, settings) -> int:
+    """Modo batch: lee los códigos en streaming y emite el progreso como líneas JSON; devuelve el exit code"""
+    view = JsonProgressView()
+    sinks = args.sinks
+    if sinks is None:
+        sinks = ['mongodb', 'csv', 'ndjson'] + (['parquet'] if settings.EXPORT_PARQUET else [])
+    
+    scraper = GoogleMapsClient(settings.GOOGLE_MAPS_API_KEY, journal=_open_journal(args.journal))
+    controller = BatchController(
+        scraper,
+        DataController(output_dir=args.output_dir),
+        view,
+        sinks=sinks,
+        max_workers=args.workers or settings.MAX_WORKERS
+    )
+    
+    try:
+        if args.input == '-':
+            summary = controller.run(read_postal_codes(sys.stdin))
+        else:
+            with open(args.input, encoding='utf-8') as f:
+                summary = controller.run(read_postal_codes(f))
+    finally:
+        scraper.close()
+    
+    return 1 if summary['failed'] else 0
+
+def run_queue_command(args: argparse.Namespace, settings) -> int:
+    """
+    Modo cola distribuida: encola códigos, muestra el estado de la cola o ejecuta un worker
+    Todo se coordina en MongoDB, así que se pueden lanzar workers en tantos hosts como se quiera
+    """
+    view = JsonProgressView()
+    db_manager = DatabaseManager()
+    queue = db_manager.get_job_queue()
+    if queue is None:
+        view.show_error("MongoDB no disponible: la cola de trabajos necesita MongoDB")
+        return 1
+    
+    try:
+        if args.enqueue:
+            if args.enqueue == '-':
+                enqueued = queue.enqueue(read_postal_codes(sys.stdin))
+            else:
+                with open(args.enqueue, encoding='utf-8') as f:
+                    enqueued = queue.enqueue(read_postal_codes(f))
+            view.show_statistics({'enqueued': enqueued, 'queue': queue.progress()})
+            return 0
+        
+        if args.queue_status:
+            view.show_statistics({'queue': queue.progress()})
+            return 0
+        
+        scraper = GoogleMapsClient(settings.GOOGLE_MAPS_API_KEY)
+        try:
+            worker = QueueWorker(queue, scraper, db_manager, view, heartbeat_interval=settings.JOB_HEARTBEAT_SECONDS)
+            summary = worker.run(wait=args.wait)
+        finally:
+            scraper.close()
+        return 1 if summary['failed'] else 0
+    finally:
+        db_manager.close_connections()
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    """Parsea los argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Scraper de restaurantes por código postal")
+    parser.add_argument('--warm-geocode-cache', metavar='FICHERO',
+                        help="Precarga la cache de geocoding con los códigos postales del fichero (uno por línea) y termina")
+    parser.add_argument('--database-report', action='store_true',
+                        help="Genera el reporte de estadísticas de todo el histórico de MongoDB y termina")
+    parser.add_argument('--journal', metavar='FICHERO',
+                        help="Diario SQLite de la ejecución: si existe, se reanuda sin repetir llamadas ya hechas")
+    parser.add_argument('--journal-status', metavar='FICHERO',
+                        help="Muestra en JSON el progreso guardado en un diario y termina")
+    
+    # Modo batch no interactivo (cron, contenedores)
+    batch = parser.add_argument_group("modo batch")
+    batch.add_argument('--input', metavar='FICHERO',
+                       help="Procesa sin preguntar los códigos postales del fichero (uno por línea, '-' para stdin)")
+    batch.add_argument('--workers', type=int, help="Códigos postales procesados en paralelo (por defecto MAX_WORKERS)")
+    batch.add_argument('--output-dir', default=OUTPUT_DIR, help="Directorio de salida de CSV, JSON y Parquet")
+    batch.add_argument('--sinks', type=_parse_sinks, default=None,
+                       help=f"Destinos separados por comas entre {','.join(SINKS)} (por defecto mongodb,csv,ndjson "
+                            "y parquet si EXPORT_PARQUET)")
+    
+    # Cola de trabajos distribuida en MongoDB (varios workers en varios hosts)
+    queue = parser.add_argument_group("cola distribuida")
+    queue.add_argument('--enqueue', metavar='FICHERO',
+                       help="Encola los códigos postales del fichero (uno por línea, '-' para stdin) y termina")
+    queue.add_argument('--worker', action='store_true',
+                       help="Procesa trabajos de la cola hasta vaciarla y guarda los restaurantes en MongoDB")
+    queue.add_argument('--wait', action='store_true', help="Con --worker, sigue esperando trabajos nuevos")
+    queue.add_argument('--queue-status', action='store_true', help="Muestra en JSON el estado de la cola y termina")
+    return parser.parse_args(argv)
+
+def main(argv: List[str] = None):
     """Función principal de la aplicación"""
     
+    args = parse_args(argv)
+    
     # Inicializar componentes MVC
     view = ConsoleView()
     settings = get_settings()
     
+    # Progreso de una ejecución con diario (no necesita la API de Google Maps)
+    if args.journal_status:
+        if not os.path.exists(args.journal_status):
+            view.show_error(f"No existe el diario {args.journal_status}")
+            sys.exit(1)
+        journal = RunJournal(args.journal_status)
+        print(json.dumps(journal.progress(), ensure_ascii=False))
+        journal.close()
+        return
+    
+    # Reporte histórico calculado en MongoDB (no necesita la API de Google Maps)
+    if args.database_report:
+        report = DataController(output_dir=args.output_dir).generate_database_report()
+        if report is None:
+            sys.exit(1)
+        view.show_statistics(report['resumen_general'])
+        return
+    
+    # Encolar o consultar la cola distribuida (no necesita la API de Google Maps)
+    if args.enqueue or args.queue_status:
+        sys.exit(run_queue_command(args, settings))
+    
     # Verificar API key
     if not settings.GOOGLE_MAPS_API_KEY:
         view.show_error("API Key de Google Maps no configurada")
         view.show_error("Configura GOOGLE_MAPS_API_KEY en el archivo .env")
         sys.exit(1)
     
+    # Precarga de la cache de geocoding (sin scraping)
+    if args.warm_geocode_cache:
+        with open(args.warm_geocode_cache, encoding='utf-8') as f:
+            postal_codes = [line.strip() for line in f if line.strip()]
+        
+        view.show_progress(f"Precargando cache de geocoding para {len(postal_codes)} códigos postales...")
+        with GoogleMapsClient(settings.GOOGLE_MAPS_API_KEY) as scraper:
+            cached = scraper.warm_geocode_cache(postal_codes)
+        view.show_success(f"Cache de geocoding precargada: {cached} códigos postales nuevos")
+        return
+    
+    # Worker de la cola distribuida
+    if args.worker:
+        sys.exit(run_queue_command(args, settings))
+    
+    # Modo batch no interactivo
+    if args.input:
+        sys.exit(run_batch(args, settings))
+    
     # Mostrar mensaje de bienvenida
     view.show_welcome_message()
     
@@ -33,39 +236,74 @@ def main():
         sys.exit(1)
     
     # Inicializar controladores
-    scraper = GoogleMapsClient(settings.GOOGLE_MAPS_API_KEY)
+    scraper = GoogleMapsClient(settings.GOOGLE_MAPS_API_KEY, journal=_open_journal(args.journal))
     data_controller = DataController()
     
-    all_restaurants = []
+    # Exportación incremental: CSV/NDJSON se escriben mientras se sigue buscando
+    exporter = IncrementalExporter() if settings.STREAMING_EXPORT else None
+    # Estadísticas agregadas a medida que termina cada código postal
+    stats = RestaurantStats()
+    # Resultados en formato columnar por código postal (se unen en el orden de entrada); en modo
+    # streaming no se acumulan: cada código se guarda en cuanto termina y se descarta
+    batches = {postal_code: RestaurantBatch() for postal_code in postal_codes} if exporter is None else None
+    if exporter is not None:
+        # Un lugar ya guardado desde otro código no vuelve en los resultados: se anota para añadirle el código
+        for postal_code in postal_codes:
+            scraper.seen_places.track(postal_code)
     
-    # Procesar cada código postal
-    for postal_code in postal_codes:
-        view.show_progress(f"Buscando restaurantes en {postal_code}...")
+    def on_result(postal_code: str, restaurants: List[Restaurant]):
+        if exporter is None:
+            stats.add_many(restaurants)
+            batches[postal_code].extend(restaurants)
+            return
         
+        exporter.write(postal_code, restaurants)
+        batch = RestaurantBatch.from_restaurants(restaurants)
         try:
-            restaurants = scraper.search_restaurants_by_postal_code(postal_code)
-            all_restaurants.extend(restaurants)
-            
-            view.show_success(f"Encontrados {len(restaurants)} restaurantes en {postal_code}")
-            
+            data_controller.save_postal_code(postal_code, batch, scraper.seen_places.revisited(postal_code),
+                                             parquet=settings.EXPORT_PARQUET)
         except Exception as e:
-            view.show_error(f"Error procesando {postal_code}: {e}")
+            # Como en el guardado final: un fallo de MongoDB no detiene el scraping
+            view.show_error(f"Error guardando {postal_code}: {e}")
+        finally:
+            scraper.seen_places.untrack(postal_code)
+        stats.add_batch(batch)
     
-    # Procesar y guardar datos
-    if all_restaurants:
-        view.show_progress("Procesando y guardando datos...")
-        data_controller.process_and_save_data(all_restaurants, postal_codes)
-        view.show_success("Datos procesados y guardados exitosamente")
-        
-        # Mostrar estadísticas
-        stats = {
-            'total_restaurantes': len(all_restaurants),
-            'codigos_postales_analizados': postal_codes,
-            'rating_promedio': sum(r.rating for r in all_restaurants if r.rating) / len([r for r in all_restaurants if r.rating])
-        }
-        view.show_statistics(stats)
-    else:
+    # Procesar los códigos postales en paralelo
+    try:
+        scrape_postal_codes(scraper, postal_codes, view, settings.MAX_WORKERS, on_result=on_result, collect=False)
+    finally:
+        if exporter:
+            exporter.close()
+        # Los contadores de la cache siguen disponibles tras cerrarla
+        scraper.close()
+    
+    if exporter:
+        view.show_success(f"Exportados {exporter.count} restaurantes a CSV y NDJSON de forma incremental")
+    
+    if scraper.details_cache is not None:
+        cache_stats = scraper.details_cache.stats()
+        view.show_progress(f"Cache de Place Details: {cache_stats['hits']} aciertos, "
+                           f"{cache_stats['partial_hits']} parciales, {cache_stats['misses']} fallos")
+    
+    if not stats.total:
         view.show_error("No se encontraron restaurantes")
+        return
+    
+    # Procesar y guardar datos (en modo streaming ya está todo guardado salvo el reporte)
+    view.show_progress("Procesando y guardando datos...")
+    if exporter is None:
+        data_controller.process_and_save_data(RestaurantBatch.concat(batches.values()), postal_codes, stats=stats)
+    else:
+        data_controller.write_statistics_report(stats, postal_codes)
+    view.show_success("Datos procesados y guardados exitosamente")
+    
+    # Mostrar estadísticas (rating_promedio es 0 si ningún restaurante tiene rating)
+    view.show_statistics({
+        'total_restaurantes': stats.total,
+        'codigos_postales_analizados': postal_codes,
+        'rating_promedio': stats.rating_mean or 0
+    })
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
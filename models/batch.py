@@ -0,0 +1,311 @@
+import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+from models.restaurant import Restaurant, compact_hours
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow es opcional, solo lo usa to_arrow()
+    pa = None
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+def _to_numpy(buffer, dtype) -> np.ndarray:
+    """Copia un buffer interno a un array NumPy (el buffer puede seguir creciendo después)"""
+    return np.frombuffer(buffer, dtype=dtype).copy()
+
+def _object_array(values: List[Any]) -> np.ndarray:
+    """Array de objetos 1-D (np.array intentaría convertir tuplas y listas en dimensiones)"""
+    result = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        result[i] = value
+    return result
+
+class _StringColumn:
+    """Strings en un único buffer UTF-8 con offsets y máscara de validez, al estilo Arrow"""
+    
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array.array('q', [0])
+        self.valid = bytearray()
+    
+    def __len__(self) -> int:
+        return len(self.valid)
+    
+    def append(self, value: Optional[str]):
+        if value is not None:
+            self.data += value.encode('utf-8')
+        self.valid.append(value is not None)
+        self.offsets.append(len(self.data))
+    
+    def extend_from(self, other: '_StringColumn'):
+        shifted = _to_numpy(other.offsets, np.int64)[1:] + len(self.data)
+        self.data += other.data
+        self.offsets.frombytes(shifted.tobytes())
+        self.valid += other.valid
+    
+    def present(self) -> np.ndarray:
+        return _to_numpy(self.valid, np.bool_)
+    
+    def values(self, start: int = 0, stop: Optional[int] = None) -> List[Optional[str]]:
+        stop = len(self) if stop is None else stop
+        data, offsets, valid = self.data, self.offsets, self.valid
+        return [data[offsets[i]:offsets[i + 1]].decode('utf-8') if valid[i] else None
+                for i in range(start, stop)]
+    
+    def to_arrow(self) -> 'pa.Array':
+        validity = np.packbits(self.present(), bitorder='little')
+        return pa.LargeStringArray.from_buffers(
+            len(self), pa.py_buffer(_to_numpy(self.offsets, np.int64)), pa.py_buffer(bytes(self.data)),
+            pa.py_buffer(validity)
+        )
+
+class _CategoricalColumn:
+    """Valores repetidos codificados como índices (int32, -1 si falta) sobre una lista de categorías"""
+    
+    def __init__(self):
+        self.codes = array.array('i')
+        self.categories: List[Any] = []
+        self._index: Dict[Any, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    def _code(self, value: Any) -> int:
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+    
+    def append(self, value: Any):
+        self.codes.append(-1 if value is None else self._code(value))
+    
+    def extend_from(self, other: '_CategoricalColumn'):
+        # El último elemento traduce el -1 (nulo) de la otra columna
+        remap = np.array([self._code(value) for value in other.categories] + [-1], dtype=np.intc)
+        self.codes.frombytes(remap[other.codes_array()].tobytes())
+    
+    def codes_array(self) -> np.ndarray:
+        return _to_numpy(self.codes, np.intc)
+    
+    def present(self) -> np.ndarray:
+        return self.codes_array() >= 0
+    
+    def lookup(self, categories: Optional[List[Any]] = None) -> np.ndarray:
+        """Categorías (o su transformación) con None al final para los códigos -1"""
+        return _object_array(list(self.categories if categories is None else categories) + [None])
+
+class RestaurantBatch:
+    """
+    Contenedor columnar de restaurantes
+    Los campos numéricos y fechas se guardan en buffers compactos que se exponen como arrays NumPy,
+    los strings repetidos como categorías y el resto como un buffer UTF-8 con offsets.
+    Se construye de forma incremental con append/extend y lo consumen directamente las
+    exportaciones y las estadísticas, sin pasar por un diccionario por restaurante.
+    """
+    
+    STRING_FIELDS = ('name', 'address', 'phone', 'website', 'place_id')
+    CATEGORICAL_FIELDS = ('postal_code', 'cuisine_type', 'business_hours')
+    FLOAT_FIELDS = ('rating', 'latitude', 'longitude')
+    
+    def __init__(self):
+        self._strings = {name: _StringColumn() for name in self.STRING_FIELDS}
+        self._categoricals = {name: _CategoricalColumn() for name in self.CATEGORICAL_FIELDS}
+        self._floats = {name: array.array('d') for name in self.FLOAT_FIELDS}
+        self._review_count = array.array('q')
+        self._review_count_valid = bytearray()
+        self._scraped_at = array.array('q')  # microsegundos desde 1970-01-01
+        # Listas compartidas con SeenPlaces: pueden crecer después de añadir el restaurante
+        self._postal_codes: List[List[str]] = []
+    
+    @classmethod
+    def from_restaurants(cls, restaurants: Iterable[Union[Restaurant, Dict[str, Any]]]) -> 'RestaurantBatch':
+        """Crea un lote a partir de objetos Restaurant o de sus diccionarios"""
+        batch = cls()
+        batch.extend(restaurants)
+        return batch
+    
+    @classmethod
+    def concat(cls, batches: Iterable['RestaurantBatch']) -> 'RestaurantBatch':
+        """Une varios lotes en uno nuevo, en el orden recibido"""
+        result = cls()
+        for batch in batches:
+            result.extend_batch(batch)
+        return result
+    
+    def __len__(self) -> int:
+        return len(self._scraped_at)
+    
+    def append(self, restaurant: Union[Restaurant, Dict[str, Any]]):
+        """Añade un restaurante (objeto Restaurant o su diccionario)"""
+        if isinstance(restaurant, dict):
+            get = restaurant.get
+        else:
+            get = lambda field: getattr(restaurant, field, None)
+        
+        for name, column in self._strings.items():
+            column.append(get(name))
+        
+        self._categoricals['postal_code'].append(get('postal_code'))
+        self._categoricals['cuisine_type'].append(get('cuisine_type'))
+        self._categoricals['business_hours'].append(compact_hours(get('business_hours')))
+        
+        for name, column in self._floats.items():
+            value = get(name)
+            column.append(np.nan if value is None else float(value))
+        
+        review_count = get('review_count')
+        self._review_count.append(0 if review_count is None else int(review_count))
+        self._review_count_valid.append(review_count is not None)
+        
+        scraped_at = get('scraped_at') or datetime.now()
+        self._scraped_at.append((scraped_at - _EPOCH) // _MICROSECOND)
+        
+        postal_codes = get('postal_codes')
+        self._postal_codes.append(postal_codes if postal_codes is not None else [get('postal_code')])
+    
+    def extend(self, restaurants: Iterable[Union[Restaurant, Dict[str, Any]]]):
+        """Añade varios restaurantes"""
+        for restaurant in restaurants:
+            self.append(restaurant)
+    
+    def extend_batch(self, other: 'RestaurantBatch'):
+        """Añade las filas de otro lote columna a columna"""
+        for name, column in self._strings.items():
+            column.extend_from(other._strings[name])
+        for name, column in self._categoricals.items():
+            column.extend_from(other._categoricals[name])
+        for name, column in self._floats.items():
+            column.extend(other._floats[name])
+        self._review_count.extend(other._review_count)
+        self._review_count_valid += other._review_count_valid
+        self._scraped_at.extend(other._scraped_at)
+        self._postal_codes.extend(other._postal_codes)
+    
+    def numeric(self, name: str) -> np.ndarray:
+        """rating, latitude, longitude o review_count como float64 (NaN si falta)"""
+        if name == 'review_count':
+            values = _to_numpy(self._review_count, np.int64).astype(np.float64)
+            values[~_to_numpy(self._review_count_valid, np.bool_)] = np.nan
+            return values
+        return _to_numpy(self._floats[name], np.float64)
+    
+    def scraped_at(self) -> np.ndarray:
+        """Fechas de scraping como datetime64[us]"""
+        return _to_numpy(self._scraped_at, np.int64).view('datetime64[us]')
+    
+    def categorical(self, name: str) -> Tuple[np.ndarray, List[Any]]:
+        """Códigos (-1 si falta) y categorías de postal_code, cuisine_type o business_hours"""
+        column = self._categoricals[name]
+        return column.codes_array(), list(column.categories)
+    
+    def present(self, name: str) -> np.ndarray:
+        """Máscara booleana de las filas con valor en el campo"""
+        if name in self._strings:
+            return self._strings[name].present()
+        if name in self._categoricals:
+            return self._categoricals[name].present()
+        if name in ('postal_codes', 'scraped_at'):
+            return np.ones(len(self), dtype=np.bool_)
+        return ~np.isnan(self.numeric(name))
+    
+    def _hours_by_day(self) -> List[Optional[Dict[str, str]]]:
+        # Formato histórico {'day_N': texto}, una vez por horario distinto
+        return [{f"day_{i}": day for i, day in enumerate(hours)}
+                for hours in self._categoricals['business_hours'].categories]
+    
+    def to_frame(self) -> pd.DataFrame:
+        """
+        DataFrame con las columnas de Restaurant.to_dict() construido columna a columna
+        Las categorías repetidas (códigos postales, cocina, horarios) comparten el mismo objeto
+        """
+        columns: Dict[str, Any] = {}
+        for name in Restaurant.FIELDS:
+            if name in self._strings:
+                column = self._strings[name]
+                columns[name] = column.to_arrow().to_numpy(zero_copy_only=False) if pa is not None \
+                    else _object_array(column.values())
+            elif name in self._categoricals:
+                column = self._categoricals[name]
+                lookup = column.lookup(self._hours_by_day() if name == 'business_hours' else None)
+                columns[name] = lookup[column.codes_array()]
+            elif name == 'review_count':
+                columns[name] = pd.arrays.IntegerArray(_to_numpy(self._review_count, np.int64),
+                                                       ~_to_numpy(self._review_count_valid, np.bool_))
+            elif name == 'scraped_at':
+                columns[name] = self.scraped_at()
+            elif name == 'postal_codes':
+                columns[name] = _object_array(self._postal_codes)
+            else:
+                columns[name] = self.numeric(name)
+        
+        return pd.DataFrame(columns, columns=list(Restaurant.FIELDS))
+    
+    def to_arrow(self, schema: Optional['pa.Schema'] = None) -> 'pa.Table':
+        """Tabla Arrow construida desde los buffers (horarios como lista de textos por día)"""
+        if pa is None:
+            raise ImportError("RestaurantBatch.to_arrow requiere pyarrow")
+        
+        columns: Dict[str, 'pa.Array'] = {}
+        for name in Restaurant.FIELDS:
+            if name in self._strings:
+                columns[name] = self._strings[name].to_arrow()
+            elif name in self._categoricals:
+                codes, categories = self.categorical(name)
+                indices = pa.array(codes, mask=codes < 0)
+                if name == 'business_hours':
+                    columns[name] = pa.array(categories, type=pa.list_(pa.string())).take(indices)
+                else:
+                    columns[name] = pa.DictionaryArray.from_arrays(indices, pa.array(categories, type=pa.string()))
+            elif name == 'review_count':
+                columns[name] = pa.array(_to_numpy(self._review_count, np.int64),
+                                         mask=~_to_numpy(self._review_count_valid, np.bool_))
+            elif name == 'scraped_at':
+                columns[name] = pa.array(self.scraped_at())
+            elif name == 'postal_codes':
+                columns[name] = pa.array(self._postal_codes, type=pa.list_(pa.string()))
+            else:
+                columns[name] = pa.array(self.numeric(name), from_pandas=True)
+        
+        table = pa.table(columns)
+        return table.cast(schema) if schema is not None else table
+    
+    def iter_dicts(self, chunk_size: int = 10000) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre las filas con la forma de Restaurant.to_dict(), por bloques
+        Solo para consumidores orientados a documentos (JSON, MongoDB)
+        """
+        # Arrays completos una sola vez; cada bloque convierte solo su tramo a objetos Python
+        arrays: Dict[str, Any] = {}
+        for name in Restaurant.FIELDS:
+            if name in self._categoricals:
+                column = self._categoricals[name]
+                lookup = column.lookup(self._hours_by_day() if name == 'business_hours' else None)
+                arrays[name] = lookup[column.codes_array()]
+            elif name == 'scraped_at':
+                arrays[name] = self.scraped_at().astype(object)
+            elif name in self.FLOAT_FIELDS or name == 'review_count':
+                arrays[name] = self.numeric(name)
+        
+        for start in range(0, len(self), chunk_size):
+            stop = min(start + chunk_size, len(self))
+            columns = []
+            for name in Restaurant.FIELDS:
+                if name in self._strings:
+                    values = self._strings[name].values(start, stop)
+                elif name == 'postal_codes':
+                    values = self._postal_codes[start:stop]
+                elif name in self.FLOAT_FIELDS:
+                    values = [None if value != value else value for value in arrays[name][start:stop].tolist()]
+                elif name == 'review_count':
+                    values = [None if value != value else int(value) for value in arrays[name][start:stop].tolist()]
+                else:
+                    values = arrays[name][start:stop].tolist()
+                columns.append(values)
+            
+            for row in zip(*columns):
+                yield dict(zip(Restaurant.FIELDS, row))
@@ -0,0 +1,268 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+def _connect_sqlite(path: str) -> sqlite3.Connection:
+    """Abre una base SQLite compartible entre hilos y procesos"""
+    if path != ':memory:':
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+    
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    if path != ':memory:':
+        # WAL permite lecturas concurrentes de varios procesos mientras uno escribe
+        conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+class GeocodeCache:
+    """
+    Cache persistente (SQLite) de coordenadas por código postal
+    Las entradas caducan tras `ttl` segundos y se expulsan por LRU al superar `max_entries`
+    """
+    
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = _connect_sqlite(path)
+        
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS geocode (
+                    key TEXT PRIMARY KEY,
+                    lat REAL NOT NULL,
+                    lng REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_geocode_last_used ON geocode (last_used)")
+    
+    @classmethod
+    def from_settings(cls, settings) -> Optional['GeocodeCache']:
+        """Crea la cache a partir de Settings (None si está desactivada)"""
+        if not settings.GEOCODE_CACHE_PATH:
+            return None
+        return cls(settings.GEOCODE_CACHE_PATH,
+                   ttl=settings.GEOCODE_CACHE_TTL_DAYS * 24 * 3600,
+                   max_entries=settings.GEOCODE_CACHE_MAX_ENTRIES)
+    
+    @staticmethod
+    def make_key(postal_code: str, region: Optional[str] = None) -> str:
+        """Normaliza código postal y región: 'sw1a  1aa' y 'SW1A 1AA' comparten entrada"""
+        normalized = ' '.join(postal_code.split()).upper()
+        return f"{normalized}|{(region or '').lower()}"
+    
+    def get(self, postal_code: str, region: Optional[str] = None) -> Optional[Dict[str, float]]:
+        """Devuelve las coordenadas cacheadas o None si no existen o han caducado"""
+        key = self.make_key(postal_code, region)
+        now = time.time()
+        
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT lat, lng, created_at FROM geocode WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            
+            lat, lng, created_at = row
+            if now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM geocode WHERE key = ?", (key,))
+                return None
+            
+            self._conn.execute("UPDATE geocode SET last_used = ? WHERE key = ?", (now, key))
+            return {'lat': lat, 'lng': lng}
+    
+    def set(self, postal_code: str, location: Dict[str, float], region: Optional[str] = None):
+        """Guarda las coordenadas de un código postal y aplica el límite LRU"""
+        key = self.make_key(postal_code, region)
+        now = time.time()
+        
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode (key, lat, lng, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, location['lat'], location['lng'], now, now)
+            )
+            
+            overflow = self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM geocode WHERE key IN "
+                    "(SELECT key FROM geocode ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,)
+                )
+    
+    def count(self) -> int:
+        """Número de códigos postales cacheados"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+    
+    def close(self):
+        """Cierra la conexión SQLite"""
+        with self._lock:
+            self._conn.close()
+
+# Agrupación de campos de Place Details: cada grupo tiene su propio TTL
+DETAILS_FIELD_GROUPS = {
+    'basic': ['name', 'formatted_address', 'type', 'geometry'],
+    'contact': ['formatted_phone_number', 'website', 'opening_hours'],
+    'atmosphere': ['rating', 'user_ratings_total'],
+}
+
+# Campos cuya clave en la respuesta no coincide con el nombre pedido
+_RESPONSE_ALIASES = {'type': 'types'}
+
+class PlaceDetailsCache:
+    """
+    Cache de Place Details por place_id: LRU en memoria delante de SQLite
+    Cada grupo de campos se guarda y caduca por separado, así que una entrada
+    puede ser un acierto parcial y solo se piden a la API los campos que faltan
+    Cada grupo recuerda qué campos se pidieron: si falta alguno de los pedidos el grupo es un fallo
+    """
+    
+    def __init__(self, path: str, ttls: Dict[str, float], memory_size: int = 10000,
+                 default_ttl: float = 24 * 3600):
+        self.path = path
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.memory_size = memory_size
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self._memory: 'OrderedDict[Tuple[str, str], Tuple[Dict[str, Any], FrozenSet[str], float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = _connect_sqlite(path)
+        
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS place_details (
+                    place_id TEXT NOT NULL,
+                    field_group TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    fields TEXT,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (place_id, field_group)
+                )
+            """)
+            # Caches creadas antes de guardar los campos de cada grupo: sus filas cuentan como fallo
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(place_details)")}
+            if 'fields' not in columns:
+                self._conn.execute("ALTER TABLE place_details ADD COLUMN fields TEXT")
+    
+    @classmethod
+    def from_settings(cls, settings) -> Optional['PlaceDetailsCache']:
+        """Crea la cache a partir de Settings (None si está desactivada)"""
+        if not settings.PLACE_DETAILS_CACHE_PATH:
+            return None
+        ttls = {group: hours * 3600 for group, hours in settings.PLACE_DETAILS_CACHE_TTL_HOURS.items()}
+        return cls(settings.PLACE_DETAILS_CACHE_PATH, ttls,
+                   memory_size=settings.PLACE_DETAILS_CACHE_MEMORY_SIZE)
+    
+    @staticmethod
+    def group_of(field: str) -> str:
+        """Grupo al que pertenece un campo (los campos sin grupo forman el suyo propio)"""
+        for group, fields in DETAILS_FIELD_GROUPS.items():
+            if field in fields:
+                return group
+        return field
+    
+    def _fields_by_group(self, fields: List[str]) -> Dict[str, List[str]]:
+        groups: Dict[str, List[str]] = {}
+        for field in fields:
+            groups.setdefault(self.group_of(field), []).append(field)
+        return groups
+    
+    def _is_fresh(self, group: str, fetched_at: float, now: float) -> bool:
+        return now - fetched_at <= self.ttls.get(group, self.default_ttl)
+    
+    def _remember(self, key: Tuple[str, str], payload: Dict[str, Any], fields: FrozenSet[str],
+                  fetched_at: float):
+        self._memory[key] = (payload, fields, fetched_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+    
+    def _get_group(self, place_id: str, group: str, group_fields: List[str],
+                   now: float) -> Optional[Dict[str, Any]]:
+        key = (place_id, group)
+        entry = self._memory.get(key)
+        
+        if entry is None:
+            row = self._conn.execute(
+                "SELECT payload, fields, fetched_at FROM place_details WHERE place_id = ? AND field_group = ?",
+                (place_id, group)
+            ).fetchone()
+            if row is None:
+                return None
+            entry = (json.loads(row[0]), frozenset(json.loads(row[1]) if row[1] else ()), row[2])
+            self._remember(key, *entry)
+        else:
+            self._memory.move_to_end(key)
+        
+        payload, fields, fetched_at = entry
+        if not fields.issuperset(group_fields) or not self._is_fresh(group, fetched_at, now):
+            return None
+        return payload
+    
+    def lookup(self, place_id: str, fields: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Busca los campos pedidos de un lugar
+        Devuelve los datos cacheados y la lista de campos que hay que pedir a la API
+        """
+        now = time.time()
+        cached: Dict[str, Any] = {}
+        missing: List[str] = []
+        
+        with self._lock:
+            for group, group_fields in self._fields_by_group(fields).items():
+                payload = self._get_group(place_id, group, group_fields, now)
+                if payload is None:
+                    missing.extend(group_fields)
+                else:
+                    cached.update(payload)
+            
+            if not missing:
+                self.hits += 1
+            elif cached:
+                self.partial_hits += 1
+            else:
+                self.misses += 1
+        
+        return cached, missing
+    
+    def store(self, place_id: str, fields: List[str], result: Dict[str, Any]):
+        """Guarda la respuesta de la API repartida en sus grupos de campos"""
+        now = time.time()
+        rows = []
+        
+        with self._lock, self._conn:
+            for group, group_fields in self._fields_by_group(fields).items():
+                payload = {}
+                for field in group_fields:
+                    for key in (field, _RESPONSE_ALIASES.get(field)):
+                        if key and key in result:
+                            payload[key] = result[key]
+                
+                self._remember((place_id, group), payload, frozenset(group_fields), now)
+                rows.append((place_id, group, json.dumps(payload, ensure_ascii=False),
+                             json.dumps(sorted(group_fields)), now))
+            
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO place_details (place_id, field_group, payload, fields, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+    
+    def stats(self) -> Dict[str, int]:
+        """Contadores de aciertos y fallos"""
+        with self._lock:
+            return {'hits': self.hits, 'partial_hits': self.partial_hits, 'misses': self.misses}
+    
+    def close(self):
+        """Cierra la conexión SQLite"""
+        with self._lock:
+            self._conn.close()
\ No newline at end of file
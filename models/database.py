@@ -1,7 +1,13 @@
 import pymongo
-from typing import List, Dict, Any, Optional
+from pymongo import ASCENDING, GEOSPHERE, UpdateOne
+from pymongo.errors import BulkWriteError
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Union
 from datetime import datetime
 from config.settings import get_settings
+from models.job_queue import JobQueue
+from models.restaurant import Restaurant
+from models.statistics import RestaurantStats
 import logging
 
 class DatabaseManager:
@@ -24,10 +30,11 @@ class DatabaseManager:
                 # Verificar conexión
                 self.mongo_client.admin.command('ping')
                 self.logger.info("✅ Conectado a MongoDB")
+                
+                self._ensure_indexes(self._collection())
             
-            db = self.mongo_client.restaurantes_db
-            return db.restaurants
-            
+            return self._collection()
+        
         except pymongo.errors.ServerSelectionTimeoutError:
             self.logger.error("❌ MongoDB no disponible - verificar que esté ejecutándose")
             return None
@@ -35,51 +42,151 @@ class DatabaseManager:
             self.logger.error(f"❌ Error conectando a MongoDB: {e}")
             return None
     
-    def save_to_mongodb(self, restaurants: List[Dict[str, Any]]) -> List[str]:
-        """Guarda restaurantes en MongoDB"""
+    def _collection(self) -> pymongo.collection.Collection:
+        db = self.mongo_client[self.settings.MONGODB_DATABASE]
+        return db[self.settings.MONGODB_COLLECTION]
+    
+    def _ensure_indexes(self, collection: pymongo.collection.Collection):
+        """Crea los índices de la colección (idempotente)"""
+        indexes = [
+            # Único solo para documentos con place_id, los antiguos sin él no chocan entre sí
+            ([('place_id', ASCENDING)], {'name': 'place_id_unique', 'unique': True,
+                                         'partialFilterExpression': {'place_id': {'$type': 'string'}}}),
+            ([('location', GEOSPHERE)], {'name': 'location_2dsphere'}),
+            ([('postal_code', ASCENDING)], {'name': 'postal_code'}),
+            # Filtro por código postal: un restaurante aparece en todos los códigos donde se encontró
+            ([('postal_codes', ASCENDING)], {'name': 'postal_codes'}),
+            # Reportes históricos acotados por fecha de scraping
+            ([('scraped_at', ASCENDING)], {'name': 'scraped_at'}),
+        ]
+        
+        for keys, options in indexes:
+            try:
+                collection.create_index(keys, **options)
+            except Exception as e:
+                self.logger.error(f"❌ Error creando índice {options['name']} en MongoDB: {e}")
+    
+    @staticmethod
+    def _geojson_point(lat: float, lng: float) -> Dict[str, Any]:
+        """Punto GeoJSON (ojo: las coordenadas van en orden [lng, lat])"""
+        return {'type': 'Point', 'coordinates': [float(lng), float(lat)]}
+    
+    def _prepare_document(self, restaurant: Union[Restaurant, Dict[str, Any]]) -> Dict[str, Any]:
+        """Prepara un restaurante para MongoDB - convierte tipos"""
+        # Un Restaurant produce ya un diccionario nuevo: no hace falta copiarlo otra vez
+        prepared = restaurant.to_dict() if isinstance(restaurant, Restaurant) else restaurant.copy()
+        
+        # Convertir datetime
+        if isinstance(prepared.get('scraped_at'), datetime):
+            prepared['scraped_at'] = prepared['scraped_at']
+        else:
+            prepared['scraped_at'] = datetime.now()
+        
+        # Convertir tipos para validación MongoDB
+        # Convertir rating a float si existe
+        if prepared.get('rating') is not None:
+            prepared['rating'] = float(prepared['rating'])
+        
+        # Convertir review_count a int si existe
+        if prepared.get('review_count') is not None:
+            prepared['review_count'] = int(prepared['review_count'])
+        
+        # Convertir coordenadas a float si existen
+        if prepared.get('latitude') is not None:
+            prepared['latitude'] = float(prepared['latitude'])
+        if prepared.get('longitude') is not None:
+            prepared['longitude'] = float(prepared['longitude'])
+        
+        # Punto GeoJSON para el índice 2dsphere
+        if prepared.get('latitude') is not None and prepared.get('longitude') is not None:
+            prepared['location'] = self._geojson_point(prepared['latitude'], prepared['longitude'])
+        
+        return prepared
+    
+    def _build_upsert(self, document: Dict[str, Any]) -> UpdateOne:
+        """
+        Construye el upsert idempotente de un restaurante
+        scraped_at y postal_code conservan el valor de la primera vez que se vio;
+        postal_codes acumula todos los códigos postales sin duplicados
+        """
+        document = document.copy()
+        document.pop('_id', None)
+        
+        if document.get('place_id'):
+            key = {'place_id': document['place_id']}
+        else:
+            # Documentos sin place_id: se identifican por nombre, dirección y código postal
+            key = {field: document.get(field) for field in ('name', 'address', 'postal_code')}
+        
+        on_insert = {'scraped_at': document.pop('scraped_at'), 'postal_code': document.pop('postal_code', None)}
+        postal_codes = document.pop('postal_codes', None) or [on_insert['postal_code']]
+        
+        update = {
+            '$set': document,
+            '$setOnInsert': on_insert,
+            '$addToSet': {'postal_codes': {'$each': postal_codes}},
+        }
+        return UpdateOne(key, update, upsert=True)
+    
+    def save_to_mongodb(self, restaurants: Iterable[Union[Restaurant, Dict[str, Any]]]) -> Dict[str, int]:
+        """
+        Guarda restaurantes en MongoDB con upserts idempotentes por place_id
+        Escribe en lotes desordenados: un documento erróneo no aborta el resto
+        Acepta cualquier iterable (p.ej. RestaurantBatch.iter_dicts()): los documentos se construyen lote a lote
+        Devuelve un resumen con insertados, actualizados, sin cambios y errores
+        """
         collection = self.connect_mongodb()
         if collection is None:  
             raise Exception("No se pudo conectar a MongoDB")
         
+        summary = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+        batch_size = self.settings.MONGODB_BATCH_SIZE
+        
+        rows = iter(restaurants)
+        
         try:
-            # Preparar datos - convertir tipos para MongoDB
-            prepared_restaurants = []
-            for restaurant in restaurants:
-                prepared = restaurant.copy()
-                
-                # Convertir datetime
-                if isinstance(prepared.get('scraped_at'), datetime):
-                    prepared['scraped_at'] = prepared['scraped_at']
-                else:
-                    prepared['scraped_at'] = datetime.now()
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                operations = [self._build_upsert(self._prepare_document(r)) for r in batch]
                 
-                # Convertir tipos para validación MongoDB
-                # Convertir rating a float si existe
-                if prepared.get('rating') is not None:
-                    prepared['rating'] = float(prepared['rating'])
+                try:
+                    result = collection.bulk_write(operations, ordered=False)
+                    details = result.bulk_api_result
+                except BulkWriteError as e:
+                    # Con ordered=False el resto del lote se escribe igualmente
+                    details = e.details
+                    summary['errors'] += len(details.get('writeErrors', []))
+                    self.logger.warning(f"⚠️ {len(details.get('writeErrors', []))} documentos con error en el lote")
                 
-                # Convertir review_count a int si existe
-                if prepared.get('review_count') is not None:
-                    prepared['review_count'] = int(prepared['review_count'])
-                
-                # Convertir coordenadas a float si existen
-                if prepared.get('latitude') is not None:
-                    prepared['latitude'] = float(prepared['latitude'])
-                if prepared.get('longitude') is not None:
-                    prepared['longitude'] = float(prepared['longitude'])
-                
-                prepared_restaurants.append(prepared)
-            
-            # Insertar en batch
-            result = collection.insert_many(prepared_restaurants)
-            
-            self.logger.info(f"✅ Guardados {len(result.inserted_ids)} restaurantes en MongoDB")
-            return [str(id) for id in result.inserted_ids]
+                summary['inserted'] += details.get('nUpserted', 0)
+                summary['updated'] += details.get('nModified', 0)
+                summary['unchanged'] += details.get('nMatched', 0) - details.get('nModified', 0)
             
+            self.logger.info(
+                f"✅ MongoDB: {summary['inserted']} insertados, {summary['updated']} actualizados, "
+                f"{summary['unchanged']} sin cambios"
+            )
+            return summary
+        
         except Exception as e:
             self.logger.error(f"❌ Error guardando en MongoDB: {e}")
             raise
     
+    def add_postal_code(self, place_ids: List[str], postal_code: str) -> int:
+        """
+        Añade un código postal a restaurantes ya guardados, sin reescribir el resto de campos
+        Devuelve cuántos documentos han cambiado
+        """
+        collection = self.connect_mongodb()
+        if collection is None:
+            raise Exception("No se pudo conectar a MongoDB")
+        
+        result = collection.update_many({'place_id': {'$in': list(place_ids)}},
+                                        {'$addToSet': {'postal_codes': postal_code}})
+        return result.modified_count
+    
     def get_restaurants_by_postal_code(self, postal_code: str) -> List[Dict[str, Any]]:
         """Obtiene restaurantes por código postal"""
         collection = self.connect_mongodb()
@@ -87,7 +194,7 @@ class DatabaseManager:
             return []
         
         try:
-            cursor = collection.find({"postal_code": postal_code})
+            cursor = collection.find(self.build_query(postal_code=postal_code))
             return list(cursor)
         except Exception as e:
             self.logger.error(f"❌ Error consultando MongoDB: {e}")
@@ -106,6 +213,231 @@ class DatabaseManager:
             self.logger.error(f"❌ Error consultando MongoDB: {e}")
             return []
     
+    def find_near(self, lat: float, lng: float, radius: float, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Restaurantes a menos de `radius` metros de un punto, ordenados por distancia
+        Se resuelve en el servidor con el índice 2dsphere; añade `distance_m` a cada documento
+        """
+        collection = self.connect_mongodb()
+        if collection is None:
+            return []
+        
+        pipeline = [
+            {'$geoNear': {
+                'near': self._geojson_point(lat, lng),
+                'distanceField': 'distance_m',
+                'maxDistance': radius,
+                'spherical': True,
+            }},
+            {'$limit': limit},
+        ]
+        
+        try:
+            return list(collection.aggregate(pipeline))
+        except Exception as e:
+            self.logger.error(f"❌ Error consultando MongoDB: {e}")
+            return []
+    
+    def find_in_bounding_box(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+                             limit: int = 0) -> List[Dict[str, Any]]:
+        """Restaurantes dentro de un rectángulo de coordenadas (limit=0 sin límite)"""
+        collection = self.connect_mongodb()
+        if collection is None:
+            return []
+        
+        box = {
+            'type': 'Polygon',
+            'coordinates': [[
+                [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat],
+                [min_lng, max_lat], [min_lng, min_lat],
+            ]],
+        }
+        
+        try:
+            cursor = collection.find({'location': {'$geoWithin': {'$geometry': box}}}).limit(limit)
+            return list(cursor)
+        except Exception as e:
+            self.logger.error(f"❌ Error consultando MongoDB: {e}")
+            return []
+    
+    def backfill_locations(self) -> int:
+        """Añade el punto GeoJSON a documentos antiguos que solo tienen latitude/longitude"""
+        collection = self.connect_mongodb()
+        if collection is None:
+            return 0
+        
+        result = collection.update_many(
+            {'location': {'$exists': False},
+             'latitude': {'$type': 'number'},
+             'longitude': {'$type': 'number'}},
+            [{'$set': {'location': {'type': 'Point', 'coordinates': ['$longitude', '$latitude']}}}]
+        )
+        self.logger.info(f"✅ Añadida ubicación GeoJSON a {result.modified_count} restaurantes")
+        return result.modified_count
+    
+    def build_query(self, postal_code: Optional[str] = None, min_rating: Optional[float] = None,
+                    max_rating: Optional[float] = None, cuisine_type: Optional[str] = None,
+                    scraped_after: Optional[datetime] = None,
+                    scraped_before: Optional[datetime] = None) -> Dict[str, Any]:
+        """Construye el filtro de MongoDB a partir de los filtros opcionales"""
+        query: Dict[str, Any] = {}
+        
+        if postal_code is not None:
+            # Los documentos guardados antes de postal_codes solo tienen postal_code
+            query['$or'] = [{'postal_codes': postal_code}, {'postal_code': postal_code}]
+        if cuisine_type is not None:
+            query['cuisine_type'] = cuisine_type
+        
+        rating = {}
+        if min_rating is not None:
+            rating['$gte'] = min_rating
+        if max_rating is not None:
+            rating['$lte'] = max_rating
+        if rating:
+            query['rating'] = rating
+        
+        scraped_at = {}
+        if scraped_after is not None:
+            scraped_at['$gte'] = scraped_after
+        if scraped_before is not None:
+            scraped_at['$lt'] = scraped_before
+        if scraped_at:
+            query['scraped_at'] = scraped_at
+        
+        return query
+    
+    def iter_restaurants(self, fields: Optional[List[str]] = None, batch_size: Optional[int] = None,
+                         **filters) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre los restaurantes en streaming, sin cargar la colección en memoria
+        Acepta los filtros de build_query y una proyección opcional de campos
+        Sin conexión no produce nada; un error a mitad del cursor se propaga
+        para no confundir un resultado parcial con uno completo
+        """
+        collection = self.connect_mongodb()
+        if collection is None:
+            return
+        
+        query = self.build_query(**filters)
+        projection = None
+        if fields:
+            projection = {field: 1 for field in fields}
+            if '_id' not in fields:
+                projection['_id'] = 0
+        
+        cursor = collection.find(query, projection, batch_size=batch_size or self.settings.MONGODB_BATCH_SIZE)
+        try:
+            for document in cursor:
+                yield document
+        except Exception as e:
+            self.logger.error(f"❌ Error consultando MongoDB: {e}")
+            raise
+        finally:
+            cursor.close()
+    
+    def iter_restaurants_by_postal_code(self, postal_code: str, **kwargs) -> Iterator[Dict[str, Any]]:
+        """Recorre en streaming los restaurantes de un código postal"""
+        return self.iter_restaurants(postal_code=postal_code, **kwargs)
+    
+    def _statistics_pipeline(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Pipeline que calcula todas las cifras del reporte en una sola pasada
+        El $match inicial usa los índices; la mediana sale de un histograma de ratings
+        """
+        def present(field: str) -> Dict[str, Any]:
+            return {'$cond': [{'$eq': [{'$ifNull': [f'${field}', None]}, None]}, 0, 1]}
+        
+        return [
+            {'$match': query},
+            {'$project': {'_id': 0, 'postal_code': 1, 'cuisine_type': 1, 'rating': 1, 'phone': 1, 'website': 1}},
+            {'$facet': {
+                'summary': [
+                    {'$group': {
+                        '_id': None,
+                        'total': {'$sum': 1},
+                        'with_phone': {'$sum': present('phone')},
+                        'with_website': {'$sum': present('website')},
+                    }},
+                ],
+                'per_postal_code': [
+                    {'$match': {'postal_code': {'$ne': None}}},
+                    {'$group': {'_id': '$postal_code', 'count': {'$sum': 1}}},
+                ],
+                'per_cuisine': [
+                    {'$match': {'cuisine_type': {'$ne': None}}},
+                    {'$group': {'_id': '$cuisine_type', 'count': {'$sum': 1}}},
+                ],
+                'ratings': [
+                    {'$match': {'rating': {'$type': 'number'}}},
+                    {'$group': {
+                        '_id': {'$round': [{'$multiply': ['$rating', RestaurantStats.RATING_RESOLUTION]}, 0]},
+                        'count': {'$sum': 1},
+                        'sum': {'$sum': '$rating'},
+                        'min': {'$min': '$rating'},
+                        'max': {'$max': '$rating'},
+                    }},
+                ],
+            }},
+        ]
+    
+    def aggregate_statistics(self, **filters) -> Optional[RestaurantStats]:
+        """
+        Calcula las estadísticas en el servidor con un pipeline de agregación
+        Acepta los filtros de build_query; no trae documentos a Python
+        """
+        collection = self.connect_mongodb()
+        if collection is None:
+            return None
+        
+        pipeline = self._statistics_pipeline(self.build_query(**filters))
+        
+        try:
+            result = next(collection.aggregate(pipeline, allowDiskUse=True), None) or {}
+        except Exception as e:
+            self.logger.error(f"❌ Error agregando estadísticas en MongoDB: {e}")
+            return None
+        
+        stats = RestaurantStats()
+        for summary in result.get('summary', []):
+            stats.total = summary['total']
+            stats.with_phone = summary['with_phone']
+            stats.with_website = summary['with_website']
+        for group in result.get('per_postal_code', []):
+            stats.per_postal_code[group['_id']] = group['count']
+        for group in result.get('per_cuisine', []):
+            stats.per_cuisine[group['_id']] = group['count']
+        for bucket in result.get('ratings', []):
+            stats.rating_histogram[int(bucket['_id'])] = bucket['count']
+            stats.rating_count += bucket['count']
+            stats.rating_sum += bucket['sum']
+            stats.rating_min = bucket['min'] if stats.rating_min is None else min(stats.rating_min, bucket['min'])
+            stats.rating_max = bucket['max'] if stats.rating_max is None else max(stats.rating_max, bucket['max'])
+        
+        return stats
+    
+    def get_statistics_report(self, postal_codes: Optional[List[str]] = None, **filters) -> Optional[Dict[str, Any]]:
+        """
+        Reporte de estadísticas sobre todo el histórico de MongoDB
+        Mismo formato que reporte_estadisticas.json; sin postal_codes se listan todos los de la colección
+        """
+        stats = self.aggregate_statistics(**filters)
+        if stats is None:
+            return None
+        
+        if postal_codes is None:
+            postal_codes = sorted(stats.per_postal_code)
+        return stats.to_report(postal_codes)
+    
+    def get_job_queue(self) -> Optional[JobQueue]:
+        """Cola de trabajos distribuida en la misma base de datos (None si MongoDB no está disponible)"""
+        if self.connect_mongodb() is None:
+            return None
+        
+        collection = self.mongo_client[self.settings.MONGODB_DATABASE][self.settings.MONGODB_JOBS_COLLECTION]
+        queue = JobQueue.from_settings(collection, self.settings)
+        queue.ensure_indexes()
+        return queue
+    
     def close_connections(self):
         """Cierra conexión MongoDB"""
         if self.mongo_client:
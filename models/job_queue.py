@@ -0,0 +1,115 @@
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.collection import Collection
+
+class JobQueue:
+    """
+    Cola de códigos postales en una colección de MongoDB, compartida por workers en varios hosts
+    Cada código es un documento (_id = código postal) que un worker toma con un lease atómico y
+    mantiene vivo con heartbeats; si el worker muere el lease caduca y otro worker lo retoma.
+    Las operaciones de un worker están condicionadas a que siga siendo el dueño del lease
+    """
+    
+    STATUSES = ('pending', 'leased', 'done', 'failed')
+    
+    def __init__(self, collection: Collection, lease_seconds: float = 300, max_attempts: int = 3,
+                 clock: Callable[[], float] = time.time):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._clock = clock
+    
+    @classmethod
+    def from_settings(cls, collection: Collection, settings) -> 'JobQueue':
+        return cls(collection, lease_seconds=settings.JOB_LEASE_SECONDS, max_attempts=settings.JOB_MAX_ATTEMPTS)
+    
+    def ensure_indexes(self):
+        """Índice para buscar trabajos libres o con el lease caducado (idempotente)"""
+        self.collection.create_index([('status', ASCENDING), ('lease_expires_at', ASCENDING)],
+                                     name='status_lease_expires_at')
+    
+    def enqueue(self, postal_codes: Iterable[str]) -> int:
+        """Encola códigos postales; los que ya estaban en la cola no se tocan. Devuelve cuántos son nuevos"""
+        now = self._clock()
+        operations = [
+            UpdateOne({'_id': postal_code},
+                      {'$setOnInsert': {'status': 'pending', 'attempts': 0, 'enqueued_at': now}},
+                      upsert=True)
+            for postal_code in postal_codes
+        ]
+        if not operations:
+            return 0
+        return self.collection.bulk_write(operations, ordered=False).upserted_count
+    
+    def lease(self, worker_id: str) -> Optional[str]:
+        """Toma el siguiente trabajo libre (o con el lease caducado) para este worker"""
+        now = self._clock()
+        self._expire_exhausted(now)
+        
+        job = self.collection.find_one_and_update(
+            {'$or': [
+                {'status': 'pending'},
+                {'status': 'leased', 'lease_expires_at': {'$lt': now}, 'attempts': {'$lt': self.max_attempts}},
+            ]},
+            {'$set': {'status': 'leased', 'worker': worker_id, 'leased_at': now,
+                      'lease_expires_at': now + self.lease_seconds},
+             '$inc': {'attempts': 1}},
+            sort=[('enqueued_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        return job['_id'] if job else None
+    
+    def _expire_exhausted(self, now: float):
+        # Trabajos cuyo worker murió en el último intento permitido
+        self.collection.update_many(
+            {'status': 'leased', 'lease_expires_at': {'$lt': now}, 'attempts': {'$gte': self.max_attempts}},
+            {'$set': {'status': 'failed', 'error': 'lease caducado'}}
+        )
+    
+    def heartbeat(self, postal_code: str, worker_id: str) -> bool:
+        """Renueva el lease; devuelve False si el worker ya no es su dueño (caducó y lo tomó otro)"""
+        result = self.collection.update_one(
+            {'_id': postal_code, 'status': 'leased', 'worker': worker_id},
+            {'$set': {'lease_expires_at': self._clock() + self.lease_seconds}}
+        )
+        return result.matched_count == 1
+    
+    def complete(self, postal_code: str, worker_id: str, restaurants: int = 0) -> bool:
+        """Marca el trabajo como terminado si el worker sigue siendo su dueño"""
+        result = self.collection.update_one(
+            {'_id': postal_code, 'status': 'leased', 'worker': worker_id},
+            {'$set': {'status': 'done', 'completed_at': self._clock(), 'restaurants': restaurants},
+             '$unset': {'lease_expires_at': '', 'error': ''}}
+        )
+        return result.matched_count == 1
+    
+    def fail(self, postal_code: str, worker_id: str, error: str) -> bool:
+        """Libera el trabajo para reintentarlo, o lo marca como fallido si agotó los intentos"""
+        owned = {'_id': postal_code, 'status': 'leased', 'worker': worker_id}
+        exhausted = self.collection.update_one(
+            {**owned, 'attempts': {'$gte': self.max_attempts}},
+            {'$set': {'status': 'failed', 'error': error}, '$unset': {'lease_expires_at': ''}}
+        )
+        if exhausted.matched_count:
+            return True
+        
+        result = self.collection.update_one(
+            owned, {'$set': {'status': 'pending', 'error': error}, '$unset': {'lease_expires_at': ''}}
+        )
+        return result.matched_count == 1
+    
+    def progress(self) -> Dict[str, Any]:
+        """Número de trabajos por estado, trabajos con el lease caducado y restaurantes obtenidos"""
+        summary: Dict[str, Any] = {status: 0 for status in self.STATUSES}
+        for row in self.collection.aggregate([
+            {'$group': {'_id': '$status', 'count': {'$sum': 1}, 'restaurants': {'$sum': '$restaurants'}}}
+        ]):
+            summary[row['_id']] = row['count']
+            if row['_id'] == 'done':
+                summary['restaurants'] = row['restaurants']
+        summary.setdefault('restaurants', 0)
+        summary['expired_leases'] = self.collection.count_documents(
+            {'status': 'leased', 'lease_expires_at': {'$lt': self._clock()}}
+        )
+        return summary
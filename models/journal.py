@@ -0,0 +1,186 @@
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from models.cache import _connect_sqlite
+from models.restaurant import Restaurant
+
+class RunJournal:
+    """
+    Diario persistente (SQLite) de una ejecución de scraping
+    Registra por código postal su estado y el next_page_token pendiente, y cada restaurante obtenido
+    con sus datos completos; cada página se guarda en una transacción, así que tras una caída se
+    retoma donde se quedó sin repetir Place Details ni códigos postales terminados
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = _connect_sqlite(path)
+        
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS postal_codes (
+                    postal_code TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    next_page_token TEXT,
+                    pages INTEGER NOT NULL DEFAULT 0,
+                    restaurants INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    coverage TEXT,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # Diarios creados antes de la búsqueda por teselas
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(postal_codes)")}
+            if 'coverage' not in columns:
+                self._conn.execute("ALTER TABLE postal_codes ADD COLUMN coverage TEXT")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS places (
+                    place_id TEXT PRIMARY KEY,
+                    postal_code TEXT NOT NULL,
+                    postal_codes TEXT NOT NULL,
+                    restaurant TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_places_postal_code ON places (postal_code)")
+    
+    @staticmethod
+    def _encode(restaurant: Restaurant) -> str:
+        data = restaurant.to_dict()
+        data.pop('postal_codes')  # se guardan aparte porque crecen con otros códigos postales
+        data['scraped_at'] = data['scraped_at'].isoformat()
+        return json.dumps(data, ensure_ascii=False)
+    
+    @staticmethod
+    def _decode(payload: str, postal_codes: str) -> Restaurant:
+        data = json.loads(payload)
+        data['scraped_at'] = datetime.fromisoformat(data['scraped_at'])
+        data['postal_codes'] = json.loads(postal_codes)
+        return Restaurant(**data)
+    
+    def start(self, postal_code: str) -> Dict[str, Any]:
+        """Marca un código postal en curso (si no estaba terminado) y devuelve su estado guardado"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO postal_codes (postal_code, status, updated_at) VALUES (?, 'in_progress', ?)",
+                (postal_code, time.time())
+            )
+            self._conn.execute(
+                "UPDATE postal_codes SET status = 'in_progress', error = NULL "
+                "WHERE postal_code = ? AND status = 'failed'",
+                (postal_code,)
+            )
+            row = self._conn.execute(
+                "SELECT status, next_page_token, pages, coverage FROM postal_codes WHERE postal_code = ?",
+                (postal_code,)
+            ).fetchone()
+        
+        status, next_page_token, pages, coverage = row
+        return {'status': status, 'next_page_token': next_page_token, 'pages': pages,
+                'coverage': json.loads(coverage) if coverage else None}
+    
+    def save_page(self, postal_code: str, next_page_token: Optional[str], restaurants: List[Restaurant],
+                  page_place_ids: Iterable[str] = (), coverage: Optional[Dict[str, Any]] = None):
+        """
+        Guarda una página de resultados de forma atómica: los restaurantes nuevos, este código postal
+        en los lugares que ya se habían obtenido en otro, el token de la página siguiente y las
+        teselas que quedan por buscar
+        """
+        now = time.time()
+        new_place_ids = {restaurant.place_id for restaurant in restaurants}
+        
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO places (place_id, postal_code, postal_codes, restaurant, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(r.place_id, postal_code, json.dumps(r.postal_codes), self._encode(r), now) for r in restaurants]
+            )
+            
+            for place_id in set(page_place_ids) - new_place_ids:
+                row = self._conn.execute("SELECT postal_codes FROM places WHERE place_id = ?", (place_id,)).fetchone()
+                if row is not None:
+                    postal_codes = json.loads(row[0])
+                    if postal_code not in postal_codes:
+                        postal_codes.append(postal_code)
+                        self._conn.execute("UPDATE places SET postal_codes = ? WHERE place_id = ?",
+                                           (json.dumps(postal_codes), place_id))
+            
+            self._conn.execute(
+                "UPDATE postal_codes SET next_page_token = ?, coverage = ?, pages = pages + 1, updated_at = ? "
+                "WHERE postal_code = ?",
+                (next_page_token, json.dumps(coverage) if coverage else None, now, postal_code)
+            )
+    
+    def complete(self, postal_code: str):
+        """Marca un código postal como terminado"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE postal_codes SET status = 'done', next_page_token = NULL, coverage = NULL, updated_at = ?, "
+                "restaurants = (SELECT COUNT(*) FROM places WHERE places.postal_code = postal_codes.postal_code) "
+                "WHERE postal_code = ?",
+                (time.time(), postal_code)
+            )
+    
+    def fail(self, postal_code: str, error: str):
+        """Marca un código postal como fallido; se reintenta en la siguiente ejecución"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE postal_codes SET status = 'failed', error = ?, updated_at = ? WHERE postal_code = ?",
+                (error, time.time(), postal_code)
+            )
+    
+    def completed_postal_codes(self) -> Set[str]:
+        """Códigos postales terminados"""
+        with self._lock:
+            rows = self._conn.execute("SELECT postal_code FROM postal_codes WHERE status = 'done'").fetchall()
+        return {row[0] for row in rows}
+    
+    def restaurants(self, postal_code: Optional[str] = None) -> List[Restaurant]:
+        """Restaurantes guardados (de un código postal o de toda la ejecución) en el orden en que se obtuvieron"""
+        query = "SELECT restaurant, postal_codes FROM places"
+        params: Tuple[Any, ...] = ()
+        if postal_code is not None:
+            query += " WHERE postal_code = ?"
+            params = (postal_code,)
+        
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY rowid", params).fetchall()
+        return [self._decode(payload, postal_codes) for payload, postal_codes in rows]
+    
+    def seen_places(self) -> Iterator[Tuple[str, List[str]]]:
+        """place_id ya obtenidos con sus códigos postales, para no volver a pedir sus detalles"""
+        with self._lock:
+            rows = self._conn.execute("SELECT place_id, postal_codes FROM places").fetchall()
+        for place_id, postal_codes in rows:
+            yield place_id, json.loads(postal_codes)
+    
+    def progress(self) -> Dict[str, Any]:
+        """Resumen del estado de la ejecución"""
+        with self._lock:
+            by_status = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM postal_codes GROUP BY status"
+            ).fetchall())
+            places = self._conn.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+            pending_tokens = self._conn.execute(
+                "SELECT COUNT(*) FROM postal_codes WHERE next_page_token IS NOT NULL"
+            ).fetchone()[0]
+            failed = [row[0] for row in self._conn.execute(
+                "SELECT postal_code FROM postal_codes WHERE status = 'failed' ORDER BY postal_code"
+            )]
+        
+        return {
+            'done': by_status.get('done', 0),
+            'in_progress': by_status.get('in_progress', 0),
+            'failed': by_status.get('failed', 0),
+            'failed_postal_codes': failed,
+            'pending_page_tokens': pending_tokens,
+            'restaurants': places,
+        }
+    
+    def close(self):
+        """Cierra la conexión SQLite"""
+        with self._lock:
+            self._conn.close()
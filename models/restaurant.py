@@ -1,10 +1,43 @@
-from dataclasses import dataclass
-from typing import Optional, Dict, Any
+import sys
+from functools import lru_cache
+from dataclasses import dataclass, field, fields
+from typing import Optional, Dict, Any, List, Tuple, Union, ClassVar
 from datetime import datetime
 
-@dataclass
+# slots=True solo existe desde Python 3.10; en 3.9 la clase sigue funcionando con __dict__
+_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+# Horarios semanales distintos que se recuerdan; acotado para que un proceso largo no crezca sin límite
+HOURS_CACHE_SIZE = 4096
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """Interna strings categóricos (códigos postales, tipos de cocina) para compartir una sola copia"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+def compact_hours(hours: Union[Dict[str, str], List[str], Tuple[str, ...], None]) -> Optional[Tuple[str, ...]]:
+    """
+    Codifica los horarios como una tupla de textos por día (day_0, day_1...) internados
+    Acepta el formato dict {'day_N': texto} o la lista weekday_text de la API
+    """
+    if not hours:
+        return None
+    
+    if isinstance(hours, dict):
+        hours = [hours[day] for day in sorted(hours, key=lambda d: int(d.split('_')[1]))]
+    
+    return _shared_hours(tuple(sys.intern(day) for day in hours))
+
+@lru_cache(maxsize=HOURS_CACHE_SIZE)
+def _shared_hours(encoded: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Devuelve la primera tupla vista con ese horario: los restaurantes con el mismo horario la comparten"""
+    return encoded
+
+@dataclass(frozen=True, **_SLOTS)
 class Restaurant:
-    """Modelo de datos para restaurante"""
+    """
+    Modelo de datos para restaurante
+    Inmutable y sin __dict__ por instancia; postal_code, cuisine_type y los horarios se internan
+    """
     name: str
     address: str
     postal_code: str
@@ -12,15 +45,45 @@ class Restaurant:
     rating: Optional[float] = None
     review_count: Optional[int] = None
     cuisine_type: Optional[str] = None
-    business_hours: Optional[Dict[str, str]] = None
+    business_hours: Optional[Tuple[str, ...]] = None  # un texto por día, ver compact_hours
     website: Optional[str] = None
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    place_id: Optional[str] = None
+    # Todos los códigos postales donde apareció; es la lista compartida con SeenPlaces y puede crecer
+    postal_codes: Optional[List[str]] = field(default=None, hash=False, compare=False)
     scraped_at: datetime = None
     
+    FIELDS: ClassVar[Tuple[str, ...]]
+    
     def __post_init__(self):
+        # Clase inmutable: la normalización inicial usa object.__setattr__
+        set_field = object.__setattr__
+        set_field(self, 'postal_code', _intern(self.postal_code))
+        set_field(self, 'cuisine_type', _intern(self.cuisine_type))
+        set_field(self, 'business_hours', compact_hours(self.business_hours))
+        
         if self.scraped_at is None:
-            self.scraped_at = datetime.now()
+            set_field(self, 'scraped_at', datetime.now())
+        if self.postal_codes is None:
+            set_field(self, 'postal_codes', [self.postal_code])
+    
+    def hours_by_day(self) -> Optional[Dict[str, str]]:
+        """Horarios en el formato histórico {'day_N': texto}"""
+        if self.business_hours is None:
+            return None
+        return {f"day_{i}": day for i, day in enumerate(self.business_hours)}
+    
+    def as_row(self) -> Tuple[Any, ...]:
+        """
+        Fila con los valores en el orden de Restaurant.FIELDS, sin copiar ningún valor
+        Los horarios se devuelven en su forma compacta (tupla por día)
+        """
+        return (
+            self.name, self.address, self.postal_code, self.phone, self.rating, self.review_count,
+            self.cuisine_type, self.business_hours, self.website, self.latitude, self.longitude,
+            self.place_id, self.postal_codes, self.scraped_at
+        )
     
     def to_dict(self) -> Dict[str, Any]:
         """Convierte el objeto a diccionario"""
@@ -32,9 +95,13 @@ class Restaurant:
             'rating': self.rating,
             'review_count': self.review_count,
             'cuisine_type': self.cuisine_type,
-            'business_hours': self.business_hours,
+            'business_hours': self.hours_by_day(),
             'website': self.website,
             'latitude': self.latitude,
             'longitude': self.longitude,
+            'place_id': self.place_id,
+            'postal_codes': self.postal_codes,
             'scraped_at': self.scraped_at
-        }
\ No newline at end of file
+        }
+
+Restaurant.FIELDS = tuple(f.name for f in fields(Restaurant))
@@ -0,0 +1,145 @@
+import math
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Union
+import numpy as np
+from models.batch import RestaurantBatch
+from models.restaurant import Restaurant
+
+class RestaurantStats:
+    """
+    Agregador incremental de estadísticas de restaurantes
+    Se alimenta de uno en uno con memoria constante por métrica; la mediana del
+    rating se aproxima con un histograma de cubetas de 0.1 puntos
+    No es seguro entre hilos: cada worker usa el suyo y se combinan con merge()
+    """
+    
+    RATING_RESOLUTION = 10  # cubetas por punto de rating
+    
+    def __init__(self):
+        self.total = 0
+        self.per_postal_code: Counter = Counter()
+        self.per_cuisine: Counter = Counter()
+        self.with_phone = 0
+        self.with_website = 0
+        self.rating_count = 0
+        self.rating_sum = 0.0
+        self.rating_min: Optional[float] = None
+        self.rating_max: Optional[float] = None
+        self.rating_histogram: Counter = Counter()
+    
+    def add(self, restaurant: Union[Restaurant, Dict[str, Any]]):
+        """Incorpora un restaurante (objeto Restaurant o su diccionario)"""
+        if isinstance(restaurant, dict):
+            get = restaurant.get
+        else:
+            get = lambda field: getattr(restaurant, field, None)
+        
+        self.total += 1
+        
+        if get('postal_code') is not None:
+            self.per_postal_code[get('postal_code')] += 1
+        if get('cuisine_type') is not None:
+            self.per_cuisine[get('cuisine_type')] += 1
+        if get('phone') is not None:
+            self.with_phone += 1
+        if get('website') is not None:
+            self.with_website += 1
+        
+        rating = get('rating')
+        if rating is not None and not math.isnan(rating):
+            rating = float(rating)
+            self.rating_count += 1
+            self.rating_sum += rating
+            self.rating_min = rating if self.rating_min is None else min(self.rating_min, rating)
+            self.rating_max = rating if self.rating_max is None else max(self.rating_max, rating)
+            self.rating_histogram[round(rating * self.RATING_RESOLUTION)] += 1
+    
+    def add_many(self, restaurants: Iterable[Union[Restaurant, Dict[str, Any]]]) -> 'RestaurantStats':
+        """Incorpora varios restaurantes"""
+        for restaurant in restaurants:
+            self.add(restaurant)
+        return self
+    
+    def add_batch(self, batch: RestaurantBatch) -> 'RestaurantStats':
+        """Incorpora un RestaurantBatch con operaciones vectorizadas, sin recorrer las filas"""
+        self.total += len(batch)
+        
+        for counter, name in ((self.per_postal_code, 'postal_code'), (self.per_cuisine, 'cuisine_type')):
+            codes, categories = batch.categorical(name)
+            counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+            counter.update({category: int(count) for category, count in zip(categories, counts) if count})
+        
+        self.with_phone += int(batch.present('phone').sum())
+        self.with_website += int(batch.present('website').sum())
+        
+        ratings = batch.numeric('rating')
+        ratings = ratings[~np.isnan(ratings)]
+        if ratings.size:
+            self.rating_count += int(ratings.size)
+            self.rating_sum += float(ratings.sum())
+            self.rating_min = float(ratings.min()) if self.rating_min is None else min(self.rating_min, float(ratings.min()))
+            self.rating_max = float(ratings.max()) if self.rating_max is None else max(self.rating_max, float(ratings.max()))
+            buckets, counts = np.unique(np.round(ratings * self.RATING_RESOLUTION).astype(np.int64), return_counts=True)
+            self.rating_histogram.update(dict(zip(buckets.tolist(), counts.tolist())))
+        return self
+    
+    def merge(self, other: 'RestaurantStats') -> 'RestaurantStats':
+        """Combina el agregado parcial de otro worker en este"""
+        self.total += other.total
+        self.per_postal_code.update(other.per_postal_code)
+        self.per_cuisine.update(other.per_cuisine)
+        self.with_phone += other.with_phone
+        self.with_website += other.with_website
+        self.rating_count += other.rating_count
+        self.rating_sum += other.rating_sum
+        self.rating_histogram.update(other.rating_histogram)
+        
+        for value in (other.rating_min, other.rating_max):
+            if value is not None:
+                self.rating_min = value if self.rating_min is None else min(self.rating_min, value)
+                self.rating_max = value if self.rating_max is None else max(self.rating_max, value)
+        return self
+    
+    @property
+    def rating_mean(self) -> Optional[float]:
+        """Rating medio (None si ningún restaurante tiene rating)"""
+        return self.rating_sum / self.rating_count if self.rating_count else None
+    
+    @property
+    def rating_median(self) -> Optional[float]:
+        """Mediana aproximada del rating (exacta para ratings con un decimal)"""
+        if not self.rating_count:
+            return None
+        
+        # Posiciones centrales (dos si el total es par, como hace pandas)
+        middle = [(self.rating_count - 1) // 2, self.rating_count // 2]
+        values = []
+        seen = 0
+        for bucket in sorted(self.rating_histogram):
+            seen += self.rating_histogram[bucket]
+            while middle and middle[0] < seen:
+                middle.pop(0)
+                values.append(bucket / self.RATING_RESOLUTION)
+        
+        return sum(values) / len(values)
+    
+    def to_report(self, postal_codes: List[str]) -> Dict[str, Any]:
+        """Genera el reporte con el mismo formato que reporte_estadisticas.json"""
+        return {
+            "resumen_general": {
+                "total_restaurantes": self.total,
+                "codigos_postales_analizados": postal_codes,
+                "restaurantes_por_codigo_postal": dict(sorted(self.per_postal_code.items())),
+                "rating_promedio": self.rating_mean or 0,
+                "restaurantes_con_telefono": self.with_phone,
+                "restaurantes_con_website": self.with_website,
+            },
+            "tipos_cocina": dict(self.per_cuisine.most_common()),
+            "estadisticas_rating": {
+                "promedio": self.rating_mean or 0,
+                "mediana": self.rating_median or 0,
+                "maximo": self.rating_max or 0,
+                "minimo": self.rating_min or 0,
+                "total_con_rating": self.rating_count
+            }
+        }
\ No newline at end of file
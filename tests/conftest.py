@@ -0,0 +1,104 @@
+import threading
+import pytest
+from types import SimpleNamespace
+
+@pytest.fixture(autouse=True)
+def isolated_workdir(tmp_path, monkeypatch):
+    """Ejecuta cada test en un directorio temporal para no escribir caches ni exportaciones en el repo"""
+    monkeypatch.chdir(tmp_path)
+
+class FakeJobsCollection:
+    """
+    Sustituto en proceso de una colección de MongoDB con las operaciones que usa JobQueue
+    (filtros por igualdad, $or, $lt y $gte; actualizaciones $set, $unset, $inc y $setOnInsert)
+    """
+    
+    def __init__(self):
+        self.docs = {}
+        self._lock = threading.Lock()
+    
+    def _matches(self, doc, query):
+        for key, condition in query.items():
+            if key == '$or':
+                if not any(self._matches(doc, sub) for sub in condition):
+                    return False
+            elif isinstance(condition, dict):
+                value = doc.get(key)
+                if value is None:
+                    return False
+                if '$lt' in condition and not value < condition['$lt']:
+                    return False
+                if '$gte' in condition and not value >= condition['$gte']:
+                    return False
+            elif doc.get(key) != condition:
+                return False
+        return True
+    
+    def _apply(self, doc, update, inserted=False):
+        doc.update(update.get('$set', {}))
+        if inserted:
+            doc.update(update.get('$setOnInsert', {}))
+        for key in update.get('$unset', {}):
+            doc.pop(key, None)
+        for key, amount in update.get('$inc', {}).items():
+            doc[key] = doc.get(key, 0) + amount
+    
+    def create_index(self, keys, **kwargs):
+        return kwargs.get('name')
+    
+    def bulk_write(self, operations, ordered=True):
+        upserted = 0
+        with self._lock:
+            for op in operations:
+                doc = self.docs.get(op._filter['_id'])
+                if doc is None:
+                    doc = self.docs[op._filter['_id']] = {'_id': op._filter['_id']}
+                    upserted += 1
+                    self._apply(doc, op._doc, inserted=True)
+                else:
+                    self._apply(doc, op._doc)
+        return SimpleNamespace(upserted_count=upserted)
+    
+    def find_one_and_update(self, query, update, sort=None, return_document=None):
+        with self._lock:
+            matches = [doc for doc in self.docs.values() if self._matches(doc, query)]
+            for key, _ in reversed(sort or []):
+                matches.sort(key=lambda doc: doc.get(key))
+            if not matches:
+                return None
+            self._apply(matches[0], update)
+            return dict(matches[0])
+    
+    def update_one(self, query, update):
+        with self._lock:
+            for doc in self.docs.values():
+                if self._matches(doc, query):
+                    self._apply(doc, update)
+                    return SimpleNamespace(matched_count=1)
+        return SimpleNamespace(matched_count=0)
+    
+    def update_many(self, query, update):
+        with self._lock:
+            matches = [doc for doc in self.docs.values() if self._matches(doc, query)]
+            for doc in matches:
+                self._apply(doc, update)
+        return SimpleNamespace(matched_count=len(matches))
+    
+    def count_documents(self, query):
+        with self._lock:
+            return sum(1 for doc in self.docs.values() if self._matches(doc, query))
+    
+    def aggregate(self, pipeline):
+        # Solo el $group por estado de JobQueue.progress()
+        groups = {}
+        with self._lock:
+            for doc in self.docs.values():
+                group = groups.setdefault(doc['status'], {'_id': doc['status'], 'count': 0, 'restaurants': 0})
+                group['count'] += 1
+                group['restaurants'] += doc.get('restaurants', 0)
+        return list(groups.values())
+
+@pytest.fixture
+def jobs_collection():
+    """Colección de trabajos en memoria para probar la cola distribuida sin MongoDB"""
+    return FakeJobsCollection()
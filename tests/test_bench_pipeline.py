@@ -0,0 +1,38 @@
+import pytest
+from benchmarks.bench_pipeline import compare_to_baseline, run_suite
+
+def _results(**stages):
+    return {'stages': stages}
+
+def test_compare_to_baseline_flags_regressions():
+    """Test solo se marcan como regresión los empeoramientos por encima de la tolerancia y del ruido"""
+    baseline = _results(search={'seconds': 10.0, 'api_calls_per_restaurant': 1.2},
+                        export_csv={'seconds': 2.0, 'peak_mb': 50.0},
+                        to_dict={'seconds': 0.01})
+    results = _results(search={'seconds': 11.0, 'api_calls_per_restaurant': 1.5},
+                       export_csv={'seconds': 3.0, 'peak_mb': 40.0},
+                       to_dict={'seconds': 0.03},
+                       save_to_mongodb={'seconds': 5.0})
+    
+    regressions = compare_to_baseline(results, baseline, tolerance=0.2)
+    
+    assert {(r['stage'], r['metric']) for r in regressions} == {
+        ('search', 'api_calls_per_restaurant'), ('export_csv', 'seconds')
+    }
+    assert regressions[-1]['change'] == pytest.approx(0.5)
+
+def test_run_suite_reports_every_stage():
+    """Test el benchmark completo con un dataset mínimo y sin MongoDB"""
+    results = run_suite(200, 1, city_size=100, mongodb_uri='mongodb://127.0.0.1:1')
+    
+    stages = results['stages']
+    assert list(stages) == ['search', 'restaurant_model', 'to_dict', 'batch', 'mongodb_upserts',
+                            'export_csv', 'export_json', 'export_parquet']
+    assert all(stage['seconds'] > 0 and 'peak_mb' in stage for stage in stages.values())
+    assert stages['to_dict']['restaurants'] == 200
+    
+    search = stages['search']
+    assert search['restaurants'] > 0
+    assert search['api_calls']['geocode'] == 1
+    assert search['api_calls']['place'] == search['restaurants']  # DETAILS_MODE 'full', sin caches
+    assert compare_to_baseline(results, results) == []
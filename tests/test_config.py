@@ -34,10 +34,16 @@ class TestSettings:
             
             # Verificar valores por defecto
             assert settings.MONGODB_URI == 'mongodb://localhost:27017/restaurantes_db'
-            assert settings.REQUEST_DELAY_MIN == 0.1
-            assert settings.REQUEST_DELAY_MAX == 0.5
+            assert settings.MONGODB_DATABASE == 'restaurantes_db'
+            assert settings.MONGODB_COLLECTION == 'restaurants'
+            assert settings.GEOCODE_QPS == 10
+            assert settings.NEARBY_SEARCH_QPS == 10
+            assert settings.PLACE_DETAILS_QPS == 20
+            assert settings.RATE_LIMIT_BURST == 5
+            assert settings.RATE_LIMIT_SHARED_DIR is None
             assert settings.SEARCH_RADIUS == 5000
             assert settings.MAX_RESULTS_PER_POSTAL_CODE == 60
+            assert settings.MAX_WORKERS == 4
     
     def test_get_settings_function(self):
         """Test función get_settings"""
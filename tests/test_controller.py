@@ -1,7 +1,11 @@
+import math
+import numpy as np
 import pytest
 from unittest.mock import patch, MagicMock
-from controllers.scraper_controller import GoogleMapsClient
-from controllers.data_controller import DataController
+from controllers.scraper_controller import GoogleMapsClient, SeenPlaces
+from controllers.data_controller import DataController, IncrementalExporter
+from controllers.rate_limiter import TokenBucket, FileTokenBucket, RateLimiter
+from controllers.coverage import AdaptiveCoverage, Tile
 from models.restaurant import Restaurant
 
 class TestGoogleMapsClient:
@@ -16,23 +20,75 @@ class TestGoogleMapsClient:
         scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format")  #API key válida para test
         
         assert scraper.client is not None
-        mock_googlemaps.assert_called_once_with(key="AIzaSyTest_ValidKey_Format")
+        mock_googlemaps.assert_called_once_with(key="AIzaSyTest_ValidKey_Format",
+                                                retry_over_query_limit=False)
     
     @patch('googlemaps.Client')
-    def test_apply_rate_limit(self, mock_googlemaps):
-        """Test rate limiting"""
+    def test_close_shuts_down_pools_caches_and_journal(self, mock_googlemaps):
+        """Test close() termina los pools de hilos y cierra caches y diario"""
+        geocode_cache, details_cache, journal = MagicMock(), MagicMock(), MagicMock()
+        journal.seen_places.return_value = []
+        
+        with GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock(), geocode_cache=geocode_cache,
+                              details_cache=details_cache, journal=journal) as scraper:
+            pass
+        
+        with pytest.raises(RuntimeError):
+            scraper._details_executor.submit(print)
+        with pytest.raises(RuntimeError):
+            scraper._pages_executor.submit(print)
+        geocode_cache.close.assert_called_once()
+        details_cache.close.assert_called_once()
+        journal.close.assert_called_once()
+    
+    @patch('googlemaps.Client')
+    def test_call_api_uses_rate_limiter(self, mock_googlemaps):
+        """Test cada llamada a la API pasa por el rate limiter del endpoint"""
         mock_client = MagicMock()
         mock_googlemaps.return_value = mock_client
+        mock_client.geocode.return_value = ['ok']
+        rate_limiter = MagicMock()
         
-        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format")
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=rate_limiter)
+        result = scraper._call_api('geocode', address="10001")
         
-        import time
-        start_time = time.time()
-        scraper._apply_rate_limit(0.1)
-        end_time = time.time()
+        assert result == ['ok']
+        rate_limiter.acquire.assert_called_once_with('geocode')
+        rate_limiter.report_success.assert_called_once_with('geocode')
+    
+    @patch('googlemaps.Client')
+    def test_call_api_backs_off_on_over_query_limit(self, mock_googlemaps):
+        """Test reintento con backoff ante OVER_QUERY_LIMIT"""
+        import googlemaps
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.place.side_effect = [
+            googlemaps.exceptions._OverQueryLimit('OVER_QUERY_LIMIT'),
+            {'result': {'name': 'OK'}}
+        ]
+        rate_limiter = MagicMock()
+        rate_limiter.report_over_query_limit.return_value = 0.0
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=rate_limiter)
+        result = scraper._call_api('place', place_id='p1')
+        
+        assert result == {'result': {'name': 'OK'}}
+        assert rate_limiter.acquire.call_count == 2
+        rate_limiter.report_over_query_limit.assert_called_once_with('place')
+    
+    @patch('googlemaps.Client')
+    def test_call_api_does_not_retry_other_errors(self, mock_googlemaps):
+        """Test otros errores de API no se reintentan"""
+        import googlemaps
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.place.side_effect = googlemaps.exceptions.ApiError('INVALID_REQUEST')
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock())
         
-        # Verificar que el delay se aplicó
-        assert end_time - start_time >= 0.1
+        with pytest.raises(googlemaps.exceptions.ApiError):
+            scraper._call_api('place', place_id='p1')
+        assert mock_client.place.call_count == 1
     
     @patch('googlemaps.Client')
     def test_extract_cuisine_type_known_types(self, mock_googlemaps):
@@ -143,6 +199,558 @@ class TestGoogleMapsClient:
         
         # Debe devolver coordenadas por defecto
         assert result == {'lat': 0, 'lng': 0}
+    
+    @patch('googlemaps.Client')
+    def test_extract_page_restaurants_keeps_order_and_isolates_failures(self, mock_googlemaps):
+        """Test detalles en paralelo conservan el orden y aíslan fallos"""
+        import time
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        
+        def fake_place(place_id, fields):
+            if place_id == 'bad':
+                raise Exception("Detalles no disponibles")
+            time.sleep(0.05 if place_id == 'p1' else 0)
+            return {'result': {'name': f"Restaurant {place_id}", 'type': ['restaurant']}}
+        
+        mock_client.place.side_effect = fake_place
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock())
+        
+        places_result = {'results': [{'place_id': 'p1'}, {'place_id': 'bad'}, {'place_id': 'p2'}]}
+        result = scraper._extract_page_restaurants(places_result, "28001")
+        
+        assert [r.name for r in result] == ['Restaurant p1', 'Restaurant p2']
+        assert mock_client.place.call_count == 3
+    
+    @patch('googlemaps.Client')
+    def test_get_location_uses_geocode_cache(self, mock_googlemaps, tmp_path):
+        """Test la segunda consulta del mismo código postal no llama a la API"""
+        from models.cache import GeocodeCache
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.geocode.return_value = [{'geometry': {'location': {'lat': 40.7, 'lng': -74.0}}}]
+        cache = GeocodeCache(str(tmp_path / "geocode.sqlite3"), ttl=3600, max_entries=10)
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock(), geocode_cache=cache)
+        first = scraper._get_location_from_postal_code("10001")
+        second = scraper._get_location_from_postal_code("10001")
+        
+        assert first == second == {'lat': 40.7, 'lng': -74.0}
+        assert mock_client.geocode.call_count == 1
+    
+    @patch('googlemaps.Client')
+    def test_get_location_failure_not_cached(self, mock_googlemaps, tmp_path):
+        """Test el fallback {'lat': 0, 'lng': 0} nunca se cachea"""
+        from models.cache import GeocodeCache
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.geocode.return_value = []
+        cache = GeocodeCache(str(tmp_path / "geocode.sqlite3"), ttl=3600, max_entries=10)
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock(), geocode_cache=cache)
+        
+        assert scraper._get_location_from_postal_code("invalid") == {'lat': 0, 'lng': 0}
+        assert cache.count() == 0
+    
+    @patch('googlemaps.Client')
+    def test_warm_geocode_cache_skips_cached_codes(self, mock_googlemaps, tmp_path):
+        """Test la precarga solo geocodifica los códigos que faltan"""
+        from models.cache import GeocodeCache
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.geocode.return_value = [{'geometry': {'location': {'lat': 1.0, 'lng': 2.0}}}]
+        cache = GeocodeCache(str(tmp_path / "geocode.sqlite3"), ttl=3600, max_entries=10)
+        cache.set("28001", {'lat': 40.4, 'lng': -3.7})
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock(), geocode_cache=cache)
+        cached = scraper.warm_geocode_cache(["28001", "28002", "28003"])
+        
+        assert cached == 2
+        assert mock_client.geocode.call_count == 2
+    
+    @patch('googlemaps.Client')
+    def test_place_details_cache_skips_api(self, mock_googlemaps, tmp_path):
+        """Test un place_id ya consultado no vuelve a llamar a Place Details"""
+        from models.cache import PlaceDetailsCache
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.place.return_value = {'result': {'name': 'Cached Place', 'rating': 4.0}}
+        cache = PlaceDetailsCache(str(tmp_path / "details.sqlite3"), {'basic': 3600, 'contact': 3600, 'atmosphere': 3600})
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock(), details_cache=cache)
+        first = scraper._extract_restaurant_data({'place_id': 'p1'}, "28001")
+        second = scraper._extract_restaurant_data({'place_id': 'p1'}, "28001")
+        
+        assert first.name == second.name == 'Cached Place'
+        assert second.rating == 4.0
+        assert mock_client.place.call_count == 1
+        assert cache.stats()['hits'] == 1
+    
+    @patch('googlemaps.Client')
+    def test_overlapping_postal_codes_fetch_details_once(self, mock_googlemaps):
+        """Test un lugar repetido en otro código postal no vuelve a pedir detalles"""
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.place.side_effect = lambda place_id, fields: {'result': {'name': place_id}}
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock())
+        first = scraper._extract_page_restaurants({'results': [{'place_id': 'p1'}, {'place_id': 'p2'}]}, "28001")
+        second = scraper._extract_page_restaurants({'results': [{'place_id': 'p2'}, {'place_id': 'p3'}]}, "28002")
+        
+        assert [r.place_id for r in first] == ['p1', 'p2']
+        assert [r.place_id for r in second] == ['p3']
+        assert mock_client.place.call_count == 3
+        assert first[1].postal_codes == ['28001', '28002']
+    
+    @patch('googlemaps.Client')
+    def test_failed_place_can_be_retried(self, mock_googlemaps):
+        """Test un lugar cuyos detalles fallan se puede reintentar en otro código postal"""
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.place.side_effect = [Exception("timeout"), {'result': {'name': 'p1'}}]
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock())
+        first = scraper._extract_page_restaurants({'results': [{'place_id': 'p1'}]}, "28001")
+        second = scraper._extract_page_restaurants({'results': [{'place_id': 'p1'}]}, "28002")
+        
+        assert first == []
+        assert [r.postal_codes for r in second] == [['28001', '28002']]  # 28001 también lo encontró
+    
+    def _journal_scraper(self, mock_googlemaps, tmp_path):
+        from models.journal import RunJournal
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.place.side_effect = lambda place_id, fields: {'result': {'name': place_id}}
+        journal = RunJournal(str(tmp_path / "journal.sqlite3"))
+        journal.start("28001")
+        journal.save_page("28001", "token-2", [Restaurant(name="p1", address="A", postal_code="28001",
+                                                          place_id="p1", postal_codes=["28001"])], ['p1'],
+                          coverage={'center': {'lat': 40.4, 'lng': -3.7}, 'radius': 5000,
+                                    'tiles': [[0, 0, 5000, 0]], 'found': 20})
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock(), journal=journal)
+        scraper._get_location_from_postal_code = MagicMock(return_value={'lat': 40.4, 'lng': -3.7})
+        return scraper, mock_client, journal
+    
+    @patch('googlemaps.Client')
+    def test_journal_resumes_from_saved_page_token(self, mock_googlemaps, tmp_path):
+        """Test con diario se retoma la paginación sin repetir la primera página"""
+        scraper, mock_client, journal = self._journal_scraper(mock_googlemaps, tmp_path)
+        mock_client.places_nearby.return_value = {'results': [{'place_id': 'p2'}]}
+        
+        restaurants = scraper.search_restaurants_by_postal_code("28001")
+        
+        assert [r.place_id for r in restaurants] == ['p1', 'p2']
+        mock_client.places_nearby.assert_called_once_with(page_token='token-2')
+        scraper._get_location_from_postal_code.assert_not_called()
+        assert journal.progress()['done'] == 1
+        
+        # Un código terminado no vuelve a llamar a la API
+        assert [r.place_id for r in scraper.search_restaurants_by_postal_code("28001")] == ['p1', 'p2']
+        assert mock_client.places_nearby.call_count == 1
+    
+    @patch('googlemaps.Client')
+    def test_journal_expired_page_token_restarts_search(self, mock_googlemaps, tmp_path):
+        """Test un token caducado repite la búsqueda sin volver a pedir detalles ya guardados"""
+        import googlemaps
+        scraper, mock_client, journal = self._journal_scraper(mock_googlemaps, tmp_path)
+        mock_client.places_nearby.side_effect = [
+            googlemaps.exceptions.ApiError('INVALID_REQUEST'),
+            {'results': [{'place_id': 'p1'}, {'place_id': 'p2'}]},
+        ]
+        
+        restaurants = scraper.search_restaurants_by_postal_code("28001")
+        
+        assert [r.place_id for r in restaurants] == ['p1', 'p2']
+        assert [call.kwargs['place_id'] for call in mock_client.place.call_args_list] == ['p2']
+        assert journal.completed_postal_codes() == {'28001'}
+    
+    @patch('controllers.scraper_controller.time.sleep')
+    @patch('googlemaps.Client')
+    def test_saturated_search_is_subdivided(self, mock_googlemaps, mock_sleep):
+        """Test una búsqueda con 60 resultados se divide en teselas y deduplica entre ellas"""
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.place.side_effect = lambda place_id, fields: {'result': {'name': place_id}}
+        
+        def page(ids, token=None):
+            result = {'results': [{'place_id': f"p{i}"} for i in ids]}
+            if token:
+                result['next_page_token'] = token
+            return result
+        
+        pages = {'t1': page(range(20, 40), 't2'), 't2': page(range(40, 60))}
+        tiles = iter([page(range(0, 20), 't1'), page([0, 60]), page([61]), page([]), page([1, 62])])
+        mock_client.places_nearby.side_effect = lambda **kwargs: (
+            pages[kwargs['page_token']] if 'page_token' in kwargs else next(tiles)
+        )
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock())
+        scraper._get_location_from_postal_code = MagicMock(return_value={'lat': 40.4, 'lng': -3.7})
+        restaurants = scraper.search_restaurants_by_postal_code("28001")
+        
+        assert [r.place_id for r in restaurants] == [f"p{i}" for i in range(63)]
+        searches = [call.kwargs for call in mock_client.places_nearby.call_args_list if 'radius' in call.kwargs]
+        assert [round(search['radius']) for search in searches] == [5000, 3536, 3536, 3536, 3536]
+        assert mock_client.place.call_count == 63
+    
+    @patch('controllers.scraper_controller.time.sleep')
+    @patch('googlemaps.Client')
+    def test_next_page_token_is_polled_until_valid(self, mock_googlemaps, mock_sleep):
+        """Test el token se sondea con backoff corto mientras la API responde INVALID_REQUEST"""
+        import googlemaps
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.places_nearby.side_effect = [
+            googlemaps.exceptions.ApiError('INVALID_REQUEST'),
+            googlemaps.exceptions.ApiError('INVALID_REQUEST'),
+            {'results': [{'place_id': 'p2'}]},
+        ]
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock())
+        
+        assert scraper._fetch_next_page('token-2') == {'results': [{'place_id': 'p2'}]}
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [0.5, 0.75, 1.125]
+        
+        mock_client.places_nearby.side_effect = googlemaps.exceptions.ApiError('INVALID_REQUEST')
+        scraper.settings.PAGE_TOKEN_TIMEOUT = 0
+        with pytest.raises(googlemaps.exceptions.ApiError):
+            scraper._fetch_next_page('token-expired')
+    
+    @patch('controllers.scraper_controller.time.sleep')
+    @patch('googlemaps.Client')
+    def test_next_page_overlaps_details(self, mock_googlemaps, mock_sleep):
+        """Test la página siguiente se pide mientras se obtienen los detalles de la actual"""
+        import threading
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        next_page_requested = threading.Event()
+        
+        def places_nearby(**kwargs):
+            if 'page_token' in kwargs:
+                next_page_requested.set()
+                return {'results': [{'place_id': 'p2'}]}
+            return {'results': [{'place_id': 'p1'}], 'next_page_token': 'token-2'}
+        
+        def place(place_id, fields):
+            if place_id == 'p1':
+                # Los detalles de la primera página no terminan hasta que se ha pedido la segunda
+                assert next_page_requested.wait(timeout=5)
+            return {'result': {'name': place_id}}
+        
+        mock_client.places_nearby.side_effect = places_nearby
+        mock_client.place.side_effect = place
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock())
+        scraper._get_location_from_postal_code = MagicMock(return_value={'lat': 40.4, 'lng': -3.7})
+        
+        assert [r.place_id for r in scraper.search_restaurants_by_postal_code("28001")] == ['p1', 'p2']
+    
+    NEARBY_PLACE = {'place_id': 'p1', 'name': 'Casa Pepe', 'vicinity': 'Calle Mayor 1, Madrid', 'rating': 4.2,
+                    'user_ratings_total': 120, 'types': ['spanish_restaurant', 'restaurant'],
+                    'geometry': {'location': {'lat': 40.41, 'lng': -3.70}}}
+    
+    @patch('googlemaps.Client')
+    def test_contact_mode_requests_only_missing_fields(self, mock_googlemaps):
+        """Test en modo 'contact' el restaurante sale de Nearby y solo se piden teléfono, web y horarios"""
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        mock_client.place.return_value = {'result': {
+            'formatted_phone_number': '+34 910 000 000', 'website': 'https://casapepe.es',
+            'opening_hours': {'weekday_text': ['Lunes: 9-18']}
+        }}
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock())
+        scraper.details_cache = None
+        scraper.settings.DETAILS_MODE = 'contact'
+        restaurant = scraper._extract_restaurant_data(self.NEARBY_PLACE, "28001", ["28001"])
+        
+        mock_client.place.assert_called_once_with(place_id='p1', fields=GoogleMapsClient.CONTACT_FIELDS)
+        assert restaurant.name == 'Casa Pepe'
+        assert restaurant.address == 'Calle Mayor 1, Madrid'
+        assert restaurant.rating == 4.2 and restaurant.review_count == 120
+        assert restaurant.latitude == 40.41
+        assert restaurant.phone == '+34 910 000 000'
+        assert restaurant.hours_by_day() == {'day_0': 'Lunes: 9-18'}
+        assert restaurant.postal_codes == ["28001"]
+    
+    @patch('googlemaps.Client')
+    def test_nearby_mode_skips_place_details_and_hydrates_on_demand(self, mock_googlemaps):
+        """Test en modo 'nearby' no se llama a Place Details salvo al hidratar bajo demanda"""
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        
+        def place(place_id, fields):
+            if place_id == 'p2':
+                raise Exception("timeout")
+            return {'result': {'website': 'https://casapepe.es'}}
+        
+        mock_client.place.side_effect = place
+        
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock())
+        scraper.details_cache = None
+        scraper.settings.DETAILS_MODE = 'nearby'
+        restaurants = scraper._extract_page_restaurants(
+            {'results': [self.NEARBY_PLACE, {**self.NEARBY_PLACE, 'place_id': 'p2'}]}, "28001"
+        )
+        
+        mock_client.place.assert_not_called()
+        assert [r.phone for r in restaurants] == [None, None]
+        
+        hydrated = scraper.hydrate_contact_details(restaurants)
+        assert [r.website for r in hydrated] == ['https://casapepe.es', None]
+        assert hydrated[0].rating == 4.2
+        assert hydrated[1] is restaurants[1]
+    
+    def test_unknown_details_mode(self, monkeypatch):
+        """Test modos de Place Details desconocidos se rechazan"""
+        monkeypatch.setattr('config.settings.Settings.DETAILS_MODE', 'lazy')
+        with pytest.raises(ValueError):
+            GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock())
+
+class TestAdaptiveCoverage:
+    """Tests para el teselado adaptativo de búsquedas Nearby"""
+    
+    def test_split_covers_parent(self):
+        """Test las cuatro hijas cubren todo el círculo de la madre y las nietas tienen la mitad de radio"""
+        tile = Tile(0.0, 0.0, 1000.0)
+        children = tile.split()
+        
+        assert len(children) == 4
+        assert all(child.depth == 1 and child.half == 500 for child in children)
+        for angle in range(0, 360, 15):
+            x = 1000 * math.cos(math.radians(angle))
+            y = 1000 * math.sin(math.radians(angle))
+            assert any(math.hypot(x - c.x, y - c.y) <= c.radius + 1e-6 for c in children)
+        
+        # Las nietas circunscriben cada cuadrante (250 m de semilado) del cuadrado de su madre
+        for grandchild in children[0].split():
+            assert grandchild.radius == pytest.approx(children[0].radius / 2)
+            assert abs(grandchild.x - children[0].x) == abs(grandchild.y - children[0].y) == 250
+    
+    def test_sparse_tile_is_not_split(self):
+        """Test una tesela por debajo del límite da la cobertura por completa"""
+        coverage = AdaptiveCoverage({'lat': 40.4, 'lng': -3.7}, 5000)
+        coverage.record_page(59)
+        
+        assert coverage.finish_tile() == []
+        assert coverage.current is None
+        assert coverage.searches == 1
+    
+    def test_saturated_tiles_stop_at_min_radius(self):
+        """Test las teselas saturadas se dividen hasta el radio mínimo y no fuera del área"""
+        coverage = AdaptiveCoverage({'lat': 40.4, 'lng': -3.7}, 2000, min_radius=200)
+        depths = []
+        while coverage.current is not None:
+            depths.append(coverage.current.depth)
+            coverage.record_page(60)
+            coverage.finish_tile()
+        
+        # 2000 -> 1414 -> 707 -> 354 (la siguiente, 177, queda por debajo de 200)
+        assert [depths.count(depth) for depth in range(3)] == [1, 4, 16]
+        assert max(depths) == 3
+        # Los cuadrados de las esquinas que no tocan el área no se consultan
+        assert depths.count(3) == 60
+    
+    def test_dense_cluster_costs_few_searches(self):
+        """Test un núcleo denso se cubre entero con pocas búsquedas (sin solapar teselas de más)"""
+        rng = np.random.default_rng(1)
+        points = rng.normal(0, 800, size=(400, 2))
+        coverage = AdaptiveCoverage({'lat': 40.4, 'lng': -3.7}, 5000)
+        found = set()
+        
+        while coverage.current is not None:
+            tile = coverage.current
+            distance = np.hypot(points[:, 0] - tile.x, points[:, 1] - tile.y)
+            inside = np.flatnonzero(distance <= tile.radius)
+            closest = inside[np.argsort(distance[inside])][:60]  # límite de Nearby Search
+            found.update(closest.tolist())
+            coverage.record_page(len(closest))
+            coverage.finish_tile()
+        
+        assert len(found) == 400
+        assert coverage.searches <= 60
+    
+    def test_location_and_state_round_trip(self):
+        """Test coordenadas de las teselas y estado serializable para el diario"""
+        coverage = AdaptiveCoverage({'lat': 40.0, 'lng': -3.0}, 5000)
+        coverage.record_page(60)
+        coverage.finish_tile()
+        coverage.record_page(20)
+        restored = AdaptiveCoverage.from_state(coverage.to_state())
+        
+        assert restored.tiles == coverage.tiles
+        assert restored.found == 20
+        location = restored.location(Tile(0.0, 111320.0, 1.0))
+        assert location['lat'] == pytest.approx(41.0)
+        assert location['lng'] == pytest.approx(-3.0)
+
+class TestSeenPlaces:
+    """Tests para el registro de lugares vistos"""
+    
+    def test_claim_records_every_postal_code(self):
+        """Test la primera reclamación es nueva y las siguientes anotan el código postal"""
+        seen = SeenPlaces()
+        
+        is_new, postal_codes = seen.claim('p1', '28001')
+        assert is_new
+        
+        is_new, _ = seen.claim('p1', '28002')
+        assert not is_new
+        seen.claim('p1', '28002')
+        
+        assert postal_codes == ['28001', '28002']
+        assert 'p1' in seen
+        assert len(seen) == 1
+    
+    def test_claim_is_thread_safe(self):
+        """Test solo un hilo consigue reclamar cada lugar"""
+        from concurrent.futures import ThreadPoolExecutor
+        seen = SeenPlaces()
+        
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda i: seen.claim('p1', f"code{i}")[0], range(50)))
+        
+        assert results.count(True) == 1
+    
+    def test_release_keeps_postal_codes_for_next_claim(self):
+        """Test los códigos anotados mientras se pedían los detalles pasan al siguiente que lo reclama"""
+        seen = SeenPlaces()
+        seen.claim('p1', '28001')
+        seen.claim('p1', '28002')  # otro código lo encuentra con los detalles en vuelo
+        
+        seen.release('p1')
+        assert 'p1' not in seen
+        
+        is_new, postal_codes = seen.claim('p1', '28003')
+        assert is_new
+        assert postal_codes == ['28001', '28002', '28003']
+    
+    def test_untrack_with_release_undoes_the_claims(self):
+        """Test un código postal en seguimiento anota los lugares ya vistos y puede deshacer sus reclamaciones"""
+        seen = SeenPlaces()
+        seen.claim('p1', '28001')
+        
+        seen.track('28002')
+        seen.claim('p1', '28002')
+        seen.claim('p2', '28002')
+        assert seen.revisited('28002') == ['p1']
+        
+        seen.untrack('28002', release=True)
+        
+        assert 'p2' not in seen
+        assert seen.claim('p1', '28003')[1] == ['28001', '28003']
+        assert seen.revisited('28002') == []
+
+class TestRateLimiter:
+    """Tests para el token bucket y el rate limiter"""
+    
+    def test_token_bucket_allows_burst(self):
+        """Test la ráfaga inicial no espera"""
+        bucket = TokenBucket(rate=10, capacity=3)
+        
+        waits = [bucket.reserve() for _ in range(3)]
+        
+        assert waits == [0.0, 0.0, 0.0]
+    
+    def test_token_bucket_queues_after_burst(self):
+        """Test las reservas tras la ráfaga hacen cola al rate configurado"""
+        bucket = TokenBucket(rate=10, capacity=1)
+        
+        bucket.reserve()
+        second = bucket.reserve()
+        third = bucket.reserve()
+        
+        assert second == pytest.approx(0.1, abs=0.01)
+        assert third == pytest.approx(0.2, abs=0.01)
+    
+    def test_token_bucket_shared_between_threads(self):
+        """Test varios hilos comparten el mismo límite"""
+        import threading
+        import time
+        bucket = TokenBucket(rate=20, capacity=1)
+        
+        start_time = time.time()
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        # 1 token inicial + 4 a 20 por segundo
+        assert time.time() - start_time >= 0.19
+    
+    def test_token_bucket_acquire_async(self):
+        """Test acquire desde asyncio"""
+        import asyncio
+        bucket = TokenBucket(rate=10, capacity=2)
+        
+        async def run():
+            return [await bucket.acquire_async() for _ in range(2)]
+        
+        assert asyncio.run(run()) == [0.0, 0.0]
+    
+    def test_slow_down_halves_rate_and_pauses(self):
+        """Test backoff reduce el rate y pausa el bucket"""
+        bucket = TokenBucket(rate=10, capacity=5)
+        
+        bucket.slow_down(pause=1.0)
+        
+        assert bucket.rate == 5
+        assert bucket.reserve() >= 1.0
+        
+        bucket.speed_up()
+        assert bucket.rate == 6
+    
+    def test_file_token_bucket_shares_state(self, tmp_path):
+        """Test dos buckets sobre el mismo fichero comparten los tokens"""
+        path = tmp_path / "place.bucket"
+        first = FileTokenBucket(str(path), rate=1, capacity=1)
+        second = FileTokenBucket(str(path), rate=1, capacity=1)
+        
+        assert first.reserve() == 0.0
+        assert second.reserve() > 0.5
+    
+    def test_rate_limiter_per_endpoint(self):
+        """Test cada endpoint tiene su propio bucket"""
+        limiter = RateLimiter({'geocode': 10, 'place': 10}, burst=1)
+        
+        assert limiter.acquire('geocode') == 0.0
+        assert limiter.acquire('place') == 0.0
+        
+        with pytest.raises(ValueError):
+            limiter.acquire('unknown')
+    
+    def test_rate_limiter_exponential_backoff(self):
+        """Test el backoff crece con fallos consecutivos y se reinicia con un éxito"""
+        limiter = RateLimiter({'place': 10}, backoff_base=1.0, backoff_max=8.0)
+        clock = [0.0]
+        limiter.buckets['place']._now = lambda: clock[0]
+        
+        first = limiter.report_over_query_limit('place')
+        clock[0] += first  # el reintento llega cuando ha terminado la pausa
+        second = limiter.report_over_query_limit('place')
+        
+        assert 0.5 <= first <= 1.0
+        assert 1.0 <= second <= 2.0
+        
+        clock[0] += second
+        limiter.report_success('place')
+        assert 0.5 <= limiter.report_over_query_limit('place') <= 1.0
+    
+    def test_reports_in_the_same_backoff_are_one_event(self):
+        """Test varios OVER_QUERY_LIMIT de la misma ráfaga reducen el rate una vez y no suman pausas"""
+        from concurrent.futures import ThreadPoolExecutor
+        limiter = RateLimiter({'place': 16}, burst=8, backoff_base=1.0)
+        bucket = limiter.buckets['place']
+        
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            pauses = list(executor.map(lambda _: limiter.report_over_query_limit('place'), range(8)))
+        
+        assert bucket.rate == 8
+        assert all(0.5 <= pause <= 1.0 for pause in pauses)
+        # La siguiente reserva espera la pausa más larga, no la suma de todas
+        assert bucket.reserve() <= max(pauses) + 1 / bucket.rate + 0.05
 
 class TestDataController:
     """Tests para DataController"""
@@ -180,16 +788,492 @@ class TestDataController:
         mock_path_instance.parent.mkdir.assert_called()
         assert mock_to_csv.call_count >= 1  # Al menos CSV general
     
-    def test_convert_to_json_serializable(self):
-        """Test conversión a tipos serializables en JSON"""
+    def test_export_to_csv_partitions(self, tmp_path, monkeypatch):
+        """Test un CSV por código postal, incluidos los que no tienen resultados"""
+        monkeypatch.chdir(tmp_path)
         controller = DataController()
         
-        import numpy as np
+        restaurants = [
+            {'name': 'R1', 'postal_code': '12345'},
+            {'name': 'R2', 'postal_code': '67890'},
+            {'name': 'R3', 'postal_code': '12345'}
+        ]
+        controller._export_to_csv(restaurants, ['12345', '67890', '00000'])
+        
         import pandas as pd
+        assert pd.read_csv("data/csv/restaurantes_12345.csv")['name'].tolist() == ['R1', 'R3']
+        assert pd.read_csv("data/csv/restaurantes_67890.csv")['name'].tolist() == ['R2']
+        assert pd.read_csv("data/csv/restaurantes_00000.csv").empty
+        assert len(pd.read_csv("data/csv/restaurantes_completo.csv")) == 3
+    
+    @patch('controllers.data_controller.DatabaseManager')
+    def test_process_and_save_data_builds_one_dataframe(self, mock_db_manager, tmp_path, monkeypatch):
+        """Test la exportación CSV y el reporte comparten el mismo DataFrame"""
+        import pandas as pd
+        monkeypatch.chdir(tmp_path)
+        controller = DataController()
+        controller._export_to_json = MagicMock()
+        
+        restaurants = [Restaurant(name="R1", address="A", postal_code="12345", rating=4.0)]
+        with patch('controllers.data_controller.pd.DataFrame', wraps=pd.DataFrame) as mock_df:
+            controller.process_and_save_data(restaurants, ['12345'])
+        
+        assert mock_df.call_count == 1
+    
+    def test_export_to_parquet_partitioned_and_typed(self, tmp_path, monkeypatch):
+        """Test dataset Parquet particionado por código postal con columnas tipadas"""
+        pytest.importorskip('pyarrow')
+        import pandas as pd
+        from datetime import datetime
+        monkeypatch.chdir(tmp_path)
+        controller = DataController()
+        
+        restaurants = [
+            Restaurant(name="R1", address="A", postal_code="28001", rating=4.5, review_count=10,
+                       cuisine_type="Italiana", business_hours={'day_0': 'Lunes', 'day_1': 'Martes'},
+                       scraped_at=datetime(2024, 5, 1, 12, 0)).to_dict(),
+            Restaurant(name="R2", address="B", postal_code="08002").to_dict(),
+        ]
+        controller._export_to_parquet(restaurants)
+        
+        assert (tmp_path / "data/parquet/restaurantes/postal_code=28001").is_dir()
+        
+        df = controller.load_parquet(postal_codes=['28001'])
+        assert df['name'].tolist() == ['R1']
+        assert controller.load_parquet(postal_codes=['08002'], columns=['name', 'postal_code']).to_dict('records') == [
+            {'name': 'R2', 'postal_code': '08002'}
+        ]
+        assert list(df['business_hours'][0]) == ['Lunes', 'Martes']
+        assert df['scraped_at'][0] == pd.Timestamp(2024, 5, 1, 12, 0)
+        assert str(df['cuisine_type'].dtype) == 'category'
+    
+    def test_export_to_parquet_from_restaurant_objects(self, tmp_path, monkeypatch):
+        """Test Parquet construido directamente desde objetos Restaurant, sin diccionarios"""
+        pytest.importorskip('pyarrow')
+        monkeypatch.chdir(tmp_path)
+        controller = DataController()
+        restaurants = [
+            Restaurant(name="R1", address="A", postal_code="28001", cuisine_type="Italiana",
+                       business_hours={'day_0': 'Lunes', 'day_1': 'Martes'}, postal_codes=['28001', '28002']),
+            Restaurant(name="R2", address="B", postal_code="28002"),
+        ]
+        
+        with patch.object(Restaurant, 'to_dict') as mock_to_dict:
+            controller._export_to_parquet(restaurants)
+        
+        mock_to_dict.assert_not_called()
+        df = controller.load_parquet(postal_codes=['28001'])
+        assert df['name'].tolist() == ['R1']
+        assert list(df['business_hours'][0]) == ['Lunes', 'Martes']
+        assert list(df['postal_codes'][0]) == ['28001', '28002']
+    
+    @patch('controllers.data_controller.DatabaseManager')
+    def test_process_and_save_data_from_batch(self, mock_db_manager, tmp_path, monkeypatch):
+        """Test el procesamiento completo parte del lote columnar, sin Restaurant.to_dict()"""
+        import json
+        import pandas as pd
+        from pathlib import Path
+        from models.batch import RestaurantBatch
+        monkeypatch.chdir(tmp_path)
+        controller = DataController()
+        controller.settings.JSON_EXPORT_FORMAT = 'ndjson'
+        controller.settings.JSON_COMPRESSION = None
+        mock_db_manager.return_value.save_to_mongodb.side_effect = lambda rows: {
+            'inserted': len(list(rows)), 'updated': 0, 'unchanged': 0
+        }
+        batch = RestaurantBatch.from_restaurants([
+            Restaurant(name="R1", address="A", postal_code="12345", rating=4.0),
+            Restaurant(name="R2", address="B", postal_code="67890", rating=3.0),
+        ])
+        
+        with patch.object(Restaurant, 'to_dict') as mock_to_dict:
+            controller.process_and_save_data(batch, ['12345', '67890'])
+        
+        mock_to_dict.assert_not_called()
+        assert pd.read_csv("data/csv/restaurantes_67890.csv")['name'].tolist() == ['R2']
+        assert len(Path("data/json/restaurantes_completo.ndjson").read_text(encoding='utf-8').splitlines()) == 2
+        report = json.loads(Path("data/json/reporte_estadisticas.json").read_text(encoding='utf-8'))
+        assert report['estadisticas_rating']['promedio'] == 3.5
+    
+    @patch('controllers.data_controller.DatabaseManager')
+    def test_streaming_export_still_writes_parquet(self, mock_db_manager, tmp_path, monkeypatch):
+        """Test con STREAMING_EXPORT (export_files=False) y EXPORT_PARQUET se exporta el dataset Parquet"""
+        pytest.importorskip('pyarrow')
+        monkeypatch.chdir(tmp_path)
+        controller = DataController()
+        controller.settings.EXPORT_PARQUET = True
+        restaurants = [Restaurant(name="R1", address="A", postal_code="28001", rating=4.0)]
+        
+        with IncrementalExporter() as exporter:
+            exporter.write("28001", restaurants)
+        controller.process_and_save_data(restaurants, ['28001'], export_files=False)
+        
+        assert controller.load_parquet(postal_codes=['28001'])['name'].tolist() == ['R1']
+        assert not (tmp_path / "data/json/restaurantes_completo.json").exists()
+    
+    @patch('controllers.data_controller.DatabaseManager')
+    def test_save_postal_code_writes_mongodb_and_parquet(self, mock_db_manager, tmp_path):
+        """Test el guardado de un código postal recién terminado va a MongoDB y al dataset Parquet"""
+        pytest.importorskip('pyarrow')
+        from models.batch import RestaurantBatch
+        save = mock_db_manager.return_value.save_to_mongodb
+        save.side_effect = lambda rows: {'inserted': len(list(rows))}
+        controller = DataController(output_dir=str(tmp_path))
+        batch = RestaurantBatch.from_restaurants([Restaurant(name="R1", address="A", postal_code="28001")])
+        
+        assert controller.save_postal_code("28001", batch, parquet=True) == {'inserted': 1}
+        assert controller.load_parquet(postal_codes=['28001'])['name'].tolist() == ['R1']
+        
+        assert controller.save_postal_code("28002", RestaurantBatch(), ['p1'], parquet=True) == {}
+        mock_db_manager.return_value.add_postal_code.assert_called_once_with(['p1'], "28002")
+        assert controller.save_postal_code("28001", batch, mongodb=False, parquet=False) == {}
+        assert save.call_count == 1
+    
+    @pytest.mark.parametrize('compression, suffix', [(None, ''), ('gzip', '.gz'), ('zstd', '.zst')])
+    def test_export_to_ndjson(self, compression, suffix, tmp_path, monkeypatch):
+        """Test exportación NDJSON por bloques con compresión opcional"""
+        import gzip
+        import json
+        from datetime import datetime
+        if compression == 'zstd':
+            zstandard = pytest.importorskip('zstandard')
+        monkeypatch.chdir(tmp_path)
+        controller = DataController()
+        controller.settings.JSON_COMPRESSION = compression
+        controller.settings.JSON_CHUNK_SIZE = 2
+        
+        restaurants = [
+            Restaurant(name=f"Café {i}", address="Calle Mayor", postal_code="28001",
+                       business_hours={'day_0': 'Lunes: 9–22'}, scraped_at=datetime(2024, 5, 1, 12, 0, 0, 123456)).to_dict()
+            for i in range(5)
+        ]
+        controller._export_to_ndjson(restaurants)
+        
+        path = tmp_path / f"data/json/restaurantes_completo.ndjson{suffix}"
+        raw = path.read_bytes()
+        if compression == 'gzip':
+            raw = gzip.decompress(raw)
+        elif compression == 'zstd':
+            raw = zstandard.ZstdDecompressor().stream_reader(raw).read()
+        
+        records = [json.loads(line) for line in raw.decode('utf-8').splitlines()]
+        assert [r['name'] for r in records] == [f"Café {i}" for i in range(5)]
+        assert records[0]['scraped_at'] == '2024-05-01T12:00:00.123456'
+        assert records[0]['business_hours'] == {'day_0': 'Lunes: 9–22'}
+    
+    def test_generate_statistics_report_without_dataframe(self, tmp_path, monkeypatch):
+        """Test el reporte se genera desde el agregador, sin construir un DataFrame"""
+        import json
+        monkeypatch.chdir(tmp_path)
+        controller = DataController()
+        restaurants = [
+            {'name': 'R1', 'postal_code': '12345', 'rating': 4.0, 'phone': '+34', 'website': None, 'cuisine_type': 'Bar'},
+            {'name': 'R2', 'postal_code': '12345', 'rating': None, 'phone': None, 'website': None, 'cuisine_type': 'Bar'}
+        ]
+        
+        with patch('controllers.data_controller.pd.DataFrame') as mock_df:
+            controller._generate_statistics_report(restaurants, ['12345'])
+        
+        mock_df.assert_not_called()
+        with open("data/json/reporte_estadisticas.json", encoding='utf-8') as f:
+            report = json.load(f)
+        assert report['resumen_general']['restaurantes_por_codigo_postal'] == {'12345': 2}
+        assert report['resumen_general']['restaurantes_con_telefono'] == 1
+        assert report['tipos_cocina'] == {'Bar': 2}
+        assert report['estadisticas_rating']['mediana'] == 4.0
+
+class TestIncrementalExporter:
+    """Tests para la exportación incremental"""
+    
+    def test_write_appends_csv_and_ndjson(self, tmp_path):
+        """Test cada código postal se añade a los ficheros en cuanto llega"""
+        import csv
+        import json
+        
+        exporter = IncrementalExporter(csv_dir=str(tmp_path / "csv"), json_dir=str(tmp_path / "json"))
+        exporter.write("28001", [Restaurant(name="R1", address="A1", postal_code="28001", rating=4.5)])
+        
+        # Ya en disco antes de cerrar (sobrevive a un fallo posterior)
+        ndjson_path = tmp_path / "json" / "restaurantes_completo.ndjson"
+        assert len(ndjson_path.read_text(encoding='utf-8').splitlines()) == 1
+        
+        exporter.write("28002", [Restaurant(name="R2", address="A2", postal_code="28002"),
+                                 Restaurant(name="R3", address="A3", postal_code="28002")])
+        exporter.close()
+        
+        with open(tmp_path / "csv" / "restaurantes_completo.csv", encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        assert [row['name'] for row in rows] == ['R1', 'R2', 'R3']
+        assert rows[0]['rating'] == '4.5'
+        
+        with open(tmp_path / "csv" / "restaurantes_28002.csv", encoding='utf-8') as f:
+            assert [row['name'] for row in csv.DictReader(f)] == ['R2', 'R3']
+        
+        records = [json.loads(line) for line in ndjson_path.read_text(encoding='utf-8').splitlines()]
+        assert [r['name'] for r in records] == ['R1', 'R2', 'R3']
+        assert isinstance(records[0]['scraped_at'], str)
+        assert exporter.count == 3
+
+class TestBatchController:
+    """Tests para el modo batch de códigos postales"""
+    
+    def test_read_postal_codes_streams_and_deduplicates(self):
+        """Test lectura en streaming ignorando vacíos, comentarios y repetidos"""
+        from controllers.batch_controller import read_postal_codes
+        lines = iter(["28001\n", "\n", "# madrid\n", " 28002 \n", "28001\n"])
+        
+        codes = read_postal_codes(lines)
+        
+        assert next(codes) == '28001'
+        assert next(lines) == "\n"  # solo se ha leído lo necesario
+        assert list(codes) == ['28002']
+    
+    @patch('controllers.data_controller.DatabaseManager')
+    def test_bounded_window_and_sinks(self, mock_db_manager, tmp_path):
+        """Test no se leen más códigos que la ventana de búsquedas en curso y cada resultado se escribe"""
+        from controllers.batch_controller import BatchController
+        consumed = []
+        
+        def postal_codes():
+            for code in ['11111', '22222', '33333', '44444', '55555']:
+                consumed.append(code)
+                yield code
+        
+        # Códigos leídos y aún sin terminar cada vez que empieza una búsqueda
+        in_flight = []
+        def fake_search(postal_code, raise_errors):
+            in_flight.append(len(consumed) - len(in_flight))
+            return [Restaurant(name=f"R {postal_code}", address="A", postal_code=postal_code, place_id=postal_code)]
+        
+        scraper = MagicMock()
+        scraper.search_restaurants_by_postal_code.side_effect = fake_search
+        mock_db_manager.return_value.save_to_mongodb.side_effect = lambda rows: {
+            'inserted': len(list(rows)), 'updated': 0, 'unchanged': 0, 'errors': 0
+        }
+        view = MagicMock()
+        controller = BatchController(scraper, DataController(output_dir=str(tmp_path)), view,
+                                     sinks=['mongodb', 'csv'], max_workers=1)
+        
+        summary = controller.run(postal_codes())
+        
+        assert max(in_flight) <= 2
+        assert summary['postal_codes'] == 5
+        assert summary['mongodb']['inserted'] == 5
+        assert summary['failed'] == 0
+        assert (tmp_path / "csv/restaurantes_55555.csv").exists()
+        assert not (tmp_path / "json/restaurantes_completo.ndjson").exists()
+        assert view.show_postal_code_progress.call_count == 5
+        view.show_statistics.assert_called_once()
+    
+    def test_failed_postal_code_is_reported(self, tmp_path):
+        """Test un código postal con error se informa y no detiene el batch"""
+        from controllers.batch_controller import BatchController
+        def fake_search(postal_code, raise_errors):
+            if postal_code == '22222':
+                raise Exception("API caída")
+            return []
+        
+        scraper = MagicMock()
+        scraper.search_restaurants_by_postal_code.side_effect = fake_search
+        view = MagicMock()
+        
+        summary = BatchController(scraper, DataController(output_dir=str(tmp_path)), view,
+                                  sinks=['ndjson'], max_workers=2).run(['11111', '22222', '33333'])
+        
+        assert summary['failed_postal_codes'] == ['22222']
+        assert view.show_error.call_args[1] == {'postal_code': '22222'}
+    
+    @patch('controllers.data_controller.DatabaseManager')
+    def test_place_found_again_gets_every_postal_code(self, mock_db_manager, tmp_path):
+        """Test un lugar ya escrito desde otro código recibe en MongoDB los códigos que lo encuentran después"""
+        from controllers.batch_controller import BatchController
+        codes = ['28001', '28002', '28003', '28004', '28005']
+        scraper = MagicMock()
+        scraper.seen_places = SeenPlaces()
+        
+        def search(postal_code, raise_errors):
+            found = []
+            for place_id in ('shared', postal_code):
+                is_new, postal_codes = scraper.seen_places.claim(place_id, postal_code)
+                if is_new:
+                    found.append(Restaurant(name=place_id, address="A", postal_code=postal_code,
+                                            place_id=place_id, postal_codes=postal_codes))
+            return found
+        
+        scraper.search_restaurants_by_postal_code.side_effect = search
+        saved = {}
+        db_manager = mock_db_manager.return_value
+        db_manager.save_to_mongodb.side_effect = lambda rows: saved.update(
+            (row['place_id'], set(row['postal_codes'])) for row in rows) or {}
+        # Como update_many: los lugares aún no guardados no cambian
+        db_manager.add_postal_code.side_effect = lambda place_ids, code: [saved[p].add(code) for p in place_ids
+                                                                          if p in saved]
+        
+        summary = BatchController(scraper, DataController(output_dir=str(tmp_path)), MagicMock(),
+                                  sinks=['mongodb'], max_workers=2).run(codes)
+        
+        assert summary['failed'] == 0
+        assert saved['shared'] == set(codes)
+        assert scraper.seen_places.revisited('28005') == []
+    
+    @patch('googlemaps.Client')
+    def test_api_errors_of_the_real_client_are_failures(self, mock_googlemaps, tmp_path):
+        """Test un error de la API en GoogleMapsClient cuenta como código fallido y no como 0 resultados"""
+        import googlemaps
+        from controllers.batch_controller import BatchController
+        mock_client = MagicMock()
+        mock_googlemaps.return_value = mock_client
+        denied = googlemaps.exceptions.ApiError('REQUEST_DENIED')
+        for endpoint in ('geocode', 'places_nearby', 'place'):
+            getattr(mock_client, endpoint).side_effect = denied
+        scraper = GoogleMapsClient("AIzaSyTest_ValidKey_Format", rate_limiter=MagicMock())
+        
+        summary = BatchController(scraper, DataController(output_dir=str(tmp_path)), MagicMock(),
+                                  sinks=['ndjson'], max_workers=2).run(['11111', '22222'])
+        
+        assert summary['failed'] == 2
+        assert sorted(summary['failed_postal_codes']) == ['11111', '22222']
+    
+    def test_unknown_sink(self):
+        """Test destino no soportado"""
+        from controllers.batch_controller import BatchController
+        with pytest.raises(ValueError):
+            BatchController(MagicMock(), MagicMock(), MagicMock(), sinks=['excel'])
+
+class TestQueueWorker:
+    """Tests para el worker de la cola distribuida"""
+    
+    def _restaurants(self, postal_code, count=2):
+        return [Restaurant(name=f"R{i}", address="A", postal_code=postal_code, place_id=f"{postal_code}-{i}",
+                           postal_codes=[postal_code]) for i in range(count)]
+    
+    def test_worker_drains_queue_and_saves_to_mongodb(self, jobs_collection):
+        """Test el worker procesa toda la cola y guarda cada código en MongoDB"""
+        from controllers.worker_controller import QueueWorker
+        from models.job_queue import JobQueue
+        queue = JobQueue(jobs_collection)
+        queue.enqueue(["28001", "28002"])
+        scraper = MagicMock()
+        scraper.search_restaurants_by_postal_code.side_effect = lambda code, raise_errors: self._restaurants(code)
+        db_manager = MagicMock()
+        db_manager.save_to_mongodb.side_effect = lambda docs: {'inserted': len(list(docs))}
+        view = MagicMock()
+        
+        summary = QueueWorker(queue, scraper, db_manager, view, worker_id="w1").run()
+        
+        assert summary['completed'] == 2
+        assert summary['restaurants_total'] == 4
+        assert summary['mongodb']['inserted'] == 4
+        assert summary['queue']['done'] == 2
+        assert jobs_collection.docs["28002"]['restaurants'] == 2
+        assert view.show_postal_code_progress.call_count == 2
+    
+    def test_worker_failure_requeues_job(self, jobs_collection):
+        """Test un error de la API devuelve el trabajo a la cola para otro intento"""
+        from controllers.worker_controller import QueueWorker
+        from models.job_queue import JobQueue
+        queue = JobQueue(jobs_collection, max_attempts=2)
+        queue.enqueue(["28001"])
+        scraper = MagicMock()
+        scraper.search_restaurants_by_postal_code.side_effect = [Exception("OVER_QUERY_LIMIT"),
+                                                                 self._restaurants("28001")]
+        
+        summary = QueueWorker(queue, scraper, MagicMock(), MagicMock(), worker_id="w1").run()
+        
+        assert summary['failed_postal_codes'] == ["28001"]
+        assert summary['completed'] == 1
+        assert jobs_collection.docs["28001"]['attempts'] == 2
+        assert jobs_collection.docs["28001"]['status'] == 'done'
+    
+    def _claiming_search(self, scraper, places_by_code, failures=()):
+        """Búsqueda falsa que reclama los lugares en scraper.seen_places como el cliente real"""
+        failures = list(failures)
+        
+        def search(postal_code, raise_errors):
+            found = []
+            for place_id in places_by_code[postal_code]:
+                is_new, postal_codes = scraper.seen_places.claim(place_id, postal_code)
+                if is_new:
+                    found.append(Restaurant(name=place_id, address="A", postal_code=postal_code,
+                                            place_id=place_id, postal_codes=postal_codes))
+            if postal_code in failures:
+                failures.remove(postal_code)
+                raise Exception("API caída")
+            return found
+        return search
+    
+    def test_worker_shares_seen_places_between_jobs(self, jobs_collection):
+        """Test un lugar compartido se guarda una vez y los demás códigos se añaden con $addToSet"""
+        from controllers.worker_controller import QueueWorker
+        from models.job_queue import JobQueue
+        queue = JobQueue(jobs_collection)
+        queue.enqueue(["28001", "28002"])
+        scraper = MagicMock()
+        scraper.seen_places = SeenPlaces()
+        scraper.search_restaurants_by_postal_code.side_effect = self._claiming_search(
+            scraper, {"28001": ["a", "shared"], "28002": ["shared", "b"]})
+        saved = []
+        db_manager = MagicMock()
+        db_manager.save_to_mongodb.side_effect = lambda docs: saved.extend(doc['place_id'] for doc in docs) or {}
+        
+        summary = QueueWorker(queue, scraper, db_manager, MagicMock(), worker_id="w1").run()
+        
+        assert summary['completed'] == 2
+        assert sorted(saved) == ["a", "b", "shared"]
+        db_manager.add_postal_code.assert_called_once_with(["shared"], "28002")
+        assert scraper.seen_places.revisited("28002") == []
+    
+    def test_worker_retry_returns_every_place(self, jobs_collection):
+        """Test el reintento de un trabajo fallido vuelve a devolver los lugares que reclamó"""
+        from controllers.worker_controller import QueueWorker
+        from models.job_queue import JobQueue
+        queue = JobQueue(jobs_collection, max_attempts=2)
+        queue.enqueue(["28001", "28002"])
+        scraper = MagicMock()
+        scraper.seen_places = SeenPlaces()
+        scraper.search_restaurants_by_postal_code.side_effect = self._claiming_search(
+            scraper, {"28001": ["a", "shared"], "28002": ["shared", "b"]}, failures=["28002"])
+        saved = []
+        db_manager = MagicMock()
+        db_manager.save_to_mongodb.side_effect = lambda docs: saved.extend(doc['place_id'] for doc in docs) or {}
+        
+        summary = QueueWorker(queue, scraper, db_manager, MagicMock(), worker_id="w1").run()
+        
+        assert summary['failed_postal_codes'] == ["28002"]
+        assert summary['completed'] == 2
+        assert sorted(saved) == ["a", "b", "shared"]
+        db_manager.add_postal_code.assert_called_once_with(["shared"], "28002")
+    
+    def test_lost_lease_discards_results(self, jobs_collection):
+        """Test si el lease pasa a otro worker durante la búsqueda los resultados se descartan"""
+        import threading
+        from controllers.worker_controller import QueueWorker
+        from models.job_queue import JobQueue
+        queue = JobQueue(jobs_collection, lease_seconds=60)
+        queue.enqueue(["28001"])
+        stolen = threading.Event()
+        
+        def slow_search(postal_code, raise_errors):
+            # Otro worker retoma el trabajo como si el lease hubiera caducado
+            jobs_collection.docs[postal_code]['worker'] = "w2"
+            stolen.wait(timeout=5)
+            return self._restaurants(postal_code)
+        
+        scraper = MagicMock()
+        scraper.search_restaurants_by_postal_code.side_effect = slow_search
+        db_manager = MagicMock()
+        worker = QueueWorker(queue, scraper, db_manager, MagicMock(), worker_id="w1", heartbeat_interval=0.01)
+        original_heartbeat = queue.heartbeat
+        
+        def heartbeat(postal_code, worker_id):
+            alive = original_heartbeat(postal_code, worker_id)
+            stolen.set()
+            return alive
+        
+        queue.heartbeat = heartbeat
+        summary = worker.run()
         
-        # Test con diferentes tipos
-        assert controller._convert_to_json_serializable(np.int64(42)) == 42
-        assert controller._convert_to_json_serializable(np.float64(3.14)) == 3.14
-        assert controller._convert_to_json_serializable(np.array([1, 2, 3])) == [1, 2, 3]
-        assert controller._convert_to_json_serializable(pd.NA) is None  #  pd.NA en lugar de pd.NaType()
-        assert controller._convert_to_json_serializable("string") == "string"
\ No newline at end of file
+        assert summary['lost_leases'] == ["28001"]
+        assert summary['completed'] == 0
+        db_manager.save_to_mongodb.assert_not_called()
+        assert jobs_collection.docs["28001"]['status'] == 'leased'
@@ -0,0 +1,88 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from benchmarks.fake_maps_server import FakeMapsServer, SyntheticCity
+from controllers.rate_limiter import RateLimiter
+from controllers.scraper_controller import GoogleMapsClient
+
+RATES = {'geocode': 200, 'places_nearby': 200, 'place': 200}
+
+@pytest.fixture
+def fake_maps(monkeypatch):
+    """Servidor de Google Maps falso en un puerto libre, con tokens de página rápidos"""
+    with FakeMapsServer(SyntheticCity(1500, radius=4000, core_share=0.4, core_radius=1000),
+                        page_token_delay=0.005) as server:
+        monkeypatch.setenv('GOOGLE_MAPS_BASE_URL', server.base_url)
+        monkeypatch.setattr('config.settings.Settings.GOOGLE_MAPS_BASE_URL', server.base_url)
+        monkeypatch.setattr('config.settings.Settings.PAGE_TOKEN_POLL_INTERVAL', 0.005)
+        monkeypatch.setattr('config.settings.Settings.PLACE_DETAILS_CACHE_PATH', '')
+        yield server
+
+def _client(rates=RATES, **rate_limiter_options) -> GoogleMapsClient:
+    return GoogleMapsClient("AIzaFakeServerKey", rate_limiter=RateLimiter(rates, **rate_limiter_options))
+
+def _within(city: SyntheticCity, location, radius: float):
+    lat, lng = location['lat'], location['lng']
+    return {
+        place['place_id'] for place in city.places
+        if math.hypot((place['geometry']['location']['lat'] - lat) * 111320.0,
+                      (place['geometry']['location']['lng'] - lng) * 111320.0 * math.cos(math.radians(lat))) <= radius
+    }
+
+def test_tiled_search_covers_dense_area_over_http(fake_maps, monkeypatch):
+    """Test búsqueda completa por HTTP: teselas, paginación con sondeo del token y modo Nearby"""
+    monkeypatch.setattr('config.settings.Settings.DETAILS_MODE', 'nearby')
+    monkeypatch.setattr('config.settings.Settings.SEARCH_RADIUS', 1500)
+    scraper = _client(burst=20)
+    
+    restaurants = scraper.search_restaurants_by_postal_code("28013")
+    
+    location = fake_maps.city.locate("28013")
+    expected = _within(fake_maps.city, location, 1500)
+    assert len(expected) > 60  # una sola búsqueda se habría truncado
+    assert expected <= {r.place_id for r in restaurants}
+    assert len({r.place_id for r in restaurants}) == len(restaurants)
+    assert fake_maps.stats['places_nearby.requests'] > 3
+    assert fake_maps.stats['place.requests'] == 0
+
+def test_place_details_fields_over_http(fake_maps):
+    """Test Place Details devuelve solo los campos pedidos y se convierten en Restaurant"""
+    scraper = _client(burst=20)
+    place = fake_maps.city.places[0]
+    
+    restaurant = scraper._extract_restaurant_data({'place_id': place['place_id']}, "28001")
+    
+    assert restaurant.name == place['name']
+    assert restaurant.address == place['formatted_address']
+    assert restaurant.latitude == place['geometry']['location']['lat']
+    assert len(restaurant.business_hours) == 7
+    assert fake_maps.stats['place.requests'] == 1
+
+def test_over_query_limit_backoff_over_http(fake_maps):
+    """Test con un límite de QPS en el servidor el backoff adaptativo termina todas las peticiones"""
+    fake_maps.qps = 2
+    # La ráfaga del cliente supera el límite del servidor
+    scraper = _client(burst=4, backoff_base=0.1)
+    
+    locations = [scraper._get_location_from_postal_code(f"280{i:02d}") for i in range(4)]
+    
+    assert locations == [fake_maps.city.locate(f"280{i:02d}") for i in range(4)]
+    assert fake_maps.stats['geocode.over_query_limit'] > 0
+
+def test_concurrent_over_query_limit_does_not_collapse_rate(fake_maps):
+    """Test varios hilos con OVER_QUERY_LIMIT en la misma ráfaga reducen el rate una sola vez por pausa"""
+    fake_maps.qps = 4
+    scraper = _client({'geocode': 4}, burst=8, backoff_base=0.1)
+    postal_codes = [f"280{i:02d}" for i in range(12)]
+    
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        locations = list(executor.map(scraper._get_location_from_postal_code, postal_codes))
+    elapsed = time.monotonic() - started
+    
+    assert locations == [fake_maps.city.locate(code) for code in postal_codes]
+    assert fake_maps.stats['geocode.over_query_limit'] > 0
+    # Antes cada aviso concurrente dividía el rate a la mitad hasta el mínimo (4 / 16)
+    assert scraper.rate_limiter.buckets['geocode'].rate >= 1
+    assert elapsed < 10
@@ -0,0 +1,77 @@
+import os
+import pytest
+import pymongo
+from models.database import DatabaseManager
+
+MONGODB_TEST_URI = os.getenv('MONGODB_TEST_URI', 'mongodb://localhost:27017')
+
+@pytest.fixture
+def db_manager():
+    """DatabaseManager contra una base de datos de test en un MongoDB local (docker compose up -d mongodb)"""
+    client = pymongo.MongoClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except pymongo.errors.PyMongoError:
+        pytest.skip("MongoDB local no disponible")
+    
+    manager = DatabaseManager()
+    manager.settings.MONGODB_URI = MONGODB_TEST_URI
+    manager.settings.MONGODB_DATABASE = 'restaurantes_test_db'
+    
+    yield manager
+    
+    manager.close_connections()
+    client.drop_database('restaurantes_test_db')
+    client.close()
+
+def test_geospatial_queries(db_manager):
+    """Test índice 2dsphere y consultas por cercanía y rectángulo en el servidor"""
+    db_manager.save_to_mongodb([
+        {'name': 'Sol', 'address': 'Puerta del Sol', 'postal_code': '28013', 'place_id': 'sol',
+         'latitude': 40.4169, 'longitude': -3.7035},
+        {'name': 'Retiro', 'address': 'Parque del Retiro', 'postal_code': '28009', 'place_id': 'retiro',
+         'latitude': 40.4153, 'longitude': -3.6845},
+        {'name': 'Barcelona', 'address': 'Plaça Catalunya', 'postal_code': '08002', 'place_id': 'bcn',
+         'latitude': 41.3870, 'longitude': 2.1700},
+    ])
+    
+    near = db_manager.find_near(40.4168, -3.7038, radius=2000)
+    assert [doc['name'] for doc in near] == ['Sol', 'Retiro']
+    assert near[0]['distance_m'] < near[1]['distance_m']
+    
+    in_box = db_manager.find_in_bounding_box(40.0, -4.0, 41.0, -3.0)
+    assert sorted(doc['name'] for doc in in_box) == ['Retiro', 'Sol']
+
+def test_statistics_report_matches_in_memory(db_manager):
+    """Test el reporte agregado en MongoDB coincide con el calculado en Python"""
+    from models.statistics import RestaurantStats
+    restaurants = [
+        {'name': f'R{i}', 'address': f'Calle {i}', 'postal_code': ['28001', '28002'][i % 2],
+         'place_id': f'p{i}', 'rating': [None, 3.5, 4.0, 4.7][i % 4],
+         'cuisine_type': ['Italiana', 'China', None][i % 3],
+         'phone': '+34 600' if i % 2 else None, 'website': 'https://r.es' if i % 5 == 0 else None}
+        for i in range(40)
+    ]
+    db_manager.save_to_mongodb(restaurants)
+    
+    report = db_manager.get_statistics_report(['28001', '28002'])
+    expected = RestaurantStats().add_many(restaurants).to_report(['28001', '28002'])
+    
+    rating_promedio = report['resumen_general'].pop('rating_promedio')
+    assert rating_promedio == pytest.approx(expected['resumen_general'].pop('rating_promedio'))
+    assert report['resumen_general'] == expected['resumen_general']
+    assert report['tipos_cocina'] == expected['tipos_cocina']
+    assert report['estadisticas_rating'] == pytest.approx(expected['estadisticas_rating'])
+
+def test_postal_code_filter_includes_legacy_documents(db_manager):
+    """Test el filtro por código postal encuentra los documentos antiguos sin postal_codes y los nuevos"""
+    db_manager.save_to_mongodb([
+        {'name': 'Nuevo', 'address': 'A', 'postal_code': '28001', 'place_id': 'nuevo',
+         'postal_codes': ['28001', '28002']},
+    ])
+    # Documento de la inserción antigua (insert_many), sin postal_codes
+    db_manager.connect_mongodb().insert_one({'name': 'Antiguo', 'address': 'B', 'postal_code': '28002'})
+    
+    assert [doc['name'] for doc in db_manager.get_restaurants_by_postal_code('28001')] == ['Nuevo']
+    assert sorted(doc['name'] for doc in db_manager.get_restaurants_by_postal_code('28002')) == ['Antiguo', 'Nuevo']
+    assert sorted(doc['name'] for doc in db_manager.iter_restaurants_by_postal_code('28002')) == ['Antiguo', 'Nuevo']
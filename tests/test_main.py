@@ -0,0 +1,199 @@
+import json
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from main import main, parse_args, scrape_postal_codes
+from models.restaurant import Restaurant
+
+class TestScrapePostalCodes:
+    """Tests para el pipeline concurrente de códigos postales"""
+    
+    def test_results_merged_in_input_order(self):
+        """Test resultados combinados en el orden de entrada"""
+        delays = {'11111': 0.2, '22222': 0.0, '33333': 0.1}
+        
+        def fake_search(postal_code):
+            time.sleep(delays[postal_code])
+            return [Restaurant(name=f"R {postal_code}", address="A", postal_code=postal_code)]
+        
+        scraper = MagicMock()
+        scraper.search_restaurants_by_postal_code.side_effect = fake_search
+        view = MagicMock()
+        
+        result = scrape_postal_codes(scraper, ['11111', '22222', '33333'], view, max_workers=3)
+        
+        assert [r.postal_code for r in result] == ['11111', '22222', '33333']
+        assert view.show_postal_code_progress.call_count == 3
+    
+    def test_error_in_one_postal_code_is_isolated(self):
+        """Test un error en un código postal no afecta al resto"""
+        def fake_search(postal_code):
+            if postal_code == '22222':
+                raise Exception("API caída")
+            return [Restaurant(name="R", address="A", postal_code=postal_code)]
+        
+        scraper = MagicMock()
+        scraper.search_restaurants_by_postal_code.side_effect = fake_search
+        view = MagicMock()
+        
+        result = scrape_postal_codes(scraper, ['11111', '22222', '33333'], view, max_workers=2)
+        
+        assert [r.postal_code for r in result] == ['11111', '33333']
+        view.show_error.assert_called_once()
+    
+    def test_on_result_called_per_postal_code(self):
+        """Test el callback recibe cada código postal al terminar"""
+        scraper = MagicMock()
+        scraper.search_restaurants_by_postal_code.side_effect = lambda postal_code: [
+            Restaurant(name="R", address="A", postal_code=postal_code)
+        ]
+        on_result = MagicMock()
+        
+        scrape_postal_codes(scraper, ['11111', '22222'], MagicMock(), max_workers=2, on_result=on_result)
+        
+        assert sorted(c[0][0] for c in on_result.call_args_list) == ['11111', '22222']
+
+
+class TestBatchMode:
+    """Tests para el modo batch no interactivo"""
+    
+    @patch('main.DataController')
+    @patch('main.GoogleMapsClient')
+    def test_batch_mode_reads_file_and_reports_json(self, mock_client, mock_data_controller,
+                                                    tmp_path, monkeypatch, capsys):
+        """Test --input procesa el fichero sin preguntar y emite progreso JSON"""
+        monkeypatch.setenv('GOOGLE_MAPS_API_KEY', 'test_key')
+        from controllers.data_controller import DataController
+        mock_data_controller.side_effect = lambda output_dir: DataController(output_dir=output_dir)
+        mock_client.return_value.search_restaurants_by_postal_code.side_effect = lambda postal_code, raise_errors: [
+            Restaurant(name=f"R {postal_code}", address="A", postal_code=postal_code, rating=4.0)
+        ]
+        codes = tmp_path / "codigos.txt"
+        codes.write_text("28001\n\n# comentario\n28002\n28001\n", encoding='utf-8')
+        
+        with patch('main.get_settings') as mock_settings, pytest.raises(SystemExit) as exit_info:
+            mock_settings.return_value.GOOGLE_MAPS_API_KEY = 'test_key'
+            main(['--input', str(codes), '--sinks', 'csv,ndjson', '--output-dir', str(tmp_path / "out"),
+                  '--workers', '2'])
+        
+        assert exit_info.value.code == 0
+        events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert sorted(e['postal_code'] for e in events if e['event'] == 'postal_code') == ['28001', '28002']
+        assert events[-1]['event'] == 'summary'
+        assert events[-1]['restaurants_total'] == 2
+        assert (tmp_path / "out/csv/restaurantes_28002.csv").exists()
+        assert (tmp_path / "out/json/reporte_estadisticas.json").exists()
+    
+    def test_invalid_sink_is_rejected(self):
+        """Test destinos desconocidos se rechazan al parsear"""
+        with pytest.raises(SystemExit):
+            parse_args(['--input', '-', '--sinks', 'csv,excel'])
+    
+    def test_journal_status_prints_progress(self, tmp_path, capsys):
+        """Test --journal-status muestra el progreso del diario sin API key"""
+        from models.journal import RunJournal
+        path = str(tmp_path / "journal.sqlite3")
+        journal = RunJournal(path)
+        journal.start("28001")
+        journal.complete("28001")
+        journal.close()
+        
+        main(['--journal-status', path])
+        
+        assert json.loads(capsys.readouterr().out)['done'] == 1
+    
+    @patch('main.DatabaseManager')
+    def test_enqueue_and_queue_status(self, mock_db_manager, jobs_collection, tmp_path, capsys):
+        """Test --enqueue y --queue-status no necesitan API key y emiten JSON"""
+        from models.job_queue import JobQueue
+        mock_db_manager.return_value.get_job_queue.return_value = JobQueue(jobs_collection)
+        codes = tmp_path / "codigos.txt"
+        codes.write_text("28001\n28002\n28001\n", encoding='utf-8')
+        
+        with patch('main.get_settings') as mock_settings:
+            mock_settings.return_value.GOOGLE_MAPS_API_KEY = None
+            with pytest.raises(SystemExit) as exit_info:
+                main(['--enqueue', str(codes)])
+            assert exit_info.value.code == 0
+            with pytest.raises(SystemExit):
+                main(['--queue-status'])
+        
+        events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert events[0]['enqueued'] == 2
+        assert events[1]['queue']['pending'] == 2
+
+class TestInteractiveMode:
+    """Tests para la ejecución interactiva"""
+    
+    @patch('controllers.data_controller.DatabaseManager')
+    @patch('main.GoogleMapsClient')
+    @patch('main.ConsoleView')
+    def test_streaming_export_saves_each_postal_code(self, mock_view, mock_client, mock_db_manager,
+                                                     tmp_path, monkeypatch):
+        """Test con STREAMING_EXPORT cada código se guarda al terminar y no se acumula toda la ejecución"""
+        pytest.importorskip('pyarrow')
+        from models.batch import RestaurantBatch
+        monkeypatch.chdir(tmp_path)
+        postal_codes = ['28001', '28002', '28003']
+        mock_view.return_value.get_postal_codes_input.return_value = postal_codes
+        mock_client.return_value.details_cache = None
+        mock_client.return_value.search_restaurants_by_postal_code.side_effect = lambda postal_code: [
+            Restaurant(name=f"R {postal_code}", address="A", postal_code=postal_code, rating=4.0)
+        ]
+        save = mock_db_manager.return_value.save_to_mongodb
+        save.side_effect = lambda rows: {'inserted': len(list(rows)), 'updated': 0, 'unchanged': 0}
+        
+        with patch('main.get_settings') as mock_settings, patch.object(RestaurantBatch, 'concat') as mock_concat:
+            mock_settings.return_value.GOOGLE_MAPS_API_KEY = 'test_key'
+            mock_settings.return_value.STREAMING_EXPORT = True
+            mock_settings.return_value.EXPORT_PARQUET = True
+            mock_settings.return_value.MAX_WORKERS = 2
+            main([])
+        
+        mock_concat.assert_not_called()
+        assert save.call_count == 3
+        assert (tmp_path / "data/parquet/restaurantes/postal_code=28002").is_dir()
+        report = json.loads((tmp_path / "data/json/reporte_estadisticas.json").read_text(encoding='utf-8'))
+        assert report['resumen_general']['total_restaurantes'] == 3
+        mock_view.return_value.show_statistics.assert_called_once()
+    
+    @patch('controllers.data_controller.DatabaseManager')
+    @patch('main.GoogleMapsClient')
+    @patch('main.ConsoleView')
+    def test_streaming_adds_later_postal_codes_to_saved_places(self, mock_view, mock_client, mock_db_manager,
+                                                               tmp_path, monkeypatch):
+        """Test con STREAMING_EXPORT un lugar ya guardado recibe los códigos postales que lo encuentran después"""
+        from controllers.scraper_controller import SeenPlaces
+        monkeypatch.chdir(tmp_path)
+        postal_codes = ['28001', '28002', '28003', '28004']
+        mock_view.return_value.get_postal_codes_input.return_value = postal_codes
+        scraper = mock_client.return_value
+        scraper.details_cache = None
+        scraper.seen_places = SeenPlaces()
+        
+        def search(postal_code):
+            found = []
+            for place_id in ('shared', postal_code):
+                is_new, codes = scraper.seen_places.claim(place_id, postal_code)
+                if is_new:
+                    found.append(Restaurant(name=place_id, address="A", postal_code=postal_code,
+                                            place_id=place_id, postal_codes=codes))
+            return found
+        
+        scraper.search_restaurants_by_postal_code.side_effect = search
+        saved = {}
+        db_manager = mock_db_manager.return_value
+        db_manager.save_to_mongodb.side_effect = lambda rows: saved.update(
+            (row['place_id'], set(row['postal_codes'])) for row in rows) or {}
+        db_manager.add_postal_code.side_effect = lambda place_ids, code: [saved[p].add(code) for p in place_ids
+                                                                          if p in saved]
+        
+        with patch('main.get_settings') as mock_settings:
+            mock_settings.return_value.GOOGLE_MAPS_API_KEY = 'test_key'
+            mock_settings.return_value.STREAMING_EXPORT = True
+            mock_settings.return_value.EXPORT_PARQUET = False
+            mock_settings.return_value.MAX_WORKERS = 2
+            main([])
+        
+        assert saved['shared'] == set(postal_codes)
+        assert scraper.seen_places.revisited('28004') == []
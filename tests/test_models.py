@@ -1,8 +1,16 @@
 import pytest
+import sys
+import numpy as np
+from dataclasses import FrozenInstanceError
 from datetime import datetime
 from models.restaurant import Restaurant
 from models.database import DatabaseManager
-from unittest.mock import patch, MagicMock
+from models.cache import GeocodeCache, PlaceDetailsCache
+from models.journal import RunJournal
+from models.job_queue import JobQueue
+from models.statistics import RestaurantStats
+from models.batch import RestaurantBatch
+from unittest.mock import patch, MagicMock, ANY
 
 class TestRestaurant:
     """Tests para el modelo Restaurant"""
@@ -77,6 +85,68 @@ class TestRestaurant:
         assert restaurant.website is None
         assert restaurant.latitude is None
         assert restaurant.longitude is None
+        assert restaurant.place_id is None
+        assert restaurant.postal_codes == ["00000"]
+    
+    def test_restaurant_to_dict_includes_place_id(self):
+        """Test place_id y códigos postales en el diccionario"""
+        restaurant = Restaurant(
+            name="Dedup Test",
+            address="Address",
+            postal_code="28001",
+            place_id="ChIJ123",
+            postal_codes=["28001", "28002"]
+        )
+        
+        data = restaurant.to_dict()
+        
+        assert data['place_id'] == "ChIJ123"
+        assert data['postal_codes'] == ["28001", "28002"]
+    
+    def test_restaurant_is_immutable_and_slotted(self):
+        """Test representación compacta: inmutable y sin __dict__ por instancia"""
+        restaurant = Restaurant(name="R", address="A", postal_code="28001")
+        
+        with pytest.raises(FrozenInstanceError):
+            restaurant.rating = 5.0
+        if sys.version_info >= (3, 10):
+            assert not hasattr(restaurant, '__dict__')
+    
+    def test_restaurant_interns_categorical_fields(self):
+        """Test los campos categóricos y horarios iguales comparten una única copia"""
+        hours = {'day_1': 'Martes: 9–22', 'day_0': 'Lunes: 9–22'}
+        first = Restaurant(name="R1", address="A", postal_code="".join(["280", "01"]),
+                           cuisine_type="".join(["Ita", "liana"]), business_hours=hours)
+        second = Restaurant(name="R2", address="B", postal_code="".join(["2800", "1"]),
+                            cuisine_type="".join(["Italia", "na"]), business_hours=dict(hours))
+        
+        assert first.cuisine_type is second.cuisine_type
+        assert first.postal_code is second.postal_code
+        assert first.business_hours is second.business_hours
+        assert first.business_hours == ('Lunes: 9–22', 'Martes: 9–22')
+        assert first.to_dict()['business_hours'] == {'day_0': 'Lunes: 9–22', 'day_1': 'Martes: 9–22'}
+    
+    def test_hours_cache_is_bounded(self):
+        """Test la caché de horarios no crece más allá de su tamaño máximo"""
+        from models.restaurant import HOURS_CACHE_SIZE, _shared_hours
+        
+        for i in range(HOURS_CACHE_SIZE + 100):
+            Restaurant(name="R", address="A", postal_code="28001", business_hours=[f'Lunes: {i}'])
+        
+        assert _shared_hours.cache_info().currsize == HOURS_CACHE_SIZE
+    
+    def test_restaurant_as_row_matches_fields(self):
+        """Test la fila sigue el orden de Restaurant.FIELDS y reutiliza los mismos objetos"""
+        restaurant = Restaurant(name="R", address="A", postal_code="28001", rating=4.5,
+                                business_hours=['Lunes', 'Martes'], postal_codes=['28001', '28002'])
+        
+        row = restaurant.as_row()
+        data = restaurant.to_dict()
+        
+        assert Restaurant.FIELDS == tuple(data)
+        assert dict(zip(Restaurant.FIELDS, row))['rating'] == 4.5
+        assert row[Restaurant.FIELDS.index('postal_codes')] is restaurant.postal_codes
+        assert row[Restaurant.FIELDS.index('business_hours')] == ('Lunes', 'Martes')
 
 class TestDatabaseManager:
     """Tests para DatabaseManager"""
@@ -98,6 +168,9 @@ class TestDatabaseManager:
         assert collection is not None
         mock_mongo_client.assert_called_once()
         mock_client.admin.command.assert_called_with('ping')
+        mock_client.__getitem__.assert_any_call('restaurantes_db')
+        index_names = [c[1]['name'] for c in collection.create_index.call_args_list]
+        assert index_names == ['place_id_unique', 'location_2dsphere', 'postal_code', 'postal_codes', 'scraped_at']
     
     @patch('pymongo.MongoClient')
     def test_connect_mongodb_failure(self, mock_mongo_client):
@@ -113,19 +186,19 @@ class TestDatabaseManager:
     
     @patch('models.database.DatabaseManager.connect_mongodb')
     def test_save_to_mongodb_success(self, mock_connect):
-        """Test guardado exitoso en MongoDB"""
+        """Test guardado exitoso en MongoDB con upserts"""
         # Configurar mock
         mock_collection = MagicMock()
         mock_connect.return_value = mock_collection
         
         mock_result = MagicMock()
-        mock_result.inserted_ids = ['id1', 'id2', 'id3']
-        mock_collection.insert_many.return_value = mock_result
+        mock_result.bulk_api_result = {'nUpserted': 1, 'nMatched': 1, 'nModified': 0}
+        mock_collection.bulk_write.return_value = mock_result
         
         # Datos de prueba
         restaurants = [
-            {'name': 'Restaurant 1', 'address': 'Address 1', 'postal_code': '12345'},
-            {'name': 'Restaurant 2', 'address': 'Address 2', 'postal_code': '67890'}
+            {'name': 'Restaurant 1', 'address': 'Address 1', 'postal_code': '12345', 'place_id': 'p1'},
+            {'name': 'Restaurant 2', 'address': 'Address 2', 'postal_code': '67890', 'place_id': 'p2'}
         ]
         
         # Ejecutar
@@ -133,9 +206,66 @@ class TestDatabaseManager:
         result = db_manager.save_to_mongodb(restaurants)
         
         # Verificaciones
-        assert len(result) == 3
-        assert result == ['id1', 'id2', 'id3']
-        mock_collection.insert_many.assert_called_once()
+        assert result == {'inserted': 1, 'updated': 0, 'unchanged': 1, 'errors': 0}
+        operations = mock_collection.bulk_write.call_args[0][0]
+        assert len(operations) == 2
+        assert operations[0]._filter == {'place_id': 'p1'}
+        assert mock_collection.bulk_write.call_args[1] == {'ordered': False}
+        mock_collection.insert_many.assert_not_called()
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_save_to_mongodb_upsert_document(self, mock_connect):
+        """Test el upsert conserva scraped_at inicial y acumula códigos postales"""
+        mock_collection = MagicMock()
+        mock_connect.return_value = mock_collection
+        mock_collection.bulk_write.return_value.bulk_api_result = {'nUpserted': 1, 'nMatched': 0, 'nModified': 0}
+        scraped_at = datetime(2024, 1, 1)
+        
+        db_manager = DatabaseManager()
+        db_manager.save_to_mongodb([{
+            'name': 'R', 'address': 'A', 'postal_code': '28001', 'place_id': 'p1',
+            'postal_codes': ['28001', '28002'], 'rating': '4', 'scraped_at': scraped_at
+        }])
+        
+        update = mock_collection.bulk_write.call_args[0][0][0]._doc
+        assert update['$set'] == {'name': 'R', 'address': 'A', 'place_id': 'p1', 'rating': 4.0}
+        assert update['$setOnInsert'] == {'scraped_at': scraped_at, 'postal_code': '28001'}
+        assert update['$addToSet'] == {'postal_codes': {'$each': ['28001', '28002']}}
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_save_to_mongodb_in_batches(self, mock_connect):
+        """Test escritura en lotes del tamaño configurado"""
+        mock_collection = MagicMock()
+        mock_connect.return_value = mock_collection
+        mock_collection.bulk_write.return_value.bulk_api_result = {'nUpserted': 2, 'nMatched': 0, 'nModified': 0}
+        
+        db_manager = DatabaseManager()
+        db_manager.settings.MONGODB_BATCH_SIZE = 2
+        restaurants = [{'name': f'R{i}', 'address': 'A', 'postal_code': '1', 'place_id': f'p{i}'} for i in range(5)]
+        
+        result = db_manager.save_to_mongodb(restaurants)
+        
+        assert mock_collection.bulk_write.call_count == 3
+        assert result['inserted'] == 6
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_save_to_mongodb_bad_document_does_not_abort(self, mock_connect):
+        """Test un documento erróneo no aborta el lote"""
+        from pymongo.errors import BulkWriteError
+        mock_collection = MagicMock()
+        mock_connect.return_value = mock_collection
+        mock_collection.bulk_write.side_effect = BulkWriteError({
+            'nUpserted': 1, 'nMatched': 0, 'nModified': 0,
+            'writeErrors': [{'index': 1, 'code': 11000, 'errmsg': 'duplicate key'}]
+        })
+        
+        db_manager = DatabaseManager()
+        result = db_manager.save_to_mongodb([
+            {'name': 'R1', 'address': 'A', 'postal_code': '1', 'place_id': 'p1'},
+            {'name': 'R2', 'address': 'A', 'postal_code': '1', 'place_id': 'p2'}
+        ])
+        
+        assert result == {'inserted': 1, 'updated': 0, 'unchanged': 0, 'errors': 1}
     
     @patch('models.database.DatabaseManager.connect_mongodb')
     def test_save_to_mongodb_connection_failure(self, mock_connect):
@@ -169,4 +299,605 @@ class TestDatabaseManager:
         # Verificaciones
         assert len(result) == 2
         assert result[0]['name'] == 'Restaurant A'
-        mock_collection.find.assert_called_with({'postal_code': '12345'})
\ No newline at end of file
+        mock_collection.find.assert_called_with({'$or': [{'postal_codes': '12345'}, {'postal_code': '12345'}]})
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_add_postal_code_uses_add_to_set(self, mock_connect):
+        """Test añadir un código postal a restaurantes ya guardados no reescribe el documento"""
+        mock_collection = MagicMock()
+        mock_collection.update_many.return_value.modified_count = 2
+        mock_connect.return_value = mock_collection
+        
+        assert DatabaseManager().add_postal_code(['p1', 'p2'], '28002') == 2
+        mock_collection.update_many.assert_called_once_with({'place_id': {'$in': ['p1', 'p2']}},
+                                                            {'$addToSet': {'postal_codes': '28002'}})
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_iter_restaurants_streams_cursor(self, mock_connect):
+        """Test lectura en streaming con proyección, filtros y batch_size"""
+        mock_collection = MagicMock()
+        mock_connect.return_value = mock_collection
+        mock_cursor = MagicMock()
+        mock_cursor.__iter__.return_value = iter([{'name': 'A'}, {'name': 'B'}])
+        mock_collection.find.return_value = mock_cursor
+        
+        db_manager = DatabaseManager()
+        stream = db_manager.iter_restaurants(fields=['name'], batch_size=500, min_rating=4.0, cuisine_type='Italiana')
+        
+        # Generador perezoso: no consulta hasta que se itera
+        mock_collection.find.assert_not_called()
+        assert [doc['name'] for doc in stream] == ['A', 'B']
+        mock_collection.find.assert_called_once_with(
+            {'cuisine_type': 'Italiana', 'rating': {'$gte': 4.0}},
+            {'name': 1, '_id': 0},
+            batch_size=500
+        )
+        mock_cursor.close.assert_called_once()
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_iter_restaurants_without_connection(self, mock_connect):
+        """Test streaming vacío si no hay conexión"""
+        mock_connect.return_value = None
+        
+        assert list(DatabaseManager().iter_restaurants_by_postal_code('12345')) == []
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_iter_restaurants_propagates_cursor_errors(self, mock_connect):
+        """Test un fallo a mitad del cursor no se confunde con el final de los resultados"""
+        from pymongo.errors import AutoReconnect
+        mock_collection = MagicMock()
+        mock_connect.return_value = mock_collection
+        
+        def failing_cursor():
+            yield {'name': 'A'}
+            raise AutoReconnect('connection lost')
+        
+        mock_cursor = MagicMock()
+        mock_cursor.__iter__.return_value = failing_cursor()
+        mock_collection.find.return_value = mock_cursor
+        
+        stream = DatabaseManager().iter_restaurants_by_postal_code('12345')
+        assert next(stream) == {'name': 'A'}
+        with pytest.raises(AutoReconnect):
+            next(stream)
+        mock_collection.find.assert_called_once_with({'$or': [{'postal_codes': '12345'}, {'postal_code': '12345'}]},
+                                                      None, batch_size=ANY)
+        mock_cursor.close.assert_called_once()
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_save_to_mongodb_adds_geojson_point(self, mock_connect):
+        """Test se guarda un punto GeoJSON [lng, lat] junto a las coordenadas"""
+        mock_collection = MagicMock()
+        mock_connect.return_value = mock_collection
+        mock_collection.bulk_write.return_value.bulk_api_result = {'nUpserted': 1}
+        
+        DatabaseManager().save_to_mongodb([{
+            'name': 'R', 'address': 'A', 'postal_code': '28001', 'place_id': 'p1',
+            'latitude': 40.42, 'longitude': -3.70
+        }])
+        
+        update = mock_collection.bulk_write.call_args[0][0][0]._doc
+        assert update['$set']['location'] == {'type': 'Point', 'coordinates': [-3.70, 40.42]}
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_save_to_mongodb_accepts_restaurant_objects(self, mock_connect):
+        """Test los objetos Restaurant se convierten a documento sin pasar antes por to_dict()"""
+        mock_collection = MagicMock()
+        mock_connect.return_value = mock_collection
+        restaurant = Restaurant(name="R", address="A", postal_code="28001", place_id="p1",
+                                business_hours=['Lunes'], latitude=40.4, longitude=-3.7)
+        
+        DatabaseManager().save_to_mongodb([restaurant])
+        
+        operation = mock_collection.bulk_write.call_args[0][0][0]
+        assert operation._filter == {'place_id': 'p1'}
+        assert operation._doc['$set']['business_hours'] == {'day_0': 'Lunes'}
+        assert operation._doc['$set']['location'] == {'type': 'Point', 'coordinates': [-3.7, 40.4]}
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_find_near_uses_geonear(self, mock_connect):
+        """Test búsqueda por cercanía en el servidor con $geoNear"""
+        mock_collection = MagicMock()
+        mock_connect.return_value = mock_collection
+        mock_collection.aggregate.return_value = iter([{'name': 'Cerca', 'distance_m': 120.5}])
+        
+        result = DatabaseManager().find_near(40.42, -3.70, radius=500, limit=10)
+        
+        assert result == [{'name': 'Cerca', 'distance_m': 120.5}]
+        pipeline = mock_collection.aggregate.call_args[0][0]
+        assert pipeline[0]['$geoNear']['near'] == {'type': 'Point', 'coordinates': [-3.70, 40.42]}
+        assert pipeline[0]['$geoNear']['maxDistance'] == 500
+        assert pipeline[1] == {'$limit': 10}
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_find_in_bounding_box(self, mock_connect):
+        """Test búsqueda por rectángulo con $geoWithin"""
+        mock_collection = MagicMock()
+        mock_connect.return_value = mock_collection
+        mock_collection.find.return_value.limit.return_value = [{'name': 'Dentro'}]
+        
+        result = DatabaseManager().find_in_bounding_box(40.0, -4.0, 41.0, -3.0)
+        
+        assert result == [{'name': 'Dentro'}]
+        polygon = mock_collection.find.call_args[0][0]['location']['$geoWithin']['$geometry']
+        assert polygon['coordinates'][0][0] == polygon['coordinates'][0][-1] == [-4.0, 40.0]
+    
+    def test_build_query_ranges(self):
+        """Test filtros de rango de rating y fecha"""
+        start, end = datetime(2024, 1, 1), datetime(2024, 2, 1)
+        
+        query = DatabaseManager().build_query(
+            postal_code='28001', min_rating=3.5, max_rating=4.5, scraped_after=start, scraped_before=end
+        )
+        
+        assert query == {
+            '$or': [{'postal_codes': '28001'}, {'postal_code': '28001'}],
+            'rating': {'$gte': 3.5, '$lte': 4.5},
+            'scraped_at': {'$gte': start, '$lt': end}
+        }
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_get_statistics_report_from_aggregation(self, mock_connect):
+        """Test reporte histórico calculado con un pipeline $facet en el servidor"""
+        mock_collection = MagicMock()
+        mock_connect.return_value = mock_collection
+        mock_collection.aggregate.return_value = iter([{
+            'summary': [{'_id': None, 'total': 3, 'with_phone': 2, 'with_website': 1}],
+            'per_postal_code': [{'_id': '28002', 'count': 1}, {'_id': '28001', 'count': 2}],
+            'per_cuisine': [{'_id': 'China', 'count': 1}, {'_id': 'Italiana', 'count': 2}],
+            'ratings': [{'_id': 40, 'count': 1, 'sum': 4.0, 'min': 4.0, 'max': 4.0},
+                        {'_id': 45, 'count': 1, 'sum': 4.5, 'min': 4.5, 'max': 4.5}],
+        }])
+        
+        report = DatabaseManager().get_statistics_report(min_rating=3.0)
+        
+        pipeline = mock_collection.aggregate.call_args[0][0]
+        assert pipeline[0] == {'$match': {'rating': {'$gte': 3.0}}}
+        assert '$facet' in pipeline[-1]
+        assert report['resumen_general']['total_restaurantes'] == 3
+        assert report['resumen_general']['codigos_postales_analizados'] == ['28001', '28002']
+        assert report['resumen_general']['restaurantes_por_codigo_postal'] == {'28001': 2, '28002': 1}
+        assert report['resumen_general']['restaurantes_con_telefono'] == 2
+        assert list(report['tipos_cocina']) == ['Italiana', 'China']
+        assert report['estadisticas_rating'] == {
+            'promedio': 4.25, 'mediana': 4.25, 'maximo': 4.5, 'minimo': 4.0, 'total_con_rating': 2
+        }
+    
+    @patch('models.database.DatabaseManager.connect_mongodb')
+    def test_get_statistics_report_without_connection(self, mock_connect):
+        """Test reporte histórico sin conexión"""
+        mock_connect.return_value = None
+        
+        assert DatabaseManager().get_statistics_report() is None
+
+class TestGeocodeCache:
+    """Tests para la cache persistente de geocoding"""
+    
+    def test_set_and_get(self, tmp_path):
+        """Test guardar y recuperar coordenadas"""
+        cache = GeocodeCache(str(tmp_path / "geocode.sqlite3"), ttl=3600, max_entries=10)
+        cache.set("28001", {'lat': 40.42, 'lng': -3.68}, region="es")
+        
+        assert cache.get("28001", region="es") == {'lat': 40.42, 'lng': -3.68}
+        assert cache.get("28001", region="fr") is None
+        assert cache.get("28002", region="es") is None
+    
+    def test_key_normalization(self, tmp_path):
+        """Test códigos postales equivalentes comparten entrada"""
+        cache = GeocodeCache(str(tmp_path / "geocode.sqlite3"), ttl=3600, max_entries=10)
+        cache.set("sw1a  1aa", {'lat': 51.5, 'lng': -0.14})
+        
+        assert cache.get(" SW1A 1AA ") == {'lat': 51.5, 'lng': -0.14}
+    
+    def test_persistence_between_instances(self, tmp_path):
+        """Test la cache sobrevive entre ejecuciones"""
+        path = str(tmp_path / "geocode.sqlite3")
+        GeocodeCache(path, ttl=3600, max_entries=10).set("10001", {'lat': 40.75, 'lng': -73.99})
+        
+        assert GeocodeCache(path, ttl=3600, max_entries=10).get("10001") == {'lat': 40.75, 'lng': -73.99}
+    
+    def test_expired_entries(self, tmp_path):
+        """Test entradas caducadas no se devuelven"""
+        cache = GeocodeCache(str(tmp_path / "geocode.sqlite3"), ttl=-1, max_entries=10)
+        cache.set("10001", {'lat': 40.75, 'lng': -73.99})
+        
+        assert cache.get("10001") is None
+        assert cache.count() == 0
+    
+    def test_lru_eviction(self, tmp_path):
+        """Test se expulsa la entrada menos usada al superar el tamaño máximo"""
+        cache = GeocodeCache(str(tmp_path / "geocode.sqlite3"), ttl=3600, max_entries=2)
+        cache.set("A", {'lat': 1, 'lng': 1})
+        cache.set("B", {'lat': 2, 'lng': 2})
+        cache.get("A")  # A pasa a ser la más reciente
+        cache.set("C", {'lat': 3, 'lng': 3})
+        
+        assert cache.count() == 2
+        assert cache.get("B") is None
+        assert cache.get("A") is not None
+
+class TestRunJournal:
+    """Tests para el diario de reanudación"""
+    
+    def _restaurant(self, place_id, postal_code="28001", **kwargs):
+        return Restaurant(name=place_id, address="Calle 1", postal_code=postal_code, place_id=place_id,
+                          postal_codes=[postal_code], business_hours={'day_0': '9-18'}, rating=4.5, **kwargs)
+    
+    def test_save_page_keeps_token_and_restaurants(self, tmp_path):
+        """Test cada página guarda restaurantes y token, y sobrevive a reabrir el diario"""
+        path = str(tmp_path / "journal.sqlite3")
+        journal = RunJournal(path)
+        assert journal.start("28001") == {'status': 'in_progress', 'next_page_token': None, 'pages': 0,
+                                         'coverage': None}
+        coverage = {'center': {'lat': 40.4, 'lng': -3.7}, 'radius': 5000, 'tiles': [[0, 0, 5000, 0]], 'found': 20}
+        journal.save_page("28001", "token-2", [self._restaurant("p1"), self._restaurant("p2")], coverage=coverage)
+        journal.close()
+        
+        journal = RunJournal(path)
+        assert journal.start("28001") == {'status': 'in_progress', 'next_page_token': 'token-2', 'pages': 1,
+                                          'coverage': coverage}
+        restored = journal.restaurants("28001")
+        assert [r.place_id for r in restored] == ['p1', 'p2']
+        assert restored[0] == self._restaurant("p1", scraped_at=restored[0].scraped_at)
+        assert restored[0].business_hours == ('9-18',)
+    
+    def test_overlapping_place_records_postal_code(self, tmp_path):
+        """Test un lugar ya guardado anota el nuevo código postal sin duplicarse"""
+        journal = RunJournal(str(tmp_path / "journal.sqlite3"))
+        journal.start("28001")
+        journal.save_page("28001", None, [self._restaurant("p1")], ['p1'])
+        journal.start("28002")
+        journal.save_page("28002", None, [self._restaurant("p2", "28002")], ['p1', 'p2'])
+        
+        assert dict(journal.seen_places()) == {'p1': ['28001', '28002'], 'p2': ['28002']}
+        assert [r.place_id for r in journal.restaurants("28002")] == ['p2']
+    
+    def test_progress_and_failed_retry(self, tmp_path):
+        """Test resumen de progreso y reintento de códigos fallidos"""
+        journal = RunJournal(str(tmp_path / "journal.sqlite3"))
+        journal.start("28001")
+        journal.save_page("28001", None, [self._restaurant("p1")])
+        journal.complete("28001")
+        journal.start("28002")
+        journal.save_page("28002", "token-2", [])
+        journal.start("28003")
+        journal.fail("28003", "timeout")
+        
+        assert journal.progress() == {'done': 1, 'in_progress': 1, 'failed': 1, 'failed_postal_codes': ['28003'],
+                                      'pending_page_tokens': 1, 'restaurants': 1}
+        assert journal.completed_postal_codes() == {'28001'}
+        assert journal.start("28003")['status'] == 'in_progress'
+        assert journal.start("28001")['status'] == 'done'
+
+class TestJobQueue:
+    """Tests para la cola de trabajos distribuida (sobre una colección en memoria)"""
+    
+    @pytest.fixture
+    def clock(self):
+        now = [1000.0]
+        tick = lambda: now[0]
+        tick.advance = lambda seconds: now.__setitem__(0, now[0] + seconds)
+        return tick
+    
+    def test_enqueue_is_idempotent_and_leases_in_order(self, jobs_collection, clock):
+        """Test encolar dos veces no duplica y cada trabajo se entrega a un solo worker"""
+        queue = JobQueue(jobs_collection, lease_seconds=60, clock=clock)
+        assert queue.enqueue(["28001", "28002"]) == 2
+        clock.advance(1)
+        assert queue.enqueue(["28002", "28003"]) == 1
+        
+        assert [queue.lease("w1"), queue.lease("w2"), queue.lease("w1")] == ["28001", "28002", "28003"]
+        assert queue.lease("w2") is None
+        assert queue.progress()['leased'] == 3
+    
+    def test_expired_lease_is_taken_over(self, jobs_collection, clock):
+        """Test si un worker deja de enviar heartbeats otro retoma el trabajo y el primero pierde el lease"""
+        queue = JobQueue(jobs_collection, lease_seconds=60, clock=clock)
+        queue.enqueue(["28001"])
+        assert queue.lease("w1") == "28001"
+        
+        clock.advance(30)
+        assert queue.heartbeat("28001", "w1")
+        clock.advance(61)
+        assert queue.progress()['expired_leases'] == 1
+        assert queue.lease("w2") == "28001"
+        
+        assert not queue.heartbeat("28001", "w1")
+        assert not queue.complete("28001", "w1", 10)
+        assert queue.complete("28001", "w2", 12)
+        assert queue.progress() == {'pending': 0, 'leased': 0, 'done': 1, 'failed': 0,
+                                    'restaurants': 12, 'expired_leases': 0}
+    
+    def test_failed_jobs_are_retried_up_to_max_attempts(self, jobs_collection, clock):
+        """Test un trabajo fallido vuelve a la cola hasta agotar los intentos"""
+        queue = JobQueue(jobs_collection, lease_seconds=60, max_attempts=2, clock=clock)
+        queue.enqueue(["28001", "28002"])
+        
+        assert queue.lease("w1") == "28001"
+        assert queue.fail("28001", "w1", "timeout")
+        assert queue.lease("w1") == "28001"
+        assert queue.fail("28001", "w1", "timeout")
+        
+        # El worker de 28002 muere en su último intento
+        assert queue.lease("w2") == "28002"
+        clock.advance(61)
+        assert queue.lease("w3") == "28002"
+        clock.advance(61)
+        assert queue.lease("w3") is None
+        
+        progress = queue.progress()
+        assert progress['failed'] == 2
+        assert jobs_collection.docs["28001"]['error'] == "timeout"
+        assert jobs_collection.docs["28002"]['error'] == "lease caducado"
+    
+    def test_concurrent_leases_are_exclusive(self, jobs_collection):
+        """Test varios workers a la vez nunca reciben el mismo trabajo"""
+        from concurrent.futures import ThreadPoolExecutor
+        queue = JobQueue(jobs_collection, lease_seconds=60)
+        queue.enqueue([str(code) for code in range(100)])
+        
+        def drain(worker_id):
+            leased = []
+            while (postal_code := queue.lease(worker_id)) is not None:
+                leased.append(postal_code)
+                queue.complete(postal_code, worker_id)
+            return leased
+        
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(drain, [f"w{i}" for i in range(8)]))
+        
+        leased = [code for result in results for code in result]
+        assert sorted(leased, key=int) == [str(code) for code in range(100)]
+        assert queue.progress()['done'] == 100
+
+class TestPlaceDetailsCache:
+    """Tests para la cache de Place Details"""
+    
+    FIELDS = ['name', 'formatted_address', 'formatted_phone_number', 'rating', 'type']
+    RESULT = {
+        'name': 'Pizza Place',
+        'formatted_address': 'Main St 1',
+        'formatted_phone_number': '+34 600 000 000',
+        'rating': 4.5,
+        'types': ['restaurant']
+    }
+    
+    def _cache(self, tmp_path, **ttls):
+        ttls = {group: ttls.get(group, 3600) for group in ('basic', 'contact', 'atmosphere')}
+        return PlaceDetailsCache(str(tmp_path / "details.sqlite3"), ttls, memory_size=100)
+    
+    def test_miss_then_hit(self, tmp_path):
+        """Test primera consulta falla y la segunda acierta"""
+        cache = self._cache(tmp_path)
+        
+        cached, missing = cache.lookup('p1', self.FIELDS)
+        assert cached == {}
+        assert sorted(missing) == sorted(self.FIELDS)
+        
+        cache.store('p1', missing, self.RESULT)
+        cached, missing = cache.lookup('p1', self.FIELDS)
+        
+        assert missing == []
+        assert cached == self.RESULT
+        assert cache.stats() == {'hits': 1, 'partial_hits': 0, 'misses': 1}
+    
+    def test_expired_group_is_partial_hit(self, tmp_path):
+        """Test un grupo caducado solo obliga a pedir sus campos"""
+        cache = self._cache(tmp_path, atmosphere=-1)
+        cache.store('p1', self.FIELDS, self.RESULT)
+        
+        cached, missing = cache.lookup('p1', self.FIELDS)
+        
+        assert missing == ['rating']
+        assert 'rating' not in cached
+        assert cached['name'] == 'Pizza Place'
+        assert cache.stats()['partial_hits'] == 1
+    
+    def test_persistent_store_behind_memory(self, tmp_path):
+        """Test una nueva instancia lee lo guardado por otra"""
+        self._cache(tmp_path).store('p1', self.FIELDS, self.RESULT)
+        
+        cached, missing = self._cache(tmp_path).lookup('p1', self.FIELDS)
+        
+        assert missing == []
+        assert cached['types'] == ['restaurant']
+    
+    def test_group_with_fewer_fields_is_a_miss(self, tmp_path):
+        """Test un grupo guardado con solo parte de los campos no sirve para pedir el resto"""
+        contact = ['formatted_phone_number', 'website', 'opening_hours']
+        self._cache(tmp_path).store('p1', ['formatted_phone_number'], self.RESULT)
+        
+        for cache in (self._cache(tmp_path), self._cache(tmp_path)):
+            cache.lookup('p1', ['formatted_phone_number'])
+            cached, missing = cache.lookup('p1', contact)
+            assert cached == {}
+            assert missing == contact
+    
+    def test_rows_without_fields_are_misses(self, tmp_path):
+        """Test las filas de una cache antigua, sin la lista de campos, se vuelven a pedir"""
+        import sqlite3
+        import time
+        path = str(tmp_path / "details.sqlite3")
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE place_details (place_id TEXT NOT NULL, field_group TEXT NOT NULL, "
+                         "payload TEXT NOT NULL, fetched_at REAL NOT NULL, PRIMARY KEY (place_id, field_group))")
+            conn.execute("INSERT INTO place_details VALUES ('p1', 'basic', '{\"name\": \"Old\"}', ?)",
+                         (time.time(),))
+        conn.close()
+        
+        cache = PlaceDetailsCache(path, {}, memory_size=10)
+        
+        assert cache.lookup('p1', ['name']) == ({}, ['name'])
+        cache.store('p1', ['name'], {'name': 'New'})
+        assert cache.lookup('p1', ['name']) == ({'name': 'New'}, [])
+    
+    def test_memory_lru_is_bounded(self, tmp_path):
+        """Test el LRU en memoria no crece por encima de su tamaño"""
+        cache = PlaceDetailsCache(str(tmp_path / "details.sqlite3"), {}, memory_size=2)
+        for place_id in ('p1', 'p2', 'p3'):
+            cache.store(place_id, ['name'], {'name': place_id})
+        
+        assert len(cache._memory) == 2
+        assert cache.lookup('p1', ['name']) == ({'name': 'p1'}, [])
+
+class TestRestaurantStats:
+    """Tests para el agregador incremental de estadísticas"""
+    
+    def _restaurants(self, count, seed=7):
+        import random
+        rng = random.Random(seed)
+        return [
+            Restaurant(
+                name=f"R{i}", address="A", postal_code=rng.choice(['28001', '28002', '28003']),
+                rating=round(rng.uniform(1, 5), 1) if rng.random() < 0.8 else None,
+                cuisine_type=rng.choice(['Italiana', 'China', None]),
+                phone="+34" if rng.random() < 0.5 else None,
+                website="https://x" if rng.random() < 0.3 else None
+            )
+            for i in range(count)
+        ]
+    
+    def test_matches_pandas(self):
+        """Test mismos resultados que el cálculo con pandas"""
+        import pandas as pd
+        restaurants = self._restaurants(501)
+        df = pd.DataFrame([r.to_dict() for r in restaurants])
+        ratings = df['rating'].dropna()
+        
+        stats = RestaurantStats().add_many(restaurants)
+        
+        assert stats.total == 501
+        assert dict(stats.per_postal_code) == df.groupby('postal_code').size().to_dict()
+        assert dict(stats.per_cuisine) == df['cuisine_type'].value_counts().to_dict()
+        assert stats.with_phone == df['phone'].notna().sum()
+        assert stats.with_website == df['website'].notna().sum()
+        assert stats.rating_mean == pytest.approx(ratings.mean())
+        assert stats.rating_median == pytest.approx(ratings.median())
+        assert stats.rating_min == ratings.min()
+        assert stats.rating_max == ratings.max()
+    
+    def test_merge_partial_aggregates(self):
+        """Test combinar agregados de varios workers equivale a uno solo"""
+        restaurants = self._restaurants(300)
+        
+        merged = RestaurantStats()
+        for start in range(0, 300, 100):
+            merged.merge(RestaurantStats().add_many(restaurants[start:start + 100]))
+        single = RestaurantStats().add_many(restaurants)
+        
+        assert merged.total == single.total
+        assert merged.per_postal_code == single.per_postal_code
+        assert merged.per_cuisine == single.per_cuisine
+        assert merged.rating_histogram == single.rating_histogram
+        assert merged.rating_mean == pytest.approx(single.rating_mean)
+        assert merged.rating_median == single.rating_median
+        assert (merged.rating_min, merged.rating_max) == (single.rating_min, single.rating_max)
+    
+    def test_accepts_dicts(self):
+        """Test acepta diccionarios además de objetos Restaurant"""
+        stats = RestaurantStats().add_many([{'postal_code': '1', 'rating': 4.0}, {'postal_code': '1', 'rating': 3.0}])
+        
+        assert stats.per_postal_code['1'] == 2
+        assert stats.rating_median == 3.5
+    
+    def test_without_ratings(self):
+        """Test sin ratings no hay división por cero"""
+        stats = RestaurantStats().add_many([Restaurant(name="R", address="A", postal_code="1")])
+        report = stats.to_report(['1'])
+        
+        assert stats.rating_mean is None
+        assert report['resumen_general']['rating_promedio'] == 0
+        assert report['estadisticas_rating']['mediana'] == 0
+        assert report['estadisticas_rating']['total_con_rating'] == 0
+    def test_add_batch_matches_add_many(self):
+        """Test el agregado vectorizado de un lote coincide con el de fila a fila"""
+        restaurants = self._restaurants(400)
+        
+        vectorized = RestaurantStats().add_batch(RestaurantBatch.from_restaurants(restaurants))
+        row_by_row = RestaurantStats().add_many(restaurants)
+        
+        assert vectorized.total == row_by_row.total
+        assert vectorized.per_postal_code == row_by_row.per_postal_code
+        assert vectorized.per_cuisine == row_by_row.per_cuisine
+        assert (vectorized.with_phone, vectorized.with_website) == (row_by_row.with_phone, row_by_row.with_website)
+        assert vectorized.rating_histogram == row_by_row.rating_histogram
+        assert vectorized.rating_mean == pytest.approx(row_by_row.rating_mean)
+        assert (vectorized.rating_min, vectorized.rating_max) == (row_by_row.rating_min, row_by_row.rating_max)
+
+class TestRestaurantBatch:
+    """Tests para el contenedor columnar de restaurantes"""
+    
+    def _restaurants(self):
+        return [
+            Restaurant(name="Café Ñandú", address="Calle 1", postal_code="28001", phone="+34 600",
+                       rating=4.5, review_count=120, cuisine_type="Café", business_hours=['Lunes: 9–22'],
+                       latitude=40.41, longitude=-3.70, place_id="p1", postal_codes=['28001', '28002'],
+                       scraped_at=datetime(2024, 5, 1, 12, 0, 0, 123456)),
+            Restaurant(name="Sin datos", address="Calle 2", postal_code="28002",
+                       scraped_at=datetime(2024, 5, 2, 8, 30)),
+            Restaurant(name="Otro café", address="Calle 3", postal_code="28001", rating=3.0, review_count=0,
+                       cuisine_type="Café", business_hours=['Lunes: 9–22'], website="https://cafe.es",
+                       scraped_at=datetime(2024, 5, 3)),
+        ]
+    
+    def test_iter_dicts_round_trip(self):
+        """Test las filas reconstruidas coinciden con Restaurant.to_dict()"""
+        restaurants = self._restaurants()
+        batch = RestaurantBatch.from_restaurants(restaurants)
+        
+        assert len(batch) == 3
+        assert list(batch.iter_dicts(chunk_size=2)) == [r.to_dict() for r in restaurants]
+    
+    def test_columns_are_numpy_arrays(self):
+        """Test numéricos como arrays NumPy y strings repetidos como categorías"""
+        batch = RestaurantBatch.from_restaurants(self._restaurants())
+        
+        rating = batch.numeric('rating')
+        assert rating.dtype == np.float64
+        assert np.isnan(rating[1]) and rating[0] == 4.5
+        assert batch.numeric('review_count').tolist()[::2] == [120.0, 0.0]
+        assert str(batch.scraped_at().dtype) == 'datetime64[us]'
+        
+        codes, categories = batch.categorical('cuisine_type')
+        assert categories == ['Café']
+        assert codes.tolist() == [0, -1, 0]
+        assert batch.present('phone').tolist() == [True, False, False]
+    
+    def test_concat_remaps_categories(self):
+        """Test unir lotes con categorías en distinto orden conserva los valores"""
+        restaurants = self._restaurants()
+        first = RestaurantBatch.from_restaurants(restaurants[1:])
+        second = RestaurantBatch.from_restaurants(restaurants[:1])
+        
+        merged = RestaurantBatch.concat([first, second])
+        
+        assert list(merged.iter_dicts()) == [r.to_dict() for r in restaurants[1:] + restaurants[:1]]
+    
+    def test_to_frame_matches_dataframe_from_dicts(self):
+        """Test el DataFrame columnar tiene los mismos valores que el construido con diccionarios"""
+        import pandas as pd
+        restaurants = self._restaurants()
+        
+        df = RestaurantBatch.from_restaurants(restaurants).to_frame()
+        expected = pd.DataFrame([r.to_dict() for r in restaurants])
+        
+        assert list(df.columns) == list(Restaurant.FIELDS)
+        assert df['name'].tolist() == expected['name'].tolist()
+        assert df['business_hours'].tolist() == expected['business_hours'].tolist()
+        assert df['postal_codes'].tolist() == expected['postal_codes'].tolist()
+        assert df['review_count'].tolist() == [120, pd.NA, 0]
+        assert (df['scraped_at'] == expected['scraped_at']).all()
+        pd.testing.assert_series_equal(df['rating'], expected['rating'])
+    
+    def test_to_arrow(self):
+        """Test la tabla Arrow se construye desde los buffers del lote"""
+        pytest.importorskip('pyarrow')
+        batch = RestaurantBatch.from_restaurants(self._restaurants())
+        
+        table = batch.to_arrow()
+        
+        assert table.column('name').to_pylist() == ["Café Ñandú", "Sin datos", "Otro café"]
+        assert table.column('phone').to_pylist() == ["+34 600", None, None]
+        assert table.column('business_hours').to_pylist() == [['Lunes: 9–22'], None, ['Lunes: 9–22']]
+        assert table.column('review_count').to_pylist() == [120, None, 0]
+        assert table.column('postal_code').to_pylist() == ['28001', '28002', '28001']
\ No newline at end of file
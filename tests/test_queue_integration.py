@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import time
+import pytest
+import pymongo
+from unittest.mock import MagicMock
+from controllers.scraper_controller import SeenPlaces
+from controllers.worker_controller import QueueWorker
+from models.database import DatabaseManager
+from models.job_queue import JobQueue
+from models.restaurant import Restaurant
+
+MONGODB_TEST_URI = os.getenv('MONGODB_TEST_URI', 'mongodb://localhost:27017')
+TEST_DATABASE = 'restaurantes_queue_test_db'
+
+class FakeScraper:
+    """Scraper sin API: dos restaurantes por código postal"""
+    
+    def __init__(self):
+        self.seen_places = SeenPlaces()
+    
+    def search_restaurants_by_postal_code(self, postal_code, raise_errors=False):
+        return [Restaurant(name=f"R {i}", address="A", postal_code=postal_code, place_id=f"{postal_code}-{i}",
+                           postal_codes=[postal_code])
+                for i in range(2)]
+
+def _db_manager() -> DatabaseManager:
+    manager = DatabaseManager()
+    manager.settings.MONGODB_URI = MONGODB_TEST_URI
+    manager.settings.MONGODB_DATABASE = TEST_DATABASE
+    manager.settings.JOB_LEASE_SECONDS = 1
+    return manager
+
+def _run_worker(worker_id: str):
+    manager = _db_manager()
+    QueueWorker(manager.get_job_queue(), FakeScraper(), manager, MagicMock(), worker_id=worker_id).run()
+    manager.close_connections()
+
+def _crash_after_lease():
+    # Worker que muere con un trabajo tomado, sin completarlo ni liberarlo
+    _db_manager().get_job_queue().lease("crashed")
+    os._exit(1)
+
+@pytest.fixture
+def mongodb():
+    client = pymongo.MongoClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except pymongo.errors.PyMongoError:
+        pytest.skip("MongoDB local no disponible")
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip("Se necesita fork para lanzar los workers")
+    
+    client.drop_database(TEST_DATABASE)
+    yield client[TEST_DATABASE]
+    client.drop_database(TEST_DATABASE)
+    client.close()
+
+def test_fake_scraper_runs_in_a_worker(jobs_collection):
+    """Test el scraper falso de los procesos sirve a QueueWorker (sin MongoDB, no se salta)"""
+    queue = JobQueue(jobs_collection)
+    queue.enqueue(["28001", "28002"])
+    db_manager = MagicMock()
+    db_manager.save_to_mongodb.side_effect = lambda docs: {'inserted': len(list(docs))}
+    
+    summary = QueueWorker(queue, FakeScraper(), db_manager, MagicMock(), worker_id="w1").run()
+    
+    assert summary['completed'] == 2
+    assert summary['mongodb']['inserted'] == 4
+
+def test_several_worker_processes_share_the_queue(mongodb):
+    """Test varios procesos vacían la cola sin repetir trabajos y un worker caído se recupera"""
+    postal_codes = [str(code) for code in range(28001, 28041)]
+    manager = _db_manager()
+    manager.get_job_queue().enqueue(postal_codes)
+    manager.close_connections()  # los procesos hijos abren su propia conexión
+    
+    context = multiprocessing.get_context('fork')
+    crashed = context.Process(target=_crash_after_lease)
+    crashed.start()
+    crashed.join()
+    
+    workers = [context.Process(target=_run_worker, args=(f"w{i}",)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+    assert [worker.exitcode for worker in workers] == [0] * len(workers)
+    
+    # El trabajo del worker caído se retoma cuando caduca su lease
+    time.sleep(1.1)
+    _run_worker("recovery")
+    
+    manager = _db_manager()
+    progress = manager.get_job_queue().progress()
+    assert progress['done'] == len(postal_codes)
+    assert progress['leased'] == progress['pending'] == 0
+    assert mongodb[manager.settings.MONGODB_COLLECTION].count_documents({}) == 2 * len(postal_codes)
+    assert mongodb[manager.settings.MONGODB_JOBS_COLLECTION].count_documents({'attempts': {'$gt': 1}}) == 1
+    manager.close_connections()
@@ -1,6 +1,9 @@
+import io
+import json
 import pytest
 from unittest.mock import patch
 from views.console_view import ConsoleView
+from views.json_progress_view import JsonProgressView
 
 class TestConsoleView:
     """Tests para ConsoleView"""
@@ -39,6 +42,14 @@ class TestConsoleView:
         
         mock_print.assert_called_with("✅ Test success message")
     
+    @patch('builtins.print')
+    def test_show_postal_code_progress(self, mock_print):
+        """Test progreso por código postal"""
+        view = ConsoleView()
+        view.show_postal_code_progress(2, 5, "28001", 60)
+        
+        mock_print.assert_called_with("✅ [2/5] Encontrados 60 restaurantes en 28001")
+    
     @patch('builtins.print')
     def test_show_error(self, mock_print):
         """Test mensaje de error"""
@@ -92,4 +103,26 @@ class TestConsoleView:
         
         # Verificar que se eliminaron espacios
         expected = ['28001', '08001', '41001']
-        assert result == expected
\ No newline at end of file
+        assert result == expected
+
+
+class TestJsonProgressView:
+    """Tests para la vista de progreso en líneas JSON"""
+    
+    def test_events_are_json_lines(self):
+        """Test cada evento es una línea JSON con tipo y marca de tiempo"""
+        stream = io.StringIO()
+        view = JsonProgressView(stream)
+        
+        view.show_postal_code_progress(3, None, '28001', 12, restaurants_per_s=4.5)
+        view.show_error("Fallo", postal_code='28002')
+        
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert events[0]['event'] == 'postal_code'
+        assert events[0]['postal_code'] == '28001'
+        assert events[0]['restaurants'] == 12
+        assert events[0]['restaurants_per_s'] == 4.5
+        assert 'ts' in events[0]
+        assert events[1]['event'] == 'error'
+        assert events[1]['message'] == "Fallo"
+        assert events[1]['postal_code'] == '28002'
@@ -12,6 +12,9 @@ class ConsoleView:
     def show_success(self, message: str):
         print(f"✅ {message}")
     
+    def show_postal_code_progress(self, completed: int, total: int, postal_code: str, count: int):
+        print(f"✅ [{completed}/{total}] Encontrados {count} restaurantes en {postal_code}")
+    
     def show_error(self, message: str):
         print(f"❌ ERROR: {message}")
     
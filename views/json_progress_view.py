@@ -0,0 +1,35 @@
+import json
+import sys
+from datetime import datetime
+from typing import Any, Optional, TextIO
+
+class JsonProgressView:
+    """
+    Vista para ejecuciones no interactivas (cron, contenedores)
+    Cada evento es una línea JSON con 'event' y 'ts', fácil de filtrar con jq o de ingerir en logs
+    """
+    
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream or sys.stdout
+    
+    def _emit(self, event: str, **fields: Any):
+        record = {'event': event, 'ts': datetime.now().isoformat(timespec='seconds'), **fields}
+        self.stream.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        self.stream.flush()
+    
+    def show_progress(self, message: str):
+        self._emit('info', message=message)
+    
+    def show_success(self, message: str):
+        self._emit('success', message=message)
+    
+    def show_error(self, message: str, **fields: Any):
+        self._emit('error', message=message, **fields)
+    
+    def show_postal_code_progress(self, completed: int, total: Optional[int], postal_code: str, count: int,
+                                  **throughput: Any):
+        self._emit('postal_code', postal_code=postal_code, restaurants=count,
+                   completed=completed, total=total, **throughput)
+    
+    def show_statistics(self, stats: dict):
+        self._emit('summary', **stats)